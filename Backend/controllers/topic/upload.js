@@ -7,6 +7,29 @@ const path = require('path');
 const axios = require('axios');
 const FormData = require('form-data');
 
+// upload/ only queues the files and answers 202 with a jobId; the ingest workers
+// embed them afterwards, so wait on upload/<jobId>/ before reporting the result
+const INGEST_POLL_MS = 1000;
+const INGEST_TIMEOUT_MS = 1800000;
+
+const waitForIngest = async (jobId) => {
+    const deadline = Date.now() + INGEST_TIMEOUT_MS;
+    while (Date.now() < deadline) {
+        const { data } = await axios.get(`http://127.0.0.1:8000/upload/${jobId}/`);
+        if (data.status !== 'queued' && data.status !== 'running') {
+            return data;
+        }
+        await new Promise((resolve) => setTimeout(resolve, INGEST_POLL_MS));
+    }
+    throw new Error(`Ingestion job ${jobId} did not finish within ${INGEST_TIMEOUT_MS / 1000}s`);
+};
+
+const ingestMessage = (ingest) => {
+    if (ingest.status === 'done') return 'Processed successfully';
+    if (ingest.status === 'partial') return 'Processed, but some files failed';
+    return 'Processing failed';
+};
+
 const uploadUrls = async (req, res) => {
     try {
         const urls = req.body.urls;
@@ -66,16 +89,17 @@ const uploadUrls = async (req, res) => {
             content: aggregatedTranscripts,
             topicId,
             userId
-        },{
-            timeout:1800000
         })
-        return res.status(StatusCodes.CREATED).json({
+        const ingest = await waitForIngest(response.data.jobId);
+        return res.status(ingest.status === 'failed' ? StatusCodes.BAD_GATEWAY : StatusCodes.CREATED).json({
             response: {
                 status: response.status,
                 data: response.data, // Only send serializable data
                 headers: response.headers
             },
-            message: `Processed...`,
+            jobId: response.data.jobId,
+            ingest,
+            message: ingestMessage(ingest),
             data: newResource,
             results
         });
@@ -133,6 +157,7 @@ const uploadPdfs = async (req, res) => {
         const apiResponse = await axios.post('http://127.0.0.1:8000/upload/', formData, {
             headers: formData.getHeaders()
         });
+        const ingest = await waitForIngest(apiResponse.data.jobId);
 
         const newResource = await topicModels.Resource.create({
             type: 'pdf',
@@ -142,8 +167,10 @@ const uploadPdfs = async (req, res) => {
             userId
         });
 
-        return res.status(StatusCodes.CREATED).json({
-            message: 'PDFs uploaded and processed successfully',
+        return res.status(ingest.status === 'failed' ? StatusCodes.BAD_GATEWAY : StatusCodes.CREATED).json({
+            message: `PDFs uploaded. ${ingestMessage(ingest)}`,
+            jobId: apiResponse.data.jobId,
+            ingest,
             newResource,
             apiResponse: {
                 status: apiResponse.status,
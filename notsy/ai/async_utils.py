@@ -0,0 +1,134 @@
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from . import utils, clients, embedding_cache, response_cache, chunking, rerank, metrics, scheduler
+import asyncio
+import logging
+import time
+
+# Async counterparts of the request-path helpers in utils.py, used by the ASGI views
+
+logger = logging.getLogger(__name__)
+
+# Blocking helpers run on the thread pool rather than the event loop. None of them needs
+# thread_sensitive, which would push every concurrent namespace query through one thread.
+_cache_lookup = sync_to_async(embedding_cache.lookup, thread_sensitive=False)
+_cache_store = sync_to_async(embedding_cache.store, thread_sensitive=False)
+_candidate_request = sync_to_async(utils.candidate_request, thread_sensitive=False)
+# BM25 reads the corpus SQLite file and may build it on first use
+_rerank = sync_to_async(rerank.rerank, thread_sensitive=False)
+
+
+def _orm(func):
+    # Pool threads keep their own database connection; drop it when it is stale or
+    # CONN_MAX_AGE is up, as the request cycle does for the main thread
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(run, thread_sensitive=False)
+
+
+# Chunk texts are read through the ORM
+_resolve_matches = _orm(utils.resolve_matches)
+
+
+@metrics.timed("get_embedding")
+async def aget_embedding(client, text, model=utils.EMBEDDING_MODEL):
+    text = text.replace("\n", " ")
+    cached = await _cache_lookup(model, text)
+    if cached is not None:
+        return cached
+    response = await scheduler.acall(model, scheduler.estimate(text, output=0), client.embeddings.create, input=[text], model=model)
+    metrics.record_usage("embedding", model, response.usage)
+    embedding = response.data[0].embedding
+    await _cache_store(model, text, embedding)
+    return embedding
+
+
+async def aembed_query(text):
+    data = chunking.truncate(text)
+    if not data:
+        raise ValueError("Empty query text.")
+    return await aget_embedding(clients.get_async_openai_client(), data)
+
+
+async def aquery_vector(vector, namespace, top_k, filter=None, text=None):
+    store, fetch_k, include_values = await _candidate_request(namespace, top_k)
+    with metrics.span("index.query", type(store).__name__):
+        answer = await store.aquery(
+            vector=vector,
+            top_k=fetch_k,
+            namespace=namespace,
+            filter=filter,
+            include_values=include_values
+        )
+    docs = await _resolve_matches(answer.get("matches", []), namespace)
+    with metrics.span("rerank"):
+        return await _rerank(text, docs, top_k, namespace)
+
+
+async def aquery(text, namespace, top_k, filter=None):
+    return await aquery_vector(await aembed_query(text), namespace, top_k, filter=filter, text=text)
+
+
+async def amoded_query(text, mode, user_id, topic_id):
+    return utils.rag_context(await amoded_docs(text, mode, user_id, topic_id))
+
+
+async def amoded_docs(text, mode, user_id, topic_id):
+    plan = utils.RAG_PLANS.get(mode)
+    if not plan:
+        return []
+    try:
+        vector = await aembed_query(text)
+        start = time.perf_counter()
+        tasks = [
+            asyncio.ensure_future(aquery_vector(
+                vector, namespace or user_id, top_k,
+                filter=utils.topic_filter(user_id, topic_id) if namespace is None else None, text=text
+            ))
+            for namespace, top_k in plan
+        ]
+        results = []
+        for (namespace, top_k), task in zip(plan, tasks):
+            remaining = max(0.0, utils.RAG_NAMESPACE_TIMEOUT - (time.perf_counter() - start))
+            try:
+                docs = await asyncio.wait_for(task, timeout=remaining)
+            except asyncio.TimeoutError:
+                logger.warning("RAG query on namespace %s exceeded %.1fs, skipping", namespace or user_id, utils.RAG_NAMESPACE_TIMEOUT)
+                continue
+            results.extend(docs)
+    except Exception as e:
+        raise Exception(f"Error in querying data from pinecone: {str(e)}")
+    return results
+
+
+async def aget_response(input, max_tokens=-1, temp=-1, model="gpt-4.1", input_tokens=None):
+    client = clients.get_async_openai_client()
+    req_data = utils.build_request(input, max_tokens=max_tokens, temp=temp, model=model)
+    try:
+        with metrics.span("get_response", model):
+            response = await scheduler.acall(model, scheduler.estimate(input, max_tokens, input_tokens), client.responses.create, **req_data)
+    except Exception as e:
+        raise Exception(f"Error in getting response from OpenAI: {str(e)}")
+    metrics.record_usage("respond", model, response.usage)
+    return response
+
+
+async def agenerate(context, text_format, model="gpt-4.1", cache=False, input_tokens=None):
+    # Structured generation with one of utils.NOTES_FORMAT, FLASHCARDS_FORMAT or QUIZ_FORMAT
+    name = text_format["format"]["name"]
+    async def compute():
+        client = clients.get_async_openai_client()
+        with metrics.span("generate", name):
+            response = await scheduler.acall(
+                model, scheduler.estimate(context, input_tokens=input_tokens), client.responses.create,
+                model=model, input=context, text=text_format,
+            )
+        metrics.record_usage(name, model, response.usage)
+        return utils.parse_json_output(response)
+    if not cache:
+        return await compute()
+    return await response_cache.acached_call({"model": model, "input": context, "text": text_format}, compute)
@@ -0,0 +1,276 @@
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django.utils.decorators import method_decorator
+from rest_framework import status
+from . import utils, async_utils, budget, clients, response_cache, attachments, semantic_cache, scheduler
+from . import graph as topic_graph
+from .views import (
+    MODE_INSTRUCTIONS, MODE_TEMPRATURES, MODE_MAX_OUTPUT_TOKENS,
+    NOTES_PROMPT, FLASHCARDS_PROMPT, QUIZ_PROMPT, STUDY_RAG_QUERY, STUDY_PACK,
+    conversation_error, flag, parse_top_k, assemble_context, attachment_sections, semantic_key, sse_event,
+)
+import asyncio
+import logging
+import json
+
+logger = logging.getLogger(__name__)
+
+# Async versions of the AI endpoints for the ASGI deployment (config/asgi.py).
+# Each request awaits OpenAI and Pinecone instead of holding a worker thread.
+
+
+def read_data(request):
+    if request.content_type == "application/json":
+        return json.loads(request.body or b"{}")
+    return request.POST
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class asyncAugmentedRespond(View):
+    async def post(self, request):
+        data = read_data(request)
+        messages = data.get('messages')
+        summary = data.get('summary')
+        user_query = data.get('user_query')
+        topic_id = data.get('topicId')
+        user_id = data.get('userId')
+        mode_id = data.get('modeId', "0")
+        error = conversation_error(messages, summary)
+        if error:
+            return JsonResponse({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+        if user_query is None:
+            return JsonResponse({"error": "No user query provided."}, status=status.HTTP_400_BAD_REQUEST)
+
+        messages = utils.clean_messages_for_gpt(messages)
+        instruction = {
+            "role": "developer",
+            "content": MODE_INSTRUCTIONS.get(mode_id, MODE_INSTRUCTIONS["0"])
+        }
+        metadata = {}
+        semantic = None
+        if semantic_cache.eligible(mode_id, messages, summary):
+            try:
+                semantic = (semantic_key(mode_id, instruction), await async_utils.aembed_query(user_query))
+                cached = await asyncio.to_thread(semantic_cache.lookup, *semantic)
+            except Exception as e:
+                logger.warning("Semantic cache lookup failed: %s", e)
+                semantic, cached = None, None
+            if cached is not None:
+                return JsonResponse({"message": cached, "metadata": metadata, "modeId": mode_id, "tokens": None, "cached": True}, status=status.HTTP_200_OK)
+
+        rag_results = []
+        try:
+            rag_results = await async_utils.amoded_docs(user_query, mode=mode_id, user_id=user_id, topic_id=topic_id)
+        except Exception as e:
+            logger.warning("RAG retrieval failed: %s", e)
+
+        video_content = []
+        pdf_content = []
+        if mode_id == "5":
+            video_content = data.get('video', [])
+            for pdf_file in request.FILES.getlist('pdf'):
+                try:
+                    pdf_content.append(await asyncio.to_thread(attachments.load_pdf, pdf_file))
+                except Exception as e:
+                    return JsonResponse({"error": f'Unable to process uploaded PDF: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        sections = []
+        if video_content or pdf_content:
+            sections = await asyncio.to_thread(attachment_sections, video_content, pdf_content, user_query)
+        context, tokens = await asyncio.to_thread(
+            assemble_context, summary, messages,
+            instruction=instruction,
+            rag=rag_results,
+            attachments=sections,
+            query={"role": "user", "content": user_query},
+        )
+
+        try:
+            response = await async_utils.aget_response(
+                context,
+                max_tokens=MODE_MAX_OUTPUT_TOKENS.get(mode_id, None),
+                temp=MODE_TEMPRATURES.get(mode_id, None),
+                input_tokens=tokens["used"],
+            )
+        except Exception as e:
+            return JsonResponse({"error": f"Failed to get LLM response. Error: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if semantic:
+            await asyncio.to_thread(semantic_cache.store, *semantic, response.output_text, response.usage)
+
+        return JsonResponse({
+            "message": response.output_text,
+            "metadata": metadata,
+            "modeId": mode_id,
+            "tokens": tokens,
+        }, status=status.HTTP_200_OK)
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class asyncQuery(View):
+    async def post(self, request):
+        data = read_data(request)
+        text = data.get('text')
+        namespace = data.get('namespace')
+        if text is None or namespace is None:
+            return JsonResponse({"error": "No text or namespace provided"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            top_k = parse_top_k(data)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            result = await async_utils.aquery(text, namespace, top_k)
+            return JsonResponse(result, safe=False, status=status.HTTP_200_OK)
+        except Exception as e:
+            return JsonResponse({"error": f'Python unable to process query,\nError {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class asyncStudyGenerator(View):
+    # Subclasses pick the prompt and output format for notes, flash cards or quiz
+    prompt = None
+    text_format = None
+
+    async def post(self, request):
+        data = read_data(request)
+        messages = data.get('messages')
+        summary = data.get('summary')
+        topic_id = data.get('topicId')
+        user_id = data.get('userId')
+
+        error = conversation_error(messages, summary)
+        if error:
+            return JsonResponse({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+
+        messages = utils.clean_messages_for_gpt(messages)
+        mini_rag_results = await async_utils.aquery(STUDY_RAG_QUERY, user_id, 5, filter=utils.topic_filter(user_id, topic_id))
+        context, tokens = await asyncio.to_thread(
+            assemble_context, summary, messages, rag=mini_rag_results, query={"role": "user", "content": self.prompt}
+        )
+
+        try:
+            result = await async_utils.agenerate(
+                context, self.text_format, cache=flag(data, 'cache'), input_tokens=tokens["used"]
+            )
+        except Exception as e:
+            return JsonResponse({"error": f'Unable to generate Notes, Error {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return JsonResponse({"message": result, "tokens": tokens}, status=status.HTTP_200_OK)
+
+
+class asyncMakeNotes(asyncStudyGenerator):
+    prompt = NOTES_PROMPT
+    text_format = utils.NOTES_FORMAT
+
+
+class asyncMakeFlashCards(asyncStudyGenerator):
+    prompt = FLASHCARDS_PROMPT
+    text_format = utils.FLASHCARDS_FORMAT
+
+
+class asyncMakeQuizCards(asyncStudyGenerator):
+    prompt = QUIZ_PROMPT
+    text_format = utils.QUIZ_FORMAT
+
+
+STUDY_PACK_FORMATS = {"notes": utils.NOTES_FORMAT, "cards": utils.FLASHCARDS_FORMAT, "quiz": utils.QUIZ_FORMAT}
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class asyncStudyPack(View):
+    # Async counterpart of studyPack: one context, the artifacts generated concurrently
+    async def post(self, request):
+        data = read_data(request)
+        messages = data.get('messages')
+        summary = data.get('summary')
+        topic_id = data.get('topicId')
+        user_id = data.get('userId')
+        artifacts = data.get('artifacts') or list(STUDY_PACK)
+
+        error = conversation_error(messages, summary)
+        if error:
+            return JsonResponse({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+        unknown = [name for name in artifacts if name not in STUDY_PACK]
+        if unknown:
+            return JsonResponse({"error": f"Unknown artifacts: {', '.join(unknown)}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        messages = utils.clean_messages_for_gpt(messages)
+        try:
+            mini_rag_results = await async_utils.aquery(STUDY_RAG_QUERY, user_id, 5, filter=utils.topic_filter(user_id, topic_id))
+        except Exception as e:
+            logger.warning("RAG retrieval failed: %s", e)
+            mini_rag_results = []
+        context, tokens = await asyncio.to_thread(assemble_context, summary, messages, rag=mini_rag_results)
+        cache = flag(data, 'cache')
+
+        async def generate(name):
+            prompt, _ = STUDY_PACK[name]
+            prompt = {"role": "user", "content": prompt}
+            try:
+                result = await async_utils.agenerate(
+                    context + [prompt], STUDY_PACK_FORMATS[name], cache=cache,
+                    input_tokens=tokens["used"] + budget.message_tokens(prompt),
+                )
+                return name, {"message": result}
+            except Exception as e:
+                logger.warning("Study pack %s failed: %s", name, e)
+                return name, {"error": f'Unable to generate {name}, Error {str(e)}'}
+
+        tasks = [asyncio.ensure_future(generate(name)) for name in artifacts]
+
+        if not flag(data, 'stream', True):
+            pack = dict(await asyncio.gather(*tasks))
+            failed = [name for name, result in pack.items() if "error" in result]
+            code = status.HTTP_500_INTERNAL_SERVER_ERROR if len(failed) == len(pack) else status.HTTP_200_OK
+            return JsonResponse({"artifacts": pack, "failed": failed, "tokens": tokens}, status=code)
+
+        async def events():
+            failed = []
+            try:
+                for next_done in asyncio.as_completed(tasks):
+                    name, result = await next_done
+                    if "error" in result:
+                        failed.append(name)
+                        yield sse_event("error", {"artifact": name, **result})
+                    else:
+                        yield sse_event(name, result)
+                yield sse_event("done", {"failed": failed, "tokens": tokens})
+            finally:
+                # Client went away: stop paying for the remaining generations
+                for task in tasks:
+                    task.cancel()
+
+        response = StreamingHttpResponse(events(), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+class asyncGrapher(View):
+    async def post(self, request):
+        topics = read_data(request).get('topics')
+        if not topics:
+            return JsonResponse({"error": "No topics provided"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(topics) > topic_graph.GRAPH_SHARD_SIZE:
+            # Large graphs are built in parallel shards on the graph thread pool
+            try:
+                graph = await asyncio.to_thread(topic_graph.build_graph, topics)
+            except Exception as e:
+                return JsonResponse({"error": f'Failed to get response,\nError {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            return JsonResponse(graph, status=status.HTTP_200_OK)
+
+        request_data = utils.graph_request(topics)
+
+        async def compute():
+            with scheduler.prioritized("graph"):
+                response = await scheduler.acall(
+                    request_data["model"], scheduler.estimate(request_data["input"]),
+                    clients.get_async_openai_client().responses.create, **request_data,
+                )
+            return json.loads(response.output_text)
+
+        try:
+            graph = await response_cache.acached_call(request_data, compute)
+        except Exception as e:
+            return JsonResponse({"error": f'Failed to get response,\nError {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return JsonResponse(graph, status=status.HTTP_200_OK)
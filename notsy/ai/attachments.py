@@ -0,0 +1,227 @@
+from . import chunking, embedding_cache, pdf, rerank, utils
+import numpy as np
+import threading
+import hashlib
+import logging
+import json
+import os
+
+logger = logging.getLogger(__name__)
+
+# Chat-with-files (mode "5"): every attachment is parsed, split into short passages and
+# embedded once, keyed by the sha256 of its content. Each turn then puts only the
+# passages closest to the question into the prompt instead of the whole document.
+#
+# <ATTACHMENT_CACHE_DIR>/<digest[:2]>/<digest>.json   {"version", "tokens", "dimension", "passages"} or {"text"}
+# <ATTACHMENT_CACHE_DIR>/<digest[:2]>/<digest>.f32    float32 unit-normalised passage embeddings
+
+ATTACHMENT_CACHE_DIR = os.getenv('ATTACHMENT_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'attachment_cache'))
+# Least recently used entries are deleted once the directory grows past this
+ATTACHMENT_CACHE_BYTES = int(os.getenv('ATTACHMENT_CACHE_BYTES', 512 * 1024 * 1024))
+# Writes add to a running size and the directory is only walked once that passes the
+# limit, or every this many writes to pick up what other workers wrote
+ATTACHMENT_RESCAN_WRITES = int(os.getenv('ATTACHMENT_RESCAN_WRITES', 100))
+ATTACHMENT_MEMORY_ENTRIES = int(os.getenv('ATTACHMENT_MEMORY_ENTRIES', 16))
+ATTACHMENT_MEMORY_TTL = int(os.getenv('ATTACHMENT_MEMORY_TTL', 3600))
+ATTACHMENT_PASSAGE_TOKENS = int(os.getenv('ATTACHMENT_PASSAGE_TOKENS', 400))
+ATTACHMENT_PASSAGE_OVERLAP = int(os.getenv('ATTACHMENT_PASSAGE_OVERLAP', 40))
+ATTACHMENT_TOP_K = int(os.getenv('ATTACHMENT_TOP_K', 6))
+# Attachments up to this size are sent whole, retrieval would only cut context
+ATTACHMENT_INLINE_TOKENS = int(os.getenv('ATTACHMENT_INLINE_TOKENS', 2000))
+ATTACHMENT_CACHE_VERSION = 2
+PASSAGE_SEPARATOR = "\n...\n"
+READ_BLOCK = 1024 * 1024
+
+_loaded = embedding_cache.LRUCache(ATTACHMENT_MEMORY_ENTRIES, ATTACHMENT_MEMORY_TTL)
+# Striped so two requests for the same new file embed it once
+_locks = [threading.Lock() for _ in range(32)]
+_stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "evicted": 0, "write_errors": 0, "rescans": 0}
+# Bytes in ATTACHMENT_CACHE_DIR as of the last walk plus this process's writes since
+_size_lock = threading.Lock()
+_cache_bytes = None
+_writes = 0
+
+
+def file_digest(file):
+    # sha256 of an uploaded file or a path, leaves uploads rewound for the PDF reader
+    digest = hashlib.sha256()
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "rb") as f:
+            for block in iter(lambda: f.read(READ_BLOCK), b""):
+                digest.update(block)
+    elif hasattr(file, "chunks"):
+        for block in file.chunks():
+            digest.update(block)
+        file.seek(0)
+    else:
+        file.seek(0)
+        for block in iter(lambda: file.read(READ_BLOCK), b""):
+            digest.update(block)
+        file.seek(0)
+    return digest.hexdigest()
+
+
+def text_digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _paths(digest):
+    base = os.path.join(ATTACHMENT_CACHE_DIR, digest[:2], digest)
+    return base + ".json", base + ".f32"
+
+
+def _read(digest):
+    meta_path, vectors_path = _paths(digest)
+    try:
+        with open(meta_path, encoding="utf-8") as f:
+            entry = json.load(f)
+        if entry.get("version") != ATTACHMENT_CACHE_VERSION:
+            return None
+        if "text" not in entry:
+            vectors = np.fromfile(vectors_path, dtype=np.float32)
+            entry["vectors"] = vectors.reshape(len(entry["passages"]), entry["dimension"])
+        # mtime is the recency used for eviction
+        os.utime(meta_path)
+    except (OSError, ValueError, KeyError):
+        return None
+    return entry
+
+
+def _write(digest, entry):
+    meta_path, vectors_path = _paths(digest)
+    suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        if "vectors" in entry:
+            entry["vectors"].tofile(vectors_path + suffix)
+            os.replace(vectors_path + suffix, vectors_path)
+        # The json goes last, its presence marks a complete entry
+        with open(meta_path + suffix, "w", encoding="utf-8") as f:
+            json.dump({k: v for k, v in entry.items() if k != "vectors"}, f)
+        os.replace(meta_path + suffix, meta_path)
+        written = sum(os.path.getsize(path) for path in (meta_path, vectors_path) if os.path.exists(path))
+    except OSError as e:
+        _stats["write_errors"] += 1
+        logger.warning("Could not cache attachment %s: %s", digest, e)
+        return
+    _track(written)
+
+
+def _track(written):
+    global _cache_bytes, _writes
+    with _size_lock:
+        _writes += 1
+        if _cache_bytes is not None:
+            _cache_bytes += written
+            if _cache_bytes <= ATTACHMENT_CACHE_BYTES and _writes % max(1, ATTACHMENT_RESCAN_WRITES):
+                return
+        _cache_bytes = _evict()
+
+
+def _evict():
+    # Walks the cache, deletes least recently used entries down to the limit and
+    # returns the bytes left
+    _stats["rescans"] += 1
+    entries, total = {}, 0
+    for root, _, files in os.walk(ATTACHMENT_CACHE_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                info = os.stat(path)
+            except OSError:
+                continue
+            digest = name.split(".", 1)[0]
+            mtime, size, paths = entries.get(digest, (0, 0, []))
+            entries[digest] = (max(mtime, info.st_mtime) if name.endswith(".json") else mtime, size + info.st_size, paths + [path])
+            total += info.st_size
+    for digest, (_, size, paths) in sorted(entries.items(), key=lambda item: item[1][0]):
+        if total <= ATTACHMENT_CACHE_BYTES:
+            break
+        for path in paths:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+        total -= size
+        _stats["evicted"] += 1
+    return total
+
+
+def _build(pages):
+    pages = list(pages)
+    text = "".join(pages)
+    tokens = chunking.count_tokens(text)
+    entry = {"version": ATTACHMENT_CACHE_VERSION, "tokens": tokens}
+    if tokens <= ATTACHMENT_INLINE_TOKENS:
+        entry["text"] = text
+        return entry
+    passages = [p for p in chunking.chunk_pages(pages, size=ATTACHMENT_PASSAGE_TOKENS, overlap=ATTACHMENT_PASSAGE_OVERLAP) if p.strip()]
+    client = utils.initialize_openai_client()
+    embeddings = []
+    for batch in utils.pack_batches(passages):
+        embeddings.extend(utils.embed_batch(client=client, texts=batch))
+    vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(passages), -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    entry.update(passages=passages, dimension=vectors.shape[1], vectors=vectors / norms)
+    return entry
+
+
+def _load(digest, pages):
+    entry = _loaded.get(digest)
+    if entry is not None:
+        _stats["memory_hits"] += 1
+        return entry
+    with _locks[int(digest[:8], 16) % len(_locks)]:
+        entry = _loaded.get(digest)
+        if entry is None:
+            entry = _read(digest)
+            if entry is not None:
+                _stats["disk_hits"] += 1
+            else:
+                _stats["misses"] += 1
+                entry = _build(pages())
+                _write(digest, entry)
+            _loaded.set(digest, entry)
+    return entry
+
+
+def load_pdf(file):
+    # Parsed and embedded on the first upload only; repeat turns just hash the bytes
+    return _load(file_digest(file), lambda: pdf.iter_pdf_pages(file))
+
+
+def load_text(text):
+    return _load(text_digest(text), lambda: [text])
+
+
+def relevant(entry, query, query_vector, top_k=ATTACHMENT_TOP_K):
+    # The passages of one attachment that best answer the query, in document order
+    if "text" in entry:
+        return entry["text"]
+    vectors = entry["vectors"]
+    if not len(vectors):
+        return ""
+    scores = vectors @ query_vector
+    n = min(len(scores), rerank.candidates(top_k))
+    top = np.argpartition(-scores, n - 1)[:n] if n < len(scores) else np.arange(len(scores))
+    top = top[np.argsort(-scores[top])]
+    docs = [
+        {"content": entry["passages"][i], "score": float(scores[i]), "values": vectors[i], "index": int(i)}
+        for i in top
+    ]
+    picked = sorted(rerank.rerank(query, docs, top_k), key=lambda doc: doc["index"])
+    return PASSAGE_SEPARATOR.join(doc["content"] for doc in picked)
+
+
+def select(attached, query, top_k=ATTACHMENT_TOP_K):
+    # [(label, entry)] -> [(label, text)] for budget.assemble; the query is embedded once
+    query_vector = None
+    if any("text" not in entry for _, entry in attached):
+        query_vector = np.asarray(utils.embed_query(query), dtype=np.float32)
+        query_vector /= np.linalg.norm(query_vector) or 1.0
+    return [(label, relevant(entry, query, query_vector, top_k)) for label, entry in attached]
+
+
+def stats():
+    return dict(_stats, memory_entries=len(_loaded), cache_bytes=_cache_bytes)
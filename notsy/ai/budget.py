@@ -0,0 +1,146 @@
+from . import chunking, utils
+import os
+
+# Token-budgeted prompt assembly shared by the chat and study endpoints.
+# The instruction and the query are always kept; the rest of the budget is split
+# across summary, history, RAG and attachments, and whatever one section leaves
+# unused goes to the others.
+
+CONTEXT_MODEL = "gpt-4.1"
+CONTEXT_TOKEN_BUDGET = int(os.getenv('CONTEXT_TOKEN_BUDGET', 32000))
+CONTEXT_SHARES = {"summary": 0.15, "history": 0.35, "rag": 0.25, "attachments": 0.25}
+# Role and separator tokens the API adds around every message
+MESSAGE_OVERHEAD = 4
+# The "[RAG #i] " prefix utils.rag_context puts on each document
+RAG_LABEL_TOKENS = 4
+# A document that does not fit whole is cut to the space left, if at least this much is left
+RAG_MIN_TOKENS = int(os.getenv('RAG_MIN_TOKENS', 200))
+
+
+def message_tokens(message, model=CONTEXT_MODEL):
+    return chunking.count_tokens(str(message.get("content") or ""), model) + MESSAGE_OVERHEAD
+
+
+def doc_tokens(doc, model=CONTEXT_MODEL):
+    return chunking.count_tokens(doc.get("content", ""), model) + MESSAGE_OVERHEAD + RAG_LABEL_TOKENS
+
+
+def allocate(needs, available, shares=CONTEXT_SHARES):
+    # Sections that need less than their share keep what they need, the remainder
+    # is split again among the others until nothing fits
+    alloc = {name: 0 for name in needs}
+    pending = {name for name, need in needs.items() if need > 0}
+    while pending and available > 0:
+        total = sum(shares[name] for name in pending)
+        fits = {name for name in pending if needs[name] <= available * shares[name] / total}
+        if not fits:
+            for name in pending:
+                alloc[name] = int(available * shares[name] / total)
+            break
+        for name in fits:
+            alloc[name] = needs[name]
+            available -= needs[name]
+        pending -= fits
+    return alloc
+
+
+def _newest(messages, sizes, limit, step=1):
+    # Longest run of the most recent messages (whole groups of `step`) within limit
+    kept, used = len(messages), 0
+    while kept >= step and used + sum(sizes[kept - step:kept]) <= limit:
+        used += sum(sizes[kept - step:kept])
+        kept -= step
+    return messages[kept:], used
+
+
+def _leading(docs, sizes, limit, model):
+    # Documents in the order retrieval ranked them (per-namespace plan, then rerank/MMR);
+    # the first one that does not fit is cut to the space left and the rest are dropped
+    kept, used = [], 0
+    for doc, size in zip(docs, sizes):
+        room = limit - used
+        if size <= room:
+            kept.append(doc)
+            used += size
+            continue
+        if room >= RAG_MIN_TOKENS:
+            cut = room - MESSAGE_OVERHEAD - RAG_LABEL_TOKENS
+            kept.append({**doc, "content": chunking.truncate(doc.get("content", ""), cut, model)})
+            used += room
+        break
+    return utils.rag_context(kept), used
+
+
+def _truncated(attachments, sizes, limit, model):
+    # Every attachment gets an equal share, short ones hand their leftover to the rest
+    shares = allocate(dict(enumerate(sizes)), limit, {i: 1 for i in range(len(sizes))})
+    messages, used = [], 0
+    for i, (label, text) in enumerate(attachments):
+        room = shares[i] - MESSAGE_OVERHEAD - chunking.count_tokens(label, model)
+        if room <= 0:
+            continue
+        messages.append({"role": "user", "content": f"{label} {chunking.truncate(text, room, model)}"})
+        used += min(shares[i], sizes[i])
+    return messages, used
+
+
+def assemble(instruction=None, summary=(), history=(), rag=(), attachments=(), query=None,
+             budget=CONTEXT_TOKEN_BUDGET, model=CONTEXT_MODEL):
+    # instruction/query: message dicts; summary/history: message lists, history in user/assistant pairs;
+    # rag: documents from utils.query ({"content", "score"}) in prompt order; attachments: (label, text) pairs.
+    # Returns the context and its token accounting.
+    # Older turns are dropped by the summary checkpoint (summaries.rolling) and by the budget, not by count
+    history = list(history)
+    history = history[len(history) % 2:]
+    summary, rag, attachments = list(summary), list(rag), list(attachments)
+
+    fixed = {
+        "instruction": message_tokens(instruction, model) if instruction else 0,
+        "query": message_tokens(query, model) if query else 0,
+    }
+    sizes = {
+        "summary": [message_tokens(m, model) for m in summary],
+        "history": [message_tokens(m, model) for m in history],
+        "rag": [doc_tokens(d, model) for d in rag],
+        "attachments": [
+            chunking.count_tokens(f"{label} {text}", model) + MESSAGE_OVERHEAD for label, text in attachments
+        ],
+    }
+    needs = {name: sum(values) for name, values in sizes.items()}
+
+    available = max(0, budget - sum(fixed.values()))
+    select = {
+        "summary": lambda limit: _newest(summary, sizes["summary"], limit),
+        "history": lambda limit: _newest(history, sizes["history"], limit, step=2),
+        "rag": lambda limit: _leading(rag, sizes["rag"], limit, model),
+        "attachments": lambda limit: _truncated(attachments, sizes["attachments"], limit, model),
+    }
+    sections = {name: select[name](limit) for name, limit in allocate(needs, available).items()}
+    # Whole messages rarely fill an allocation exactly; offer the slack to sections that were cut
+    for name in ("history", "rag", "summary", "attachments"):
+        slack = available - sum(used for _, used in sections.values())
+        if slack > 0 and sections[name][1] < needs[name]:
+            sections[name] = select[name](sections[name][1] + slack)
+
+    context = [instruction] if instruction else []
+    for name in ("summary", "history", "rag", "attachments"):
+        context += sections[name][0]
+    if query:
+        context.append(query)
+
+    accounting = {name: {"tokens": tokens, "requested": tokens, "items": int(tokens > 0), "dropped": 0}
+                  for name, tokens in fixed.items()}
+    inputs = {"summary": summary, "history": history, "rag": rag, "attachments": attachments}
+    for name, (messages, used) in sections.items():
+        accounting[name] = {
+            "tokens": used,
+            "requested": needs[name],
+            "items": len(messages),
+            "dropped": len(inputs[name]) - len(messages),
+        }
+    return context, {
+        "model": model,
+        "budget": budget,
+        "used": sum(section["tokens"] for section in accounting.values()),
+        "sections": accounting,
+    }
@@ -0,0 +1,111 @@
+import functools
+import tiktoken
+import re
+import os
+
+EMBEDDING_MODEL = "text-embedding-3-large"
+# text-embedding-3-large accepts 8191 tokens per input
+EMBEDDING_MAX_TOKENS = 8000
+# Upload chunks are retrieved a few at a time (RAG_PLANS asks for up to 6 per turn) into
+# a RAG share of about 8k tokens, so a chunk has to be a passage, not a document
+CHUNK_TOKENS = int(os.getenv('CHUNK_TOKENS', 1000))
+CHUNK_OVERLAP = int(os.getenv('CHUNK_OVERLAP', 150))
+
+SECTION_BREAK = re.compile(r"\n\s*\n")
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoding(model=EMBEDDING_MODEL):
+    # Building the encoder is expensive, do it once per process
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        # Newer chat models share the gpt-4o tokenizer
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text, model=EMBEDDING_MODEL):
+    return len(get_encoding(model).encode(text, disallowed_special=()))
+
+
+def truncate(text, max_tokens=EMBEDDING_MAX_TOKENS, model=EMBEDDING_MODEL):
+    encoding = get_encoding(model)
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    return encoding.decode(tokens[:max(0, max_tokens)])
+
+
+def split_tokens(text, size=CHUNK_TOKENS, overlap=CHUNK_OVERLAP, tokens=None):
+    # Fixed windows of `size` tokens, each sharing `overlap` tokens with the previous one
+    encoding = get_encoding()
+    tokens = tokens if tokens is not None else encoding.encode(text, disallowed_special=())
+    if len(tokens) <= size:
+        return [text] if text else []
+    step = max(1, size - overlap)
+    chunks = []
+    for start in range(0, len(tokens), step):
+        chunks.append(encoding.decode(tokens[start:start + size]))
+        if start + size >= len(tokens):
+            break
+    return chunks
+
+
+def chunk_text(text, size=CHUNK_TOKENS, overlap=CHUNK_OVERLAP):
+    return list(chunk_pages([text], size=size, overlap=overlap))
+
+
+def chunk_pages(pages, size=CHUNK_TOKENS, overlap=CHUNK_OVERLAP):
+    # Packs whole pages into chunks of at most `size` tokens. A page that does not fit
+    # on its own is split at section breaks first and only then on token windows.
+    # Every chunk starts with the last `overlap` tokens of the one before it, so a passage
+    # that crosses a chunk boundary is still whole in one of them.
+    encoding = get_encoding()
+    overlap = max(0, min(overlap, size - 1))
+    # buffer holds (text, tokens) of new content; carried is the tail of the last chunk
+    buffer, buffer_tokens, carried = [], 0, []
+
+    def flush():
+        nonlocal buffer, buffer_tokens, carried
+        text = (encoding.decode(carried) if carried else "") + "".join(part for part, _ in buffer)
+        tokens = carried + [token for _, part_tokens in buffer for token in part_tokens]
+        buffer, buffer_tokens = [], 0
+        carried = tokens[len(tokens) - overlap:] if overlap else []
+        return text
+
+    def add(part, tokens):
+        nonlocal buffer_tokens, carried
+        if len(carried) + buffer_tokens + len(tokens) > size and buffer:
+            yield flush()
+        if len(carried) + buffer_tokens + len(tokens) > size:
+            # Only the carried overlap is in the way; keep as much of it as still fits
+            room = size - len(tokens)
+            carried = carried[len(carried) - room:] if room > 0 else []
+        buffer.append((part, tokens))
+        buffer_tokens += len(tokens)
+
+    for page in pages:
+        if not page:
+            continue
+        tokens = encoding.encode(page, disallowed_special=())
+        if len(tokens) <= size:
+            yield from add(page, tokens)
+            continue
+        # Sections leave room for the carried overlap, which stands in for window overlap
+        for section in _split_sections(page, size - overlap, 0):
+            yield from add(section, encoding.encode(section, disallowed_special=()))
+    if buffer:
+        yield flush()
+
+
+def _split_sections(page, size, overlap):
+    encoding = get_encoding()
+    parts = SECTION_BREAK.split(page)
+    for i, part in enumerate(parts):
+        # Keep the separator with the preceding section so text is preserved
+        section = part + ("\n\n" if i < len(parts) - 1 else "")
+        tokens = encoding.encode(section, disallowed_special=())
+        if len(tokens) <= size:
+            yield section
+        else:
+            yield from split_tokens(section, size=size, overlap=overlap, tokens=tokens)
@@ -0,0 +1,207 @@
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+from pinecone import Pinecone
+from dotenv import load_dotenv
+import threading
+import asyncio
+import weakref
+import logging
+import httpx
+import time
+import os
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Connection pool sizes, per worker process
+OPENAI_MAX_CONNECTIONS = int(os.getenv('OPENAI_MAX_CONNECTIONS', 50))
+OPENAI_MAX_KEEPALIVE = int(os.getenv('OPENAI_MAX_KEEPALIVE', 20))
+OPENAI_TIMEOUT = float(os.getenv('OPENAI_TIMEOUT', 120))
+# Retries happen in scheduler.py, where they wait for rate-limit capacity like any other call
+OPENAI_MAX_RETRIES = int(os.getenv('OPENAI_MAX_RETRIES', 0))
+PINE_POOL_THREADS = int(os.getenv('PINE_POOL_THREADS', 8))
+PINE_POOL_MAXSIZE = int(os.getenv('PINE_POOL_MAXSIZE', 20))
+
+_lock = threading.Lock()
+_clients = {}
+# Async clients are bound to the event loop that created them
+_async_clients = weakref.WeakKeyDictionary()
+_pid = None
+_metrics_hooks = []
+_stats = {
+    "openai_clients_created": 0,
+    "pinecone_clients_created": 0,
+    "async_openai_clients_created": 0,
+    "async_pinecone_clients_created": 0,
+    "openai_requests": 0,
+    "openai_errors": 0,
+    "openai_request_seconds": 0.0,
+}
+
+
+def add_metrics_hook(hook):
+    # hook(event, **fields) is called for client creation and every OpenAI HTTP response
+    _metrics_hooks.append(hook)
+
+
+def _emit(event, **fields):
+    for hook in _metrics_hooks:
+        try:
+            hook(event, **fields)
+        except Exception:
+            logger.exception("Metrics hook failed for %s", event)
+
+
+def _on_request(request):
+    request.extensions["notsy_start"] = time.perf_counter()
+
+
+def _on_response(response):
+    elapsed = time.perf_counter() - response.request.extensions.get("notsy_start", time.perf_counter())
+    _stats["openai_requests"] += 1
+    _stats["openai_request_seconds"] += elapsed
+    if response.status_code >= 400:
+        _stats["openai_errors"] += 1
+    _emit("openai_response", path=response.request.url.path, status=response.status_code, seconds=elapsed)
+
+
+async def _on_async_request(request):
+    _on_request(request)
+
+
+async def _on_async_response(response):
+    _on_response(response)
+
+
+def _check_fork():
+    # Pools hold sockets that must not be shared with a forked child
+    global _pid
+    if _pid != os.getpid():
+        _clients.clear()
+        _async_clients.clear()
+        _pid = os.getpid()
+
+
+def _get(name, factory):
+    _check_fork()
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = factory()
+                _clients[name] = client
+                _stats[f"{name}_clients_created"] += 1
+                _emit("client_created", name=name)
+    return client
+
+
+def _get_async(name, factory):
+    _check_fork()
+    loop_clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    client = loop_clients.get(name)
+    if client is None:
+        client = factory()
+        loop_clients[name] = client
+        _stats[f"{name}_clients_created"] += 1
+        _emit("client_created", name=name)
+    return client
+
+
+def _openai_kwargs():
+    return {
+        "api_key": os.getenv('OPENAI_API_KEY'),
+        "organization": os.getenv('OPENAI_ORG_KEY'),
+        "project": os.getenv('OPENAI_PROJECT_ID'),
+        "max_retries": OPENAI_MAX_RETRIES,
+    }
+
+
+def _pool_limits():
+    return httpx.Limits(
+        max_connections=OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+    )
+
+
+def _make_openai():
+    http_client = DefaultHttpxClient(
+        limits=_pool_limits(),
+        timeout=OPENAI_TIMEOUT,
+        event_hooks={"request": [_on_request], "response": [_on_response]},
+    )
+    return OpenAI(http_client=http_client, **_openai_kwargs())
+
+
+def _make_async_openai():
+    http_client = DefaultAsyncHttpxClient(
+        limits=_pool_limits(),
+        timeout=OPENAI_TIMEOUT,
+        event_hooks={"request": [_on_async_request], "response": [_on_async_response]},
+    )
+    return AsyncOpenAI(http_client=http_client, **_openai_kwargs())
+
+
+def _make_pinecone():
+    pc = Pinecone(api_key=os.getenv('PINE_API_KEY'), pool_threads=PINE_POOL_THREADS)
+    return pc.Index(
+        host=os.getenv('PINE_HOST'),
+        pool_threads=PINE_POOL_THREADS,
+        connection_pool_maxsize=PINE_POOL_MAXSIZE,
+    )
+
+
+def _make_async_pinecone():
+    # Needs the aiohttp extra of the pinecone package
+    pc = Pinecone(api_key=os.getenv('PINE_API_KEY'))
+    return pc.IndexAsyncio(host=os.getenv('PINE_HOST'), connection_pool_maxsize=PINE_POOL_MAXSIZE)
+
+
+def get_openai_client():
+    return _get("openai", _make_openai)
+
+
+def get_pinecone_index():
+    return _get("pinecone", _make_pinecone)
+
+
+def get_async_openai_client():
+    return _get_async("async_openai", _make_async_openai)
+
+
+def get_async_pinecone_index():
+    return _get_async("async_pinecone", _make_async_pinecone)
+
+
+def reset():
+    with _lock:
+        for name, client in list(_clients.items()):
+            close = getattr(client, "close", None)
+            if close:
+                try:
+                    close()
+                except Exception:
+                    logger.exception("Failed to close %s client", name)
+        _clients.clear()
+        _async_clients.clear()
+
+
+def stats():
+    return dict(_stats, pid=os.getpid(), live_clients=sorted(_clients))
+
+
+def health():
+    result = {}
+    for name, check in (
+        ("openai", lambda: get_openai_client().models.list()),
+        ("pinecone", lambda: get_pinecone_index().describe_index_stats()),
+    ):
+        start = time.perf_counter()
+        try:
+            check()
+            result[name] = {"ok": True}
+        except Exception as e:
+            result[name] = {"ok": False, "error": str(e)}
+        result[name]["seconds"] = round(time.perf_counter() - start, 3)
+        _emit("health_check", name=name, ok=result[name]["ok"])
+    return result
@@ -0,0 +1,174 @@
+from collections import Counter
+import threading
+import sqlite3
+import csv
+import re
+import sys
+import os
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Reference corpora that back the shared Pinecone namespaces.
+# namespace -> (csv file, column used as lookup key)
+CORPORA = {
+    'openai-ref': ('openai_docs_chunked.csv', 'id'),
+    'gfg': ('gfg_cleaned.csv', 'url'),
+}
+
+CORPUS_DB = os.getenv('CORPUS_DB_PATH', os.path.join(BASE_DIR, 'corpus.sqlite3'))
+# Bumped when the tables change so older files are rebuilt
+CORPUS_SCHEMA = 2
+
+TERM_PATTERN = re.compile(r"[a-z0-9]+")
+
+_build_lock = threading.Lock()
+_local = threading.local()
+
+
+def _csv_paths():
+    return [os.path.join(BASE_DIR, csv_file) for csv_file, _ in CORPORA.values()]
+
+
+def terms(text):
+    # Lexical terms for BM25, shared by the corpus statistics and the reranker
+    return TERM_PATTERN.findall(text.lower())
+
+
+def _is_stale():
+    if not os.path.exists(CORPUS_DB):
+        return True
+    db_mtime = os.path.getmtime(CORPUS_DB)
+    if any(os.path.exists(path) and os.path.getmtime(path) > db_mtime for path in _csv_paths()):
+        return True
+    conn = sqlite3.connect(f"file:{CORPUS_DB}?mode=ro", uri=True)
+    try:
+        return conn.execute("PRAGMA user_version").fetchone()[0] != CORPUS_SCHEMA
+    finally:
+        conn.close()
+
+
+def build_corpus_db():
+    # Stream the CSVs into a keyed SQLite file, written to a temp path and
+    # swapped in atomically so concurrent workers never see a partial db.
+    csv.field_size_limit(sys.maxsize)
+    tmp_path = f"{CORPUS_DB}.{os.getpid()}.tmp"
+    conn = sqlite3.connect(tmp_path)
+    try:
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        conn.execute(
+            "CREATE TABLE corpus ("
+            "namespace TEXT NOT NULL, "
+            "key TEXT NOT NULL, "
+            "text TEXT NOT NULL, "
+            "PRIMARY KEY (namespace, key)"
+            ") WITHOUT ROWID"
+        )
+        # Document frequencies and lengths for BM25 over each corpus
+        conn.execute(
+            "CREATE TABLE corpus_terms ("
+            "namespace TEXT NOT NULL, "
+            "term TEXT NOT NULL, "
+            "df INTEGER NOT NULL, "
+            "PRIMARY KEY (namespace, term)"
+            ") WITHOUT ROWID"
+        )
+        conn.execute("CREATE TABLE corpus_stats (namespace TEXT PRIMARY KEY, docs INTEGER, avg_len REAL)")
+        for namespace, (csv_file, key_column) in CORPORA.items():
+            path = os.path.join(BASE_DIR, csv_file)
+            if not os.path.exists(path):
+                continue
+            with open(path, newline='', encoding='utf-8') as f:
+                rows = (
+                    (namespace, row[key_column], row['text'] or "")
+                    for row in csv.DictReader(f)
+                    if row.get(key_column)
+                )
+                # First row wins for duplicate keys, same as the old DataFrame lookup.
+                conn.executemany("INSERT OR IGNORE INTO corpus VALUES (?, ?, ?)", rows)
+            df, docs, total_len = Counter(), 0, 0
+            for (text,) in conn.execute("SELECT text FROM corpus WHERE namespace = ?", (namespace,)):
+                doc_terms = terms(text)
+                df.update(set(doc_terms))
+                docs += 1
+                total_len += len(doc_terms)
+            conn.executemany("INSERT INTO corpus_terms VALUES (?, ?, ?)", ((namespace, t, n) for t, n in df.items()))
+            conn.execute("INSERT INTO corpus_stats VALUES (?, ?, ?)", (namespace, docs, total_len / docs if docs else 0.0))
+        conn.execute(f"PRAGMA user_version = {CORPUS_SCHEMA}")
+        conn.commit()
+    finally:
+        conn.close()
+    os.replace(tmp_path, CORPUS_DB)
+
+
+def ensure_corpus_db():
+    if not _is_stale():
+        return
+    with _build_lock:
+        if _is_stale():
+            build_corpus_db()
+
+
+def _connection():
+    # SQLite connections must not cross threads or forks; the db file itself is
+    # shared through the OS page cache, so every worker reads the same pages.
+    conn = getattr(_local, 'conn', None)
+    if conn is None or getattr(_local, 'pid', None) != os.getpid():
+        ensure_corpus_db()
+        conn = sqlite3.connect(f"file:{CORPUS_DB}?mode=ro", uri=True, check_same_thread=False)
+        conn.execute("PRAGMA mmap_size=268435456")
+        _local.conn = conn
+        _local.pid = os.getpid()
+    return conn
+
+
+def has_corpus(namespace):
+    return namespace in CORPORA
+
+
+def get_text(namespace, key):
+    if namespace not in CORPORA or key is None:
+        return None
+    row = _connection().execute(
+        "SELECT text FROM corpus WHERE namespace = ? AND key = ?", (namespace, str(key))
+    ).fetchone()
+    return row[0] if row else None
+
+
+def get_texts(namespace, keys):
+    # Bulk lookup, returns {key: text} for the keys that exist.
+    keys = [str(k) for k in keys if k is not None]
+    if namespace not in CORPORA or not keys:
+        return {}
+    placeholders = ",".join("?" * len(keys))
+    rows = _connection().execute(
+        f"SELECT key, text FROM corpus WHERE namespace = ? AND key IN ({placeholders})",
+        (namespace, *keys),
+    ).fetchall()
+    return dict(rows)
+
+
+def iter_texts(namespace):
+    # (key, text) for every document of a corpus, in key order
+    if namespace not in CORPORA:
+        return
+    yield from _connection().execute(
+        "SELECT key, text FROM corpus WHERE namespace = ? ORDER BY key", (namespace,)
+    )
+
+
+def term_stats(namespace, query_terms):
+    # (documents, average length, {term: document frequency}) for a corpus, None for other namespaces
+    if namespace not in CORPORA:
+        return None
+    conn = _connection()
+    row = conn.execute("SELECT docs, avg_len FROM corpus_stats WHERE namespace = ?", (namespace,)).fetchone()
+    if not row or not row[0]:
+        return None
+    query_terms = sorted(set(query_terms))
+    placeholders = ",".join("?" * len(query_terms))
+    df = dict(conn.execute(
+        f"SELECT term, df FROM corpus_terms WHERE namespace = ? AND term IN ({placeholders})",
+        (namespace, *query_terms),
+    ).fetchall()) if query_terms else {}
+    return row[0], row[1], df
@@ -0,0 +1,121 @@
+from collections import OrderedDict
+from array import array
+import threading
+import hashlib
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+EMBED_CACHE_SIZE = int(os.getenv('EMBED_CACHE_SIZE', 2048))
+EMBED_CACHE_TTL = int(os.getenv('EMBED_CACHE_TTL', 7 * 24 * 3600))
+EMBED_CACHE_LOCAL_TTL = int(os.getenv('EMBED_CACHE_LOCAL_TTL', 3600))
+EMBED_CACHE_VERSION = 1
+
+
+class LRUCache:
+    # Small thread-safe LRU with a per-entry TTL
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+_local = LRUCache(EMBED_CACHE_SIZE, EMBED_CACHE_LOCAL_TTL)
+_stats = {"local_hits": 0, "shared_hits": 0, "misses": 0, "shared_errors": 0}
+
+
+def normalize(text):
+    return " ".join(text.split())
+
+
+def make_key(model, text):
+    digest = hashlib.sha256(normalize(text).encode("utf-8")).hexdigest()
+    return f"emb:v{EMBED_CACHE_VERSION}:{model}:{digest}"
+
+
+def _shared_cache():
+    from django.conf import settings
+    if not settings.configured:
+        return None
+    from django.core.cache import cache
+    return cache
+
+
+def _pack(vector):
+    # float32 bytes are ~5x smaller than a JSON list of floats
+    return array("f", vector).tobytes()
+
+
+def _unpack(blob):
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+def lookup(model, text):
+    key = make_key(model, text)
+    vector = _local.get(key)
+    if vector is not None:
+        _stats["local_hits"] += 1
+        return vector
+    try:
+        cache = _shared_cache()
+        blob = cache.get(key) if cache is not None else None
+    except Exception as e:
+        _stats["shared_errors"] += 1
+        logger.debug("Shared embedding cache unavailable: %s", e)
+        blob = None
+    if blob is not None:
+        vector = _unpack(blob)
+        _local.set(key, vector)
+        _stats["shared_hits"] += 1
+        return vector
+    _stats["misses"] += 1
+    return None
+
+
+def store(model, text, vector):
+    key = make_key(model, text)
+    _local.set(key, vector)
+    try:
+        cache = _shared_cache()
+        if cache is not None:
+            cache.set(key, _pack(vector), timeout=EMBED_CACHE_TTL)
+    except Exception as e:
+        _stats["shared_errors"] += 1
+        logger.debug("Shared embedding cache unavailable: %s", e)
+
+
+def stats():
+    lookups = _stats["local_hits"] + _stats["shared_hits"] + _stats["misses"]
+    hits = lookups - _stats["misses"]
+    return dict(_stats, local_size=len(_local), hit_rate=round(hits / lookups, 4) if lookups else None)
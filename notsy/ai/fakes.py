@@ -0,0 +1,238 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import threading
+import hashlib
+import base64
+import random
+import array
+import json
+import time
+
+# Local stand-ins for the OpenAI and Pinecone HTTP APIs, used by manage.py loadtest.
+# They answer the calls this service makes (embeddings, responses with and without
+# streaming, Pinecone query/upsert/fetch/list) with synthetic payloads after a
+# configurable delay, so the request path can be measured without live keys.
+
+WORDS = "graph tree heap queue stack array hash pointer recursion dynamic programming greedy sort search node edge".split()
+
+
+class FakeConfig:
+    def __init__(self, latency=0.0, jitter=0.0, output_words=200, stream_chunks=20, dimension=3072, matches_text_words=150):
+        self.latency = latency
+        self.jitter = jitter
+        self.output_words = output_words
+        self.stream_chunks = stream_chunks
+        self.dimension = dimension
+        self.matches_text_words = matches_text_words
+
+    def wait(self):
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+
+def fake_vector(text, dimension):
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    return [rng.gauss(0, 1) for _ in range(dimension)]
+
+
+def fake_text(n_words, seed=0):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(n_words))
+
+
+def sample(schema, words):
+    # Smallest instance of a JSON schema, with strings of roughly `words` words
+    if "enum" in schema:
+        return schema["enum"][0]
+    kind = schema.get("type")
+    if kind == "object":
+        return {name: sample(prop, words) for name, prop in schema.get("properties", {}).items()}
+    if kind == "array":
+        return [sample(schema.get("items", {}), words) for _ in range(3)]
+    if kind in ("integer", "number"):
+        return 0
+    if kind == "boolean":
+        return False
+    return fake_text(max(1, words))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+    def send_json(self, payload, status=200):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class _OpenAIHandler(_Handler):
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            return self.send_json({"object": "list", "data": [{"id": "gpt-4.1", "object": "model", "created": 0, "owned_by": "fake"}]})
+        self.send_json({"error": {"message": "not found"}}, status=404)
+
+    def do_POST(self):
+        body = self.body()
+        path = urlparse(self.path).path.rstrip("/")
+        self.config.wait()
+        if path.endswith("/embeddings"):
+            return self.embeddings(body)
+        if path.endswith("/responses"):
+            if body.get("stream"):
+                return self.stream(body)
+            return self.send_json(self.response(body))
+        self.send_json({"error": {"message": "not found"}}, status=404)
+
+    def embeddings(self, body):
+        inputs = body.get("input")
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        data = []
+        for i, text in enumerate(inputs):
+            vector = fake_vector(str(text), self.config.dimension)
+            if body.get("encoding_format") == "base64":
+                vector = base64.b64encode(array.array("f", vector).tobytes()).decode("ascii")
+            data.append({"object": "embedding", "index": i, "embedding": vector})
+        tokens = sum(len(str(text).split()) for text in inputs)
+        self.send_json({
+            "object": "list",
+            "data": data,
+            "model": body.get("model"),
+            "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+        })
+
+    def output_text(self, body):
+        text_format = (body.get("text") or {}).get("format") or {}
+        if text_format.get("type") == "json_schema":
+            return json.dumps(sample(text_format.get("schema", {}), max(1, self.config.output_words // 20)))
+        return fake_text(self.config.output_words, seed=len(json.dumps(body.get("input"))))
+
+    def response(self, body, text=None):
+        text = self.output_text(body) if text is None else text
+        input_tokens = len(json.dumps(body.get("input")).split())
+        output_tokens = len(text.split())
+        return {
+            "id": f"resp_{random.getrandbits(48):x}",
+            "object": "response",
+            "created_at": int(time.time()),
+            "model": body.get("model"),
+            "status": "completed",
+            "output": [{
+                "type": "message",
+                "id": f"msg_{random.getrandbits(48):x}",
+                "status": "completed",
+                "role": "assistant",
+                "content": [{"type": "output_text", "text": text, "annotations": []}],
+            }],
+            "parallel_tool_calls": True,
+            "tool_choice": "auto",
+            "tools": [],
+            "usage": {
+                "input_tokens": input_tokens,
+                "input_tokens_details": {"cached_tokens": 0},
+                "output_tokens": output_tokens,
+                "output_tokens_details": {"reasoning_tokens": 0},
+                "total_tokens": input_tokens + output_tokens,
+            },
+        }
+
+    def stream(self, body):
+        text = self.output_text(body)
+        final = self.response(body, text)
+        item_id = final["output"][0]["id"]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def send(event):
+            self.wfile.write(f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        send({"type": "response.created", "sequence_number": 0, "response": dict(final, status="in_progress", output=[])})
+        words = text.split(" ")
+        step = max(1, len(words) // max(1, self.config.stream_chunks))
+        for n, start in enumerate(range(0, len(words), step)):
+            delta = " ".join(words[start:start + step]) + (" " if start + step < len(words) else "")
+            send({"type": "response.output_text.delta", "sequence_number": n + 1, "item_id": item_id,
+                  "output_index": 0, "content_index": 0, "delta": delta})
+        send({"type": "response.completed", "sequence_number": len(words) + 1, "response": final})
+
+
+class _PineconeHandler(_Handler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        self.config.wait()
+        namespace = query.get("namespace", [""])[0]
+        if url.path.endswith("/vectors/list"):
+            return self.send_json({"vectors": [], "namespace": namespace, "usage": {"readUnits": 1}})
+        if url.path.endswith("/vectors/fetch"):
+            return self.send_json({"vectors": {}, "namespace": namespace, "usage": {"readUnits": 1}})
+        if url.path.endswith("/describe_index_stats"):
+            return self.stats()
+        self.send_json({"message": "not found"}, status=404)
+
+    def do_POST(self):
+        body = self.body()
+        path = urlparse(self.path).path.rstrip("/")
+        self.config.wait()
+        if path.endswith("/query"):
+            return self.query(body)
+        if path.endswith("/vectors/upsert"):
+            return self.send_json({"upsertedCount": len(body.get("vectors", []))})
+        if path.endswith("/vectors/delete"):
+            return self.send_json({})
+        if path.endswith("/describe_index_stats"):
+            return self.stats()
+        self.send_json({"message": "not found"}, status=404)
+
+    def stats(self):
+        self.send_json({"namespaces": {}, "dimension": self.config.dimension, "indexFullness": 0.0, "totalVectorCount": 0})
+
+    def query(self, body):
+        namespace = body.get("namespace", "")
+        matches = []
+        for i in range(int(body.get("topK", 3))):
+            match = {
+                "id": f"fake-{namespace}-{i}",
+                "score": round(0.9 - 0.02 * i, 4),
+                "metadata": {
+                    "text": fake_text(self.config.matches_text_words, seed=i),
+                    "url": f"https://example.com/{namespace}/{i}",
+                },
+            }
+            if body.get("includeValues"):
+                match["values"] = fake_vector(match["id"], self.config.dimension)
+            matches.append(match)
+        self.send_json({"matches": matches, "namespace": namespace, "usage": {"readUnits": 5}})
+
+
+def serve(handler, config, host="127.0.0.1", port=0):
+    # Starts the server on a daemon thread; returns it, its base url is server.url
+    handler = type(handler.__name__, (handler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.url = f"http://{host}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, name=f"fake-{handler.__name__}", daemon=True).start()
+    return server
+
+
+def serve_openai(config, **kwargs):
+    return serve(_OpenAIHandler, config, **kwargs)
+
+
+def serve_pinecone(config, **kwargs):
+    return serve(_PineconeHandler, config, **kwargs)
@@ -0,0 +1,75 @@
+from concurrent.futures import ThreadPoolExecutor
+from . import utils, embedding_cache, scheduler
+import numpy as np
+import os
+
+# Candidate neighbours sent to the LLM when connecting a node
+GRAPH_CANDIDATES = int(os.getenv('GRAPH_CANDIDATES', 12))
+# Graphs with more topics than this are built in parallel shards
+GRAPH_SHARD_SIZE = int(os.getenv('GRAPH_SHARD_SIZE', 20))
+GRAPH_POOL = ThreadPoolExecutor(max_workers=int(os.getenv('GRAPH_POOL_SIZE', 8)), thread_name_prefix="graph")
+
+
+def embed_labels(labels):
+    # Unit-normalised label embeddings, reusing the embedding cache and batching the misses
+    vectors = [embedding_cache.lookup(utils.EMBEDDING_MODEL, label) for label in labels]
+    missing = [i for i, vector in enumerate(vectors) if vector is None]
+    if missing:
+        client = utils.initialize_openai_client()
+        pending = iter(missing)
+        with scheduler.prioritized("graph"):
+            for batch in utils.pack_batches([labels[i] for i in missing]):
+                for label, embedding in zip(batch, utils.embed_batch(client=client, texts=batch)):
+                    vectors[next(pending)] = embedding
+                    embedding_cache.store(utils.EMBEDDING_MODEL, label, embedding)
+    matrix = np.asarray(vectors, dtype=np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def shortlist(label, topic_labels, k=GRAPH_CANDIDATES, exclude=None):
+    # Topic ids most similar to label, most similar first
+    ids = [i for i in topic_labels if i != exclude]
+    if len(ids) <= k:
+        return ids
+    matrix = embed_labels([label] + [str(topic_labels[i]) for i in ids])
+    scores = matrix[1:] @ matrix[0]
+    return [ids[j] for j in np.argsort(-scores)[:k]]
+
+
+def connect_node(node_id, label, topic_labels, old_graph):
+    # Ask the LLM only about the most similar existing topics and the edges among them
+    topic_labels = {str(i): name for i, name in topic_labels.items()}
+    candidates = shortlist(label, topic_labels, exclude=str(node_id))
+    candidate_labels = {i: topic_labels[i] for i in candidates}
+    sub_graph = {
+        i: [edge for edge in old_graph.get(i, []) if str(edge.get("target")) in candidate_labels]
+        for i in candidates
+    }
+    return utils.cached_json_response(utils.node_request(node_id, label, candidate_labels, sub_graph))
+
+
+def build_graph(topics):
+    topics = {str(i): name for i, name in topics.items()}
+    if len(topics) <= GRAPH_SHARD_SIZE:
+        return utils.cached_json_response(utils.graph_request(topics))
+
+    # Each shard gets the union of its members' nearest topics as candidate targets
+    ids = list(topics)
+    matrix = embed_labels([str(topics[i]) for i in ids])
+    similarity = matrix @ matrix.T
+    np.fill_diagonal(similarity, -np.inf)
+    k = min(GRAPH_CANDIDATES, len(ids) - 1)
+    nearest = np.argsort(-similarity, axis=1)[:, :k]
+
+    requests = []
+    for start in range(0, len(ids), GRAPH_SHARD_SIZE):
+        members = range(start, min(start + GRAPH_SHARD_SIZE, len(ids)))
+        candidate_rows = sorted({j for m in members for j in nearest[m]})
+        shard = {ids[m]: topics[ids[m]] for m in members}
+        candidates = {ids[j]: topics[ids[j]] for j in candidate_rows}
+        requests.append(utils.shard_request(shard, candidates))
+
+    graph = {}
+    for part in GRAPH_POOL.map(utils.cached_json_response, requests):
+        graph.update(part)
+    return graph
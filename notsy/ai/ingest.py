@@ -0,0 +1,230 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import IngestJob, IngestFile
+from . import utils, scheduler
+import threading
+import logging
+import shutil
+import time
+import os
+
+# Background ingestion for upload/: the view enqueues files and returns a job id,
+# workers (manage.py ingest_worker, or in-process threads) extract, chunk, embed and upsert.
+
+logger = logging.getLogger(__name__)
+
+INGEST_SPOOL_DIR = os.getenv('INGEST_SPOOL_DIR', os.path.join(settings.BASE_DIR, 'media', 'ingest'))
+INGEST_CONCURRENCY = int(os.getenv('INGEST_CONCURRENCY', 4))
+INGEST_POLL_SECONDS = float(os.getenv('INGEST_POLL_SECONDS', 1))
+# Worker threads each web process starts on its first upload, so jobs are processed even
+# without manage.py ingest_worker; 0 leaves ingestion to the ingest_worker processes.
+# Files are claimed atomically and a dead process's files are requeued by heartbeat.
+INGEST_INLINE_WORKERS = int(os.getenv('INGEST_INLINE_WORKERS', 1))
+# Running files refresh heartbeat_at this often; ones silent for INGEST_STALE_SECONDS
+# belong to a dead worker and are queued again
+INGEST_HEARTBEAT_SECONDS = float(os.getenv('INGEST_HEARTBEAT_SECONDS', 30))
+INGEST_STALE_SECONDS = float(os.getenv('INGEST_STALE_SECONDS', 180))
+
+_inline_lock = threading.Lock()
+_inline_started = None
+_last_stale_check = 0.0
+
+
+def enqueue_pdfs(user_id, topic_id, pdf_files):
+    job = IngestJob.objects.create(data_type="pdf", user_id=user_id, topic_id=topic_id)
+    job_dir = os.path.join(INGEST_SPOOL_DIR, str(job.id))
+    os.makedirs(job_dir, exist_ok=True)
+    files = []
+    for i, pdf_file in enumerate(pdf_files):
+        path = os.path.join(job_dir, f"{i}.pdf")
+        with open(path, "wb") as out:
+            for chunk in pdf_file.chunks():
+                out.write(chunk)
+        files.append(IngestFile(job=job, kind="pdf", name=pdf_file.name, url=pdf_file.name, path=path))
+    IngestFile.objects.bulk_create(files)
+    ensure_inline_workers()
+    return job
+
+
+def enqueue_videos(user_id, topic_id, sources, contents):
+    job = IngestJob.objects.create(data_type="video", user_id=user_id, topic_id=topic_id)
+    IngestFile.objects.bulk_create([
+        IngestFile(job=job, kind="video", name=source, url=source, text=content)
+        for source, content in zip(sources, contents)
+    ])
+    ensure_inline_workers()
+    return job
+
+
+def claim_next():
+    # Atomically move the oldest queued file to running; None when the queue is empty
+    with transaction.atomic():
+        candidate = IngestFile.objects.filter(status=IngestFile.QUEUED).order_by("created_at", "id").first()
+        if candidate is None:
+            return None
+        claimed = IngestFile.objects.filter(pk=candidate.pk, status=IngestFile.QUEUED).update(
+            status=IngestFile.RUNNING, started_at=timezone.now(), heartbeat_at=timezone.now()
+        )
+    if not claimed:
+        return claim_next()
+    return IngestFile.objects.select_related("job").get(pk=candidate.pk)
+
+
+def _heartbeat(pk, done):
+    try:
+        while not done.wait(INGEST_HEARTBEAT_SECONDS):
+            IngestFile.objects.filter(pk=pk, status=IngestFile.RUNNING).update(heartbeat_at=timezone.now())
+    except Exception:
+        logger.exception("Ingestion heartbeat for file %s failed", pk)
+    finally:
+        connection.close()
+
+
+def process(item):
+    job = item.job
+    done = threading.Event()
+    threading.Thread(target=_heartbeat, args=(item.pk, done), name=f"ingest-heartbeat-{item.pk}", daemon=True).start()
+
+    def progress(stats):
+        IngestFile.objects.filter(pk=item.pk).update(
+            chunks_done=stats["chunks"],
+            embed_requests=stats["embed_requests"],
+            upsert_requests=stats["upsert_requests"],
+        )
+
+    try:
+        # Uploads queue behind interactive requests for OpenAI capacity
+        with scheduler.prioritized("background"):
+            if item.kind == "pdf":
+                stats = utils.upsert_pages(
+                    pages=utils.iter_pdf_pages(item.path),
+                    namespace=job.user_id,
+                    metadata={
+                        "filename": item.name,
+                        "url": item.url,
+                        "topic_id": job.topic_id,
+                        "user_id": job.user_id
+                    },
+                    progress=progress,
+                )
+            else:
+                stats = utils.upsert_text(
+                    text=item.text,
+                    namespace=job.user_id,
+                    metadata={
+                        "url": item.url,
+                        "topic_id": job.topic_id,
+                        "user_id": job.user_id
+                    },
+                    progress=progress,
+                )
+        progress(stats)
+        IngestFile.objects.filter(pk=item.pk).update(status=IngestFile.DONE, finished_at=timezone.now())
+    except Exception as e:
+        logger.exception("Ingestion of %s failed", item.name)
+        IngestFile.objects.filter(pk=item.pk).update(status=IngestFile.FAILED, error=str(e), finished_at=timezone.now())
+    finally:
+        done.set()
+        if item.path and os.path.exists(item.path):
+            os.remove(item.path)
+            job_dir = os.path.dirname(item.path)
+            if not os.listdir(job_dir):
+                shutil.rmtree(job_dir, ignore_errors=True)
+
+
+def requeue_stale(stale_seconds=INGEST_STALE_SECONDS):
+    # Files left running by a worker that died are queued again; files of live workers
+    # keep a fresh heartbeat and are left alone
+    cutoff = timezone.now() - timedelta(seconds=stale_seconds)
+    stale = IngestFile.objects.filter(status=IngestFile.RUNNING).filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff)
+    )
+    return stale.update(status=IngestFile.QUEUED, started_at=None, heartbeat_at=None)
+
+
+def _requeue_stale_periodically():
+    # Every worker, inline or not, sweeps for stale files while it is idle
+    global _last_stale_check
+    now = time.monotonic()
+    if now - _last_stale_check < INGEST_STALE_SECONDS:
+        return
+    _last_stale_check = now
+    requeued = requeue_stale()
+    if requeued:
+        logger.warning("Requeued %d interrupted ingestion file(s)", requeued)
+
+
+def _work(stop):
+    while not stop.is_set():
+        close_old_connections()
+        try:
+            item = claim_next()
+        except Exception:
+            logger.exception("Failed to claim ingestion work")
+            item = None
+        if item is None:
+            try:
+                _requeue_stale_periodically()
+            except Exception:
+                logger.exception("Failed to requeue stale ingestion work")
+            stop.wait(INGEST_POLL_SECONDS)
+            continue
+        process(item)
+
+
+def run_workers(concurrency=INGEST_CONCURRENCY, stop=None):
+    # Blocks until stop is set; each thread claims and processes one file at a time
+    stop = stop or threading.Event()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="ingest") as pool:
+        for _ in range(concurrency):
+            pool.submit(_work, stop)
+    return stop
+
+
+def ensure_inline_workers():
+    global _inline_started
+    if INGEST_INLINE_WORKERS <= 0 or _inline_started == os.getpid():
+        return
+    with _inline_lock:
+        if _inline_started == os.getpid():
+            return
+        stop = threading.Event()
+        for i in range(INGEST_INLINE_WORKERS):
+            threading.Thread(target=_work, args=(stop,), name=f"ingest-inline-{i}", daemon=True).start()
+        _inline_started = os.getpid()
+
+
+def job_status(job):
+    files = list(job.files.all())
+    chunks = sum(f.chunks_done for f in files)
+    started = [f.started_at for f in files if f.started_at]
+    finished = [f.finished_at for f in files if f.finished_at]
+    seconds = None
+    if started:
+        end = max(finished) if finished and len(finished) == len(files) else timezone.now()
+        seconds = (end - min(started)).total_seconds()
+    return {
+        "jobId": str(job.id),
+        "type": job.data_type,
+        "topicId": job.topic_id,
+        "status": job.status,
+        "chunks": chunks,
+        "chunks_per_second": round(chunks / seconds, 2) if seconds else None,
+        "files": [
+            {
+                "name": f.name,
+                "status": f.status,
+                "chunks": f.chunks_done,
+                "embed_requests": f.embed_requests,
+                "upsert_requests": f.upsert_requests,
+                "seconds": round(f.seconds, 3) if f.seconds is not None else None,
+                "chunks_per_second": f.chunks_per_second,
+                "error": f.error or None,
+            }
+            for f in files
+        ],
+    }
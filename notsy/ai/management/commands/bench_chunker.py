@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand
+from ai import chunking, utils
+import numpy as np
+import random
+import time
+
+
+def legacy_chunks(text):
+    # The previous create_chunks: character-based splitter behind a token check
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    if chunking.count_tokens(text) <= 8180:
+        return [text]
+    return RecursiveCharacterTextSplitter(chunk_size=8180, chunk_overlap=200).split_text(text)
+
+
+def synthetic_pages(n_pages, seed):
+    rng = random.Random(seed)
+    words = "graph tree heap queue stack array hash pointer recursion dynamic programming greedy sort search node edge weight path cycle".split()
+    pages = []
+    for _ in range(n_pages):
+        paragraphs = [
+            " ".join(rng.choice(words) for _ in range(rng.randint(40, 160))) + "."
+            for _ in range(rng.randint(3, 8))
+        ]
+        pages.append("\n\n".join(paragraphs) + "\n")
+    return pages
+
+
+class Command(BaseCommand):
+    help = "Benchmark chunking throughput and token utilisation of the token-aware chunker against the legacy splitter."
+
+    def add_arguments(self, parser):
+        parser.add_argument("files", nargs="*", help="PDF or text files; synthetic pages are used when omitted")
+        parser.add_argument("--pages", type=int, default=300, help="Synthetic page count")
+        parser.add_argument("--size", type=int, default=chunking.CHUNK_TOKENS)
+        parser.add_argument("--overlap", type=int, default=chunking.CHUNK_OVERLAP)
+        parser.add_argument("--repeat", type=int, default=3)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        documents = []
+        for path in options["files"]:
+            if path.lower().endswith(".pdf"):
+                documents.append(list(utils.iter_pdf_pages(path)))
+            else:
+                with open(path, encoding="utf-8") as f:
+                    documents.append([f.read()])
+        if not documents:
+            documents.append(synthetic_pages(options["pages"], options["seed"]))
+
+        size, overlap = options["size"], options["overlap"]
+        total_tokens = sum(chunking.count_tokens("".join(pages)) for pages in documents)
+        self.stdout.write(f"{len(documents)} document(s), {total_tokens} tokens, chunk size {size}, overlap {overlap}")
+
+        runs = {
+            "token (pages)": lambda pages: list(chunking.chunk_pages(pages, size=size, overlap=overlap)),
+            "token (text)": lambda pages: chunking.chunk_text("".join(pages), size=size, overlap=overlap),
+            "legacy": lambda pages: legacy_chunks("".join(pages)),
+        }
+        for name, run in runs.items():
+            try:
+                self.report(name, run, documents, size, options["repeat"], total_tokens)
+            except ImportError as e:
+                self.stdout.write(f"{name:>14}: skipped ({e})")
+
+    def report(self, name, run, documents, size, repeat, total_tokens):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            chunks = [chunk for pages in documents for chunk in run(pages)]
+            timings.append(time.perf_counter() - start)
+        best = min(timings)
+        utilisation = np.array([chunking.count_tokens(chunk) / size for chunk in chunks])
+        self.stdout.write(
+            f"{name:>14}: {len(chunks):>5} chunks  {len(chunks) / best:>9.1f} chunks/s  {total_tokens / best:>11.0f} tokens/s  "
+            f"utilisation min {utilisation.min():.2f} p10 {np.percentile(utilisation, 10):.2f} "
+            f"p50 {np.percentile(utilisation, 50):.2f} p90 {np.percentile(utilisation, 90):.2f} "
+            f"max {utilisation.max():.2f} mean {utilisation.mean():.2f}"
+        )
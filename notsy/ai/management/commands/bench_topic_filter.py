@@ -0,0 +1,106 @@
+from django.core.management.base import BaseCommand
+from ai import utils
+import numpy as np
+import time
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare recall@k and latency of topic post-filtering against Pinecone "
+        "metadata filters as the number of topics in a namespace grows. "
+        "Uses synthetic vectors in a scratch namespace that is deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--topics", default="1,5,20,50", help="Comma separated topic counts to test")
+        parser.add_argument("--per-topic", type=int, default=20, help="Vectors per topic")
+        parser.add_argument("--queries", type=int, default=20, help="Queries per topic count")
+        parser.add_argument("--top-k", type=int, default=5)
+        parser.add_argument("--namespace", default="bench-topic-filter")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        index = utils.initialize_pincone()
+        dimension = index.describe_index_stats().get("dimension")
+        rng = np.random.default_rng(options["seed"])
+        namespace = options["namespace"]
+        top_k = options["top_k"]
+
+        self.stdout.write(f"{'topics':>8} {'post recall':>12} {'filter recall':>14} {'post p50 ms':>12} {'filter p50 ms':>14} {'post p95 ms':>12} {'filter p95 ms':>14}")
+        try:
+            for n_topics in [int(n) for n in options["topics"].split(",")]:
+                vectors, topic_ids = self.populate(index, namespace, n_topics, options["per_topic"], dimension, rng)
+                row = self.measure(index, namespace, vectors, topic_ids, options["queries"], top_k, rng)
+                self.stdout.write(
+                    f"{n_topics:>8} {row['post_recall']:>12.3f} {row['filter_recall']:>14.3f} "
+                    f"{row['post_p50']:>12.1f} {row['filter_p50']:>14.1f} {row['post_p95']:>12.1f} {row['filter_p95']:>14.1f}"
+                )
+                index.delete(delete_all=True, namespace=namespace)
+        finally:
+            try:
+                index.delete(delete_all=True, namespace=namespace)
+            except Exception:
+                pass
+
+    def populate(self, index, namespace, n_topics, per_topic, dimension, rng):
+        # Each topic is a cluster around its own random centroid
+        centroids = rng.normal(size=(n_topics, dimension))
+        vectors = np.repeat(centroids, per_topic, axis=0) + 0.8 * rng.normal(size=(n_topics * per_topic, dimension))
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        topic_ids = np.repeat(np.arange(n_topics), per_topic)
+
+        records = [
+            {
+                "id": f"bench-{i}",
+                "values": vectors[i].tolist(),
+                "metadata": {"topic_id": f"topic-{topic_ids[i]}", "user_id": "bench"},
+            }
+            for i in range(len(vectors))
+        ]
+        for start in range(0, len(records), utils.UPSERT_BATCH_SIZE):
+            utils.upsert_batch(index, records[start:start + utils.UPSERT_BATCH_SIZE], namespace)
+
+        # Wait for the writes to become visible to queries
+        deadline = time.time() + 60
+        while time.time() < deadline:
+            count = index.describe_index_stats().get("namespaces", {}).get(namespace, {}).get("vector_count", 0)
+            if count >= len(records):
+                break
+            time.sleep(1)
+        return vectors, topic_ids
+
+    def measure(self, index, namespace, vectors, topic_ids, n_queries, top_k, rng):
+        post_recall, filter_recall, post_times, filter_times = [], [], [], []
+        for _ in range(n_queries):
+            topic = rng.integers(topic_ids.max() + 1)
+            query = vectors[rng.choice(np.flatnonzero(topic_ids == topic))] + 0.3 * rng.normal(size=vectors.shape[1])
+            query /= np.linalg.norm(query)
+
+            # Ground truth: exact top_k by cosine within the topic
+            in_topic = np.flatnonzero(topic_ids == topic)
+            scores = vectors[in_topic] @ query
+            truth = {f"bench-{i}" for i in in_topic[np.argsort(-scores)[:top_k]]}
+
+            start = time.perf_counter()
+            answer = index.query(vector=query.tolist(), top_k=top_k, include_metadata=True, namespace=namespace)
+            post_times.append((time.perf_counter() - start) * 1000)
+            kept = {m["id"] for m in answer.get("matches", []) if m.get("metadata", {}).get("topic_id") == f"topic-{topic}"}
+            post_recall.append(len(kept & truth) / len(truth))
+
+            start = time.perf_counter()
+            answer = index.query(
+                vector=query.tolist(), top_k=top_k, include_metadata=True, namespace=namespace,
+                filter=utils.topic_filter("bench", f"topic-{topic}"),
+            )
+            filter_times.append((time.perf_counter() - start) * 1000)
+            kept = {m["id"] for m in answer.get("matches", [])}
+            filter_recall.append(len(kept & truth) / len(truth))
+
+        return {
+            "post_recall": float(np.mean(post_recall)),
+            "filter_recall": float(np.mean(filter_recall)),
+            "post_p50": float(np.percentile(post_times, 50)),
+            "filter_p50": float(np.percentile(filter_times, 50)),
+            "post_p95": float(np.percentile(post_times, 95)),
+            "filter_p95": float(np.percentile(filter_times, 95)),
+        }
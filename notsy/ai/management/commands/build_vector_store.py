@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand, CommandError
+from ai import corpus, utils, vectorstore, scheduler
+import time
+
+FETCH_BATCH = 100
+
+
+class Command(BaseCommand):
+    help = (
+        "Build local memory-mapped vector namespaces (see ai/vectorstore.py), copied from "
+        "Pinecone or embedded again from the corpus CSVs, and optionally time local queries."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("namespaces", nargs="*", default=vectorstore.VECTOR_STORE_LOCAL)
+        parser.add_argument("--source", choices=["pinecone", "corpus"], default="pinecone",
+                            help="Copy vectors from Pinecone, or embed the corpus texts")
+        parser.add_argument("--hnsw", action="store_true", default=None, help="Force an HNSW graph")
+        parser.add_argument("--exact", action="store_false", dest="hnsw", help="Never build an HNSW graph")
+        parser.add_argument("--bench", type=int, default=20, help="Local queries to time afterwards, 0 to skip")
+
+    def handle(self, *args, **options):
+        for namespace in options["namespaces"]:
+            start = time.perf_counter()
+            if options["source"] == "pinecone":
+                records = self.from_pinecone(namespace)
+            else:
+                if not corpus.has_corpus(namespace):
+                    raise CommandError(f"No corpus CSV for namespace {namespace}")
+                records = self.from_corpus(namespace)
+            with scheduler.prioritized("background"):
+                count = vectorstore.write_namespace(namespace, records, hnsw=options["hnsw"])
+            self.stdout.write(f"{namespace}: {count} vectors in {time.perf_counter() - start:.1f}s")
+            if options["bench"] and count:
+                self.bench(namespace, options["bench"])
+
+    def from_pinecone(self, namespace):
+        index = utils.initialize_pincone()
+        for ids in index.list(namespace=namespace):
+            for start in range(0, len(ids), FETCH_BATCH):
+                fetched = index.fetch(ids=ids[start:start + FETCH_BATCH], namespace=namespace)
+                for vector_id, vector in fetched.vectors.items():
+                    yield {"id": vector_id, "values": vector.values, "metadata": vector.metadata or {}}
+
+    def from_corpus(self, namespace):
+        # gfg is keyed by url, openai-ref by id; resolve_matches reads them back the same way
+        client = utils.initialize_openai_client()
+        _, key_column = corpus.CORPORA[namespace]
+        rows = ((key, utils.chunking.truncate(text)) for key, text in corpus.iter_texts(namespace) if text)
+        for batch in utils.pack_batches(rows, key=lambda row: row[1]):
+            embeddings = utils.embed_batch(client=client, texts=[text for _, text in batch])
+            for (key, _), embedding in zip(batch, embeddings):
+                yield {"id": key, "values": embedding, "metadata": {"url": key} if key_column == "url" else {}}
+
+    def bench(self, namespace, n_queries):
+        store = vectorstore.LocalStore()
+        ns = store.namespace(namespace)
+        timings = []
+        for row in range(min(n_queries, len(ns.ids))):
+            query = ns.vectors[(row * 7919) % len(ns.ids)]
+            start = time.perf_counter()
+            store.query(query, namespace, 5)
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        self.stdout.write(
+            f"{namespace}: {'hnsw' if ns.hnsw is not None else 'exact'} search "
+            f"p50 {timings[len(timings) // 2]:.2f} ms, max {timings[-1]:.2f} ms over {len(timings)} queries"
+        )
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+from ai import ingest
+import threading
+import signal
+
+
+class Command(BaseCommand):
+    help = "Run upload/ ingestion workers. Several worker processes can share the same queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--concurrency", type=int, default=ingest.INGEST_CONCURRENCY, help="Files processed at once by this process")
+
+    def handle(self, *args, **options):
+        requeued = ingest.requeue_stale()
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} interrupted file(s)")
+        stop = threading.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *_: stop.set())
+        self.stdout.write(f"Ingest worker running with concurrency {options['concurrency']}")
+        ingest.run_workers(options["concurrency"], stop=stop)
@@ -0,0 +1,309 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from ai import fakes
+import numpy as np
+import subprocess
+import threading
+import requests
+import tempfile
+import shutil
+import json
+import time
+import sys
+import os
+
+# Endpoint -> request body for the i-th request. Texts vary per request so the
+# embedding and response caches do not turn the run into a cache benchmark.
+HISTORY = [
+    {"role": "user" if i % 2 == 0 else "assistant", "content": fakes.fake_text(60, seed=i)}
+    for i in range(10)
+]
+SCENARIOS = {
+    "respond": ("respond/", lambda i: {
+        "messages": HISTORY, "summary": [], "user_query": f"Explain topic {i} with an example",
+        "topicId": "loadtest-topic", "userId": "loadtest", "modeId": "0",
+    }),
+    "querry": ("querry/", lambda i: {"text": f"binary search variant {i}", "namespace": "loadtest", "top_k": 3}),
+    "notes": ("notes/", lambda i: {
+        "messages": HISTORY + [{"role": "user", "content": f"q{i}"}, {"role": "assistant", "content": f"a{i}"}],
+        "summary": [], "topicId": "loadtest-topic", "userId": "loadtest",
+    }),
+    "study_pack": ("study_pack/", lambda i: {
+        "messages": HISTORY + [{"role": "user", "content": f"q{i}"}, {"role": "assistant", "content": f"a{i}"}],
+        "summary": [], "topicId": "loadtest-topic", "userId": "loadtest", "stream": False,
+    }),
+    "upload": ("upload/", lambda i: {
+        "type": "video", "source": [f"https://example.com/video/{i}"], "content": [fakes.fake_text(2000, seed=i)],
+        "topicId": "loadtest-topic", "userId": "loadtest",
+    }),
+}
+ASYNC_PATHS = {
+    "respond": "async/respond/", "querry": "async/querry/", "notes": "async/notes/", "study_pack": "async/study_pack/",
+}
+# Scenarios that return 202 with a job id; their latency runs until upload/<jobId>/ reports the job finished
+JOB_SCENARIOS = {"upload"}
+JOB_POLL_SECONDS = 0.2
+
+
+def process_tree(pid):
+    # pid and all its descendants (Linux /proc)
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    tree, stack = [], [pid]
+    while stack:
+        current = stack.pop()
+        tree.append(current)
+        stack.extend(children.get(current, []))
+    return tree
+
+
+def rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class MemorySampler(threading.Thread):
+    def __init__(self, pid, interval=0.5):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.interval = interval
+        self.peak = {}
+        self.stop = threading.Event()
+
+    def run(self):
+        if not os.path.isdir("/proc"):
+            return
+        while not self.stop.is_set():
+            for pid in process_tree(self.pid):
+                rss = rss_mb(pid)
+                if rss is not None:
+                    self.peak[pid] = max(self.peak.get(pid, 0), rss)
+            self.stop.wait(self.interval)
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the AI endpoints against local fake OpenAI and Pinecone services. "
+        "The server it starts uses a scratch SQLite database and an in-process cache, not the app's own. "
+        "Reports p50/p95/p99 latency, requests per second and peak memory per worker, "
+        "and exits non-zero when a --baseline report is exceeded."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scenarios", default="respond,querry,notes,upload")
+        parser.add_argument("--requests", type=int, default=200, help="Requests per scenario")
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument("--warmup", type=int, default=5)
+        parser.add_argument("--server", choices=["runserver", "uvicorn"], default="uvicorn")
+        parser.add_argument("--workers", type=int, default=2, help="uvicorn worker processes")
+        parser.add_argument("--async-views", action="store_true", help="Use the async/ endpoints where they exist")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--url", help="Drive an already running server instead (it must point at the fakes "
+                                               "and at a database and cache it is fine to fill with test data)")
+        parser.add_argument("--cache-url", default="locmem://loadtest",
+                            help="CACHE_URL for the server, e.g. a spare Redis db such as redis://127.0.0.1:6379/15 "
+                                 "to share the cache across workers; never the app's own")
+        parser.add_argument("--job-timeout", type=float, default=120, help="Seconds to wait for an upload job to finish")
+        parser.add_argument("--openai-latency", type=float, default=0.3, help="Seconds per OpenAI call")
+        parser.add_argument("--pinecone-latency", type=float, default=0.03, help="Seconds per Pinecone call")
+        parser.add_argument("--jitter", type=float, default=0.0, help="Extra uniform random delay, seconds")
+        parser.add_argument("--output-words", type=int, default=200, help="Words per generated answer")
+        parser.add_argument("--dimension", type=int, default=3072)
+        parser.add_argument("--output", help="Write the report as JSON")
+        parser.add_argument("--baseline", help="Earlier --output report to compare against")
+        parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative regression")
+
+    def handle(self, *args, **options):
+        openai = fakes.serve_openai(fakes.FakeConfig(
+            latency=options["openai_latency"], jitter=options["jitter"],
+            output_words=options["output_words"], dimension=options["dimension"],
+        ))
+        pinecone = fakes.serve_pinecone(fakes.FakeConfig(
+            latency=options["pinecone_latency"], jitter=options["jitter"], dimension=options["dimension"],
+        ))
+        self.stdout.write(f"fake OpenAI at {openai.url}, fake Pinecone at {pinecone.url}")
+
+        server = None
+        base_url = options["url"]
+        scratch = tempfile.mkdtemp(prefix="notsy-loadtest-")
+        try:
+            if not base_url:
+                server = self.start_server(options, openai.url, pinecone.url, scratch)
+                base_url = f"http://127.0.0.1:{options['port']}/"
+            self.wait_ready(base_url, server)
+            sampler = MemorySampler(server.pid) if server else None
+            if sampler:
+                sampler.start()
+            report = {"options": {k: options[k] for k in (
+                "requests", "concurrency", "server", "workers", "async_views",
+                "openai_latency", "pinecone_latency", "output_words",
+            )}, "scenarios": {}}
+            for name in [s for s in options["scenarios"].split(",") if s]:
+                if name not in SCENARIOS:
+                    raise CommandError(f"Unknown scenario {name}, choose from {', '.join(SCENARIOS)}")
+                report["scenarios"][name] = self.run_scenario(base_url, name, options)
+            if sampler:
+                sampler.stop.set()
+                sampler.join()
+                report["memory_mb"] = {str(pid): round(mb, 1) for pid, mb in sorted(sampler.peak.items())}
+                report["max_worker_rss_mb"] = round(max(sampler.peak.values()), 1) if sampler.peak else None
+        finally:
+            if server:
+                server.terminate()
+                try:
+                    server.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    server.kill()
+            openai.shutdown()
+            pinecone.shutdown()
+            shutil.rmtree(scratch, ignore_errors=True)
+
+        self.print_report(report)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(report, f, indent=2)
+        if options["baseline"]:
+            self.compare(report, options["baseline"], options["tolerance"])
+
+    def start_server(self, options, openai_url, pinecone_url, scratch):
+        # Jobs, manifests and cache entries from the run go to scratch storage that is
+        # deleted afterwards, never to the app's database or Redis
+        env = dict(
+            os.environ,
+            OPENAI_BASE_URL=f"{openai_url}/v1",
+            OPENAI_API_KEY="loadtest",
+            PINE_API_KEY="loadtest",
+            PINE_HOST=pinecone_url,
+            SQLITE_PATH=os.path.join(scratch, "db.sqlite3"),
+            CACHE_URL=options["cache_url"],
+            INGEST_SPOOL_DIR=os.path.join(scratch, "ingest"),
+            ATTACHMENT_CACHE_DIR=os.path.join(scratch, "attachments"),
+        )
+        # Upload jobs have to be processed for their latency to mean anything
+        env.setdefault("INGEST_INLINE_WORKERS", "1")
+        cwd = str(settings.BASE_DIR)
+        subprocess.run([sys.executable, "manage.py", "migrate", "--noinput", "-v", "0"], cwd=cwd, env=env, check=True)
+        if options["server"] == "uvicorn":
+            command = [
+                sys.executable, "-m", "uvicorn", "config.asgi:application",
+                "--port", str(options["port"]), "--workers", str(options["workers"]), "--log-level", "warning",
+            ]
+        else:
+            command = [sys.executable, "manage.py", "runserver", "--noreload", f"127.0.0.1:{options['port']}"]
+        return subprocess.Popen(command, cwd=cwd, env=env, stdout=subprocess.DEVNULL)
+
+    def wait_ready(self, base_url, server, timeout=60):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server and server.poll() is not None:
+                raise CommandError(f"Server exited with code {server.returncode}")
+            try:
+                if requests.get(base_url, timeout=2).status_code == 200:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.5)
+        raise CommandError(f"Server at {base_url} did not come up within {timeout}s")
+
+    def run_scenario(self, base_url, name, options):
+        path, payload = SCENARIOS[name]
+        if options["async_views"] and name in ASYNC_PATHS:
+            path = ASYNC_PATHS[name]
+        url = base_url.rstrip("/") + "/" + path
+        local = threading.local()
+
+        def call(i):
+            session = getattr(local, "session", None)
+            if session is None:
+                session = local.session = requests.Session()
+            start = time.perf_counter()
+            try:
+                response = session.post(url, json=payload(i), timeout=300)
+                ok = response.status_code < 400
+                if ok and name in JOB_SCENARIOS:
+                    ok = self.wait_job(session, url + response.json()["jobId"] + "/", options["job_timeout"])
+            except (requests.RequestException, KeyError, ValueError):
+                ok = False
+            return time.perf_counter() - start, ok
+
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            list(pool.map(call, range(-options["warmup"], 0)))
+            start = time.perf_counter()
+            results = list(pool.map(call, range(options["requests"])))
+            elapsed = time.perf_counter() - start
+
+        latencies = np.array([seconds for seconds, _ in results]) * 1000
+        errors = sum(1 for _, ok in results if not ok)
+        return {
+            "measures": "job completion" if name in JOB_SCENARIOS else "response",
+            "requests": len(results),
+            "errors": errors,
+            "error_rate": round(errors / len(results), 4) if results else 0.0,
+            "rps": round(len(results) / elapsed, 2) if elapsed else None,
+            "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 1),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 1),
+        }
+
+    def wait_job(self, session, status_url, timeout):
+        # True once the job finished with every file ingested
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            state = session.get(status_url, timeout=30).json().get("status")
+            if state not in ("queued", "running"):
+                return state == "done"
+            time.sleep(JOB_POLL_SECONDS)
+        return False
+
+    def print_report(self, report):
+        self.stdout.write(f"{'scenario':>10} {'requests':>9} {'errors':>7} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+        for name, row in report["scenarios"].items():
+            self.stdout.write(
+                f"{name:>10} {row['requests']:>9} {row['errors']:>7} {row['rps']:>8} "
+                f"{row['p50_ms']:>9} {row['p95_ms']:>9} {row['p99_ms']:>9}"
+            )
+        timed_jobs = [name for name, row in report["scenarios"].items() if row["measures"] == "job completion"]
+        if timed_jobs:
+            self.stdout.write(f"{', '.join(timed_jobs)}: latency is from the request until the ingest job finished")
+        if report.get("memory_mb"):
+            per_pid = ", ".join(f"{pid}: {mb} MB" for pid, mb in report["memory_mb"].items())
+            self.stdout.write(f"peak RSS per process: {per_pid}")
+
+    def compare(self, report, baseline_path, tolerance):
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        failures = []
+        for name, row in report["scenarios"].items():
+            base = baseline.get("scenarios", {}).get(name)
+            # Reports from before upload timing covered the whole job only timed the enqueue
+            if not base or base.get("measures", "response") != row["measures"]:
+                continue
+            if row["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+                failures.append(f"{name}: p95 {row['p95_ms']} ms vs baseline {base['p95_ms']} ms")
+            if row["p99_ms"] > base["p99_ms"] * (1 + tolerance):
+                failures.append(f"{name}: p99 {row['p99_ms']} ms vs baseline {base['p99_ms']} ms")
+            if base["rps"] and row["rps"] < base["rps"] * (1 - tolerance):
+                failures.append(f"{name}: {row['rps']} rps vs baseline {base['rps']} rps")
+            if row["error_rate"] > base["error_rate"]:
+                failures.append(f"{name}: error rate {row['error_rate']} vs baseline {base['error_rate']}")
+        if report.get("max_worker_rss_mb") and baseline.get("max_worker_rss_mb"):
+            if report["max_worker_rss_mb"] > baseline["max_worker_rss_mb"] * (1 + tolerance):
+                failures.append(f"peak worker RSS {report['max_worker_rss_mb']} MB vs baseline {baseline['max_worker_rss_mb']} MB")
+        if failures:
+            raise CommandError("Regression against baseline:\n  " + "\n  ".join(failures))
+        self.stdout.write(f"No regression against {baseline_path} (tolerance {tolerance:.0%})")
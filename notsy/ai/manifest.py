@@ -0,0 +1,89 @@
+from .models import ChunkManifest
+import hashlib
+
+# Local record of which chunks each Pinecone namespace already holds, so
+# ingestion only embeds chunks it has not seen before. It also keeps the chunk
+# text, which query() reads back by vector id.
+
+LOOKUP_BATCH = 256
+
+
+def chunk_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def vector_id(topic_id, digest):
+    return f"vec-{topic_id}-{digest[:40]}"
+
+
+def _key(namespace):
+    return namespace or ""
+
+
+def hashed(chunks, topic_id):
+    # Yields {"id", "hash", "text"} for each chunk text, lazily
+    for text in chunks:
+        digest = chunk_hash(text)
+        yield {"id": vector_id(topic_id, digest), "hash": digest, "text": text}
+
+
+def unseen(group, namespace, seen=None, stats=None):
+    # The items of one embedding batch that are not in the namespace yet, with one query;
+    # seen carries ids already taken by earlier batches, the rest are counted in stats["skipped"]
+    seen = set() if seen is None else seen
+    ids = [item["id"] for item in group]
+    existing = set()
+    for start in range(0, len(ids), LOOKUP_BATCH):
+        existing.update(
+            ChunkManifest.objects.filter(
+                namespace=_key(namespace), vector_id__in=ids[start:start + LOOKUP_BATCH]
+            ).values_list("vector_id", flat=True)
+        )
+    fresh = []
+    for item in group:
+        if item["id"] in existing or item["id"] in seen:
+            if stats is not None:
+                stats["skipped"] = stats.get("skipped", 0) + 1
+            continue
+        seen.add(item["id"])
+        fresh.append(item)
+    return fresh
+
+
+def record(namespace, vectors, metadata, chunks=None):
+    # Called once the vectors are upserted; chunks maps vector id -> {"hash", "text"}
+    chunks = chunks or {}
+    ChunkManifest.objects.bulk_create(
+        [
+            ChunkManifest(
+                namespace=_key(namespace),
+                vector_id=vector["id"],
+                chunk_hash=chunks.get(vector["id"], {}).get("hash") or vector["id"].rsplit("-", 1)[-1],
+                topic_id=metadata["topic_id"],
+                url=metadata.get("url", ""),
+                text=chunks.get(vector["id"], {}).get("text", ""),
+            )
+            for vector in vectors
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def texts(namespace, vector_ids):
+    # {vector_id: text} for the ids the manifest has text for, one query per LOOKUP_BATCH ids
+    vector_ids = [vector_id for vector_id in dict.fromkeys(vector_ids) if vector_id]
+    found = {}
+    for start in range(0, len(vector_ids), LOOKUP_BATCH):
+        rows = ChunkManifest.objects.filter(
+            namespace=_key(namespace), vector_id__in=vector_ids[start:start + LOOKUP_BATCH]
+        ).exclude(text="").values_list("vector_id", "text")
+        found.update(rows)
+    return found
+
+
+def forget(namespace, vector_ids=None):
+    # Drop manifest rows after their vectors are deleted from Pinecone
+    rows = ChunkManifest.objects.filter(namespace=_key(namespace))
+    if vector_ids is not None:
+        rows = rows.filter(vector_id__in=list(vector_ids))
+    return rows.delete()[0]
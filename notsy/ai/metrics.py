@@ -0,0 +1,276 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from . import clients
+import functools
+import threading
+import bisect
+import logging
+import inspect
+import time
+import uuid
+import re
+
+logger = logging.getLogger(__name__)
+
+# Per-process Prometheus metrics, timing spans and request ids for the AI pipeline.
+# Each worker process exposes its own series on /metrics; scrape every worker, or
+# aggregate with a pid label on the Prometheus side.
+
+SPAN_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+REQUEST_ID_HEADER = "X-Request-ID"
+
+request_id = ContextVar("request_id", default="-")
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_help = {}
+# Extra gauges read at scrape time: name -> callable returning a dict of numbers
+_collectors = {}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def describe(name, text):
+    _help[name] = text
+
+
+def inc(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {"buckets": [0] * len(SPAN_BUCKETS), "sum": 0.0, "count": 0}
+        index = bisect.bisect_left(SPAN_BUCKETS, value)
+        if index < len(SPAN_BUCKETS):
+            histogram["buckets"][index] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+
+def register_collector(name, collect):
+    _collectors[name] = collect
+
+
+@contextmanager
+def span(name, detail=""):
+    # Times the block into notsy_span_seconds{span=name,detail=...}; failures are counted
+    # separately. Every call site uses the same two labels so the series stay comparable;
+    # detail is the model, store or format the stage ran with, when there is one.
+    labels = {"detail": str(detail)}
+    start = time.perf_counter()
+    failed = False
+    try:
+        yield
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        observe("notsy_span_seconds", elapsed, span=name, **labels)
+        if failed:
+            inc("notsy_span_errors_total", span=name, **labels)
+        logger.debug("span %s took %.1f ms%s", name, elapsed * 1000, " (failed)" if failed else "")
+
+
+def timed(name, detail=""):
+    # Decorator form of span() for plain and async functions
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name, detail):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, detail):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_usage(operation, model, usage):
+    # usage from a Responses API result (input/output tokens) or an embeddings result (prompt tokens)
+    if usage is None:
+        return
+    input_tokens = getattr(usage, "input_tokens", None)
+    if input_tokens is None:
+        input_tokens = getattr(usage, "prompt_tokens", 0)
+    output_tokens = getattr(usage, "output_tokens", 0) or 0
+    inc("notsy_openai_tokens_total", input_tokens or 0, operation=operation, model=model, kind="input")
+    if output_tokens:
+        inc("notsy_openai_tokens_total", output_tokens, operation=operation, model=model, kind="output")
+
+
+def _on_client_event(event, **fields):
+    if event == "openai_response":
+        # Collapse ids in paths such as /v1/responses/{id}
+        path = re.sub(r"/[A-Za-z]+_[A-Za-z0-9]+", "/{id}", fields["path"])
+        observe("notsy_openai_http_seconds", fields["seconds"], path=path, status=str(fields["status"]))
+    elif event == "client_created":
+        inc("notsy_clients_created_total", name=fields["name"])
+
+
+clients.add_metrics_hook(_on_client_event)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def render():
+    # Prometheus text exposition format 0.0.4
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((key, dict(h, buckets=list(h["buckets"]))) for key, h in _histograms.items())
+
+    typed = set()
+
+    def header(name, kind):
+        if name in typed:
+            return
+        typed.add(name)
+        if name in _help:
+            lines.append(f"# HELP {name} {_help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    for (name, labels), value in counters:
+        header(name, "counter")
+        lines.append(f"{name}{_labels(labels)} {value}")
+    for (name, labels), histogram in histograms:
+        header(name, "histogram")
+        cumulative = 0
+        for bound, count in zip(SPAN_BUCKETS, histogram["buckets"]):
+            cumulative += count
+            lines.append(f"{name}_bucket{_labels(labels, [('le', bound)])} {cumulative}")
+        lines.append(f"{name}_bucket{_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+        lines.append(f"{name}_sum{_labels(labels)} {histogram['sum']}")
+        lines.append(f"{name}_count{_labels(labels)} {histogram['count']}")
+    for source, collect in sorted(_collectors.items()):
+        try:
+            values = collect()
+        except Exception:
+            logger.exception("Metrics collector %s failed", source)
+            continue
+        for field, value in sorted(values.items()):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            name = f"notsy_{source}_{field}"
+            header(name, "gauge")
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class RequestIdFilter(logging.Filter):
+    # Adds %(request_id)s to every log record
+    def filter(self, record):
+        record.request_id = request_id.get()
+        return True
+
+
+def _route(request):
+    match = getattr(request, "resolver_match", None)
+    return match.route if match else "unmatched"
+
+
+class RequestMetricsMiddleware:
+    # Assigns the request id (taken from X-Request-ID when the caller sends one), echoes it
+    # back and times every request by route and status
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = inspect.iscoroutinefunction(get_response)
+        if self.is_async:
+            from asgiref.sync import markcoroutinefunction
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        token, start = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            request_id.reset(token)
+        return self._finish(request, response, start)
+
+    async def __acall__(self, request):
+        token, start = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_id.reset(token)
+        return self._finish(request, response, start)
+
+    def _start(self, request):
+        rid = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+        request.request_id = rid
+        return request_id.set(rid), time.perf_counter()
+
+    def _finish(self, request, response, start):
+        labels = {"route": _route(request), "method": request.method, "status": str(response.status_code)}
+        inc("notsy_http_requests_total", **labels)
+        response[REQUEST_ID_HEADER] = request.request_id
+        if response.streaming:
+            # Streams are timed until the last chunk is sent or the client goes away, and
+            # their body runs after __call__ reset the request id, so it is set again there
+            timed = _atimed if response.is_async else _timed
+            response.streaming_content = timed(response.streaming_content, start, labels, request.request_id)
+        else:
+            observe("notsy_http_request_seconds", time.perf_counter() - start, **labels)
+        return response
+
+
+def _reset(token):
+    try:
+        request_id.reset(token)
+    except ValueError:
+        # Closed from another context, e.g. by the garbage collector
+        pass
+
+
+def _timed(content, start, labels, rid):
+    token = request_id.set(rid)
+    try:
+        yield from content
+    finally:
+        observe("notsy_http_request_seconds", time.perf_counter() - start, **labels)
+        _reset(token)
+
+
+async def _atimed(content, start, labels, rid):
+    token = request_id.set(rid)
+    try:
+        async for chunk in content:
+            yield chunk
+    finally:
+        observe("notsy_http_request_seconds", time.perf_counter() - start, **labels)
+        _reset(token)
+
+
+describe("notsy_span_seconds", "Time spent in pipeline stages")
+describe("notsy_span_errors_total", "Pipeline stages that raised")
+describe("notsy_openai_tokens_total", "Tokens sent to and generated by OpenAI")
+describe("notsy_openai_http_seconds", "OpenAI HTTP round trips")
+describe("notsy_http_request_seconds", "Django request latency")
+describe("notsy_http_requests_total", "Django requests served")
@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChunkManifest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('namespace', models.CharField(max_length=255)),
+                ('vector_id', models.CharField(max_length=512)),
+                ('chunk_hash', models.CharField(max_length=64)),
+                ('topic_id', models.CharField(max_length=255)),
+                ('url', models.CharField(blank=True, default='', max_length=2048)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('namespace', 'vector_id'), name='unique_manifest_vector')],
+            },
+        ),
+    ]
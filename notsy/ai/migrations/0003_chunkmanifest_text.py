@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai', '0002_chunkmanifest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunkmanifest',
+            name='text',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
@@ -0,0 +1,32 @@
+import json
+from django.db import migrations, models
+
+
+def encode_topic_ids(apps, schema_editor):
+    # Existing values are plain strings, store them as JSON strings before the type change
+    IngestJob = apps.get_model('ai', 'IngestJob')
+    for job in IngestJob.objects.all().only('id', 'topic_id'):
+        IngestJob.objects.filter(pk=job.pk).update(topic_id=json.dumps(job.topic_id))
+
+
+def decode_topic_ids(apps, schema_editor):
+    IngestJob = apps.get_model('ai', 'IngestJob')
+    for job in IngestJob.objects.all().only('id', 'topic_id'):
+        value = json.loads(job.topic_id)
+        IngestJob.objects.filter(pk=job.pk).update(topic_id=value if isinstance(value, str) else json.dumps(value))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai', '0003_chunkmanifest_text'),
+    ]
+
+    operations = [
+        migrations.RunPython(encode_topic_ids, decode_topic_ids),
+        migrations.AlterField(
+            model_name='ingestjob',
+            name='topic_id',
+            field=models.JSONField(),
+        ),
+    ]
@@ -1,3 +1,86 @@
 from django.db import models
+import uuid
 
 # Create your models here.
+
+class IngestJob(models.Model):
+    # One upload/ request; its files are processed by the ingest workers (see ingest.py)
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    data_type = models.CharField(max_length=16)
+    user_id = models.CharField(max_length=255, null=True, blank=True)
+    # As sent by the client (string or number), it is copied into the vector metadata
+    # and has to compare equal to the topicId the chat requests filter on
+    topic_id = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def status(self):
+        statuses = {f.status for f in self.files.all()}
+        # A job with no files has nothing left to do
+        if not statuses:
+            return "done"
+        if statuses & {IngestFile.QUEUED, IngestFile.RUNNING}:
+            return "running" if statuses - {IngestFile.QUEUED} else "queued"
+        if statuses == {IngestFile.DONE}:
+            return "done"
+        if IngestFile.DONE in statuses:
+            return "partial"
+        return "failed"
+
+
+class IngestFile(models.Model):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [(s, s) for s in (QUEUED, RUNNING, DONE, FAILED)]
+
+    job = models.ForeignKey(IngestJob, related_name="files", on_delete=models.CASCADE)
+    kind = models.CharField(max_length=16)
+    name = models.CharField(max_length=1024)
+    url = models.CharField(max_length=2048)
+    # Spooled upload for PDFs, transcript text for videos
+    path = models.CharField(max_length=1024, blank=True, default="")
+    text = models.TextField(blank=True, default="")
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=QUEUED, db_index=True)
+    error = models.TextField(blank=True, default="")
+    chunks_done = models.IntegerField(default=0)
+    embed_requests = models.IntegerField(default=0)
+    upsert_requests = models.IntegerField(default=0)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Refreshed by the worker while the file is running, see ingest.requeue_stale
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["created_at", "id"]
+
+    @property
+    def seconds(self):
+        if not self.started_at:
+            return None
+        from django.utils import timezone
+        return ((self.finished_at or timezone.now()) - self.started_at).total_seconds()
+
+    @property
+    def chunks_per_second(self):
+        seconds = self.seconds
+        return round(self.chunks_done / seconds, 2) if seconds else None
+
+
+class ChunkManifest(models.Model):
+    # Chunks already embedded and upserted, per Pinecone namespace ("" for the default one)
+    namespace = models.CharField(max_length=255)
+    vector_id = models.CharField(max_length=512)
+    chunk_hash = models.CharField(max_length=64)
+    topic_id = models.CharField(max_length=255)
+    url = models.CharField(max_length=2048, blank=True, default="")
+    # Exact chunk text, looked up by vector id at query time instead of riding in Pinecone metadata
+    text = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["namespace", "vector_id"], name="unique_manifest_vector"),
+        ]
@@ -0,0 +1,88 @@
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from PyPDF2 import PdfReader
+import multiprocessing
+import threading
+import tempfile
+import shutil
+import mmap
+import os
+
+# PDFs with more pages than this are parsed across a process pool
+PDF_PARALLEL_PAGES = int(os.getenv('PDF_PARALLEL_PAGES', 40))
+PDF_PAGES_PER_TASK = int(os.getenv('PDF_PAGES_PER_TASK', 16))
+PDF_WORKERS = int(os.getenv('PDF_WORKERS', max(1, (os.cpu_count() or 2) - 1)))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    # Spawned, not forked: the web worker is multi-threaded and holds open sockets
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(
+                    max_workers=PDF_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _pool
+
+
+@contextmanager
+def spooled(file):
+    # Yields a filesystem path for an uploaded file or path, writing in-memory uploads to disk
+    if isinstance(file, (str, os.PathLike)):
+        yield os.fspath(file)
+        return
+    if hasattr(file, "temporary_file_path"):
+        yield file.temporary_file_path()
+        return
+    tmp = tempfile.NamedTemporaryFile(suffix=".pdf", delete=False)
+    try:
+        with tmp:
+            if hasattr(file, "chunks"):
+                for chunk in file.chunks():
+                    tmp.write(chunk)
+            else:
+                file.seek(0)
+                shutil.copyfileobj(file, tmp)
+        yield tmp.name
+    finally:
+        os.unlink(tmp.name)
+
+
+@contextmanager
+def _mapped_reader(path):
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield PdfReader(mm)
+
+
+def _extract_range(path, start, stop):
+    # Runs in a pool process; each worker maps the same file instead of receiving its bytes
+    with _mapped_reader(path) as reader:
+        return [reader.pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def iter_pdf_pages(file):
+    # Yields the text of each page in order, as soon as it is available
+    with spooled(file) as path:
+        with _mapped_reader(path) as reader:
+            n_pages = len(reader.pages)
+            if n_pages <= PDF_PARALLEL_PAGES:
+                for page in reader.pages:
+                    yield page.extract_text() or ""
+                return
+        pool = _get_pool()
+        futures = [
+            pool.submit(_extract_range, path, start, min(start + PDF_PAGES_PER_TASK, n_pages))
+            for start in range(0, n_pages, PDF_PAGES_PER_TASK)
+        ]
+        try:
+            for future in futures:
+                yield from future.result()
+        finally:
+            for future in futures:
+                future.cancel()
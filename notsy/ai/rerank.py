@@ -0,0 +1,109 @@
+from collections import Counter
+from . import corpus
+import numpy as np
+import os
+
+# Second retrieval stage: the vector store over-fetches candidates, which are rescored
+# with a mix of cosine similarity and BM25 and then picked with maximal marginal
+# relevance, so the few RAG slots in the prompt do not go to near-duplicate chunks.
+
+# 0 turns the second stage off: the store is asked for exactly top_k and its order is kept
+RERANK_ENABLED = os.getenv('RERANK_ENABLED', '1') == '1'
+RERANK_OVERFETCH = int(os.getenv('RERANK_OVERFETCH', 4))
+RERANK_MAX_CANDIDATES = int(os.getenv('RERANK_MAX_CANDIDATES', 40))
+# Weight of cosine similarity against BM25 in the relevance score
+RERANK_ALPHA = float(os.getenv('RERANK_ALPHA', 0.7))
+# MMR trade-off: 1.0 is pure relevance, lower values favour diversity
+MMR_LAMBDA = float(os.getenv('MMR_LAMBDA', 0.7))
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def candidates(top_k):
+    # How many matches to fetch from the store for top_k results
+    if not RERANK_ENABLED or RERANK_OVERFETCH <= 1:
+        return top_k
+    return max(top_k, min(top_k * RERANK_OVERFETCH, RERANK_MAX_CANDIDATES))
+
+
+def _minmax(scores):
+    spread = scores.max() - scores.min() if len(scores) else 0.0
+    if spread <= 0:
+        return np.ones_like(scores) if len(scores) and scores.max() > 0 else np.zeros_like(scores)
+    return (scores - scores.min()) / spread
+
+
+def bm25(query, texts, namespace=None):
+    # BM25 of every text for the query, with corpus-wide statistics for the reference
+    # corpora and statistics over the candidates themselves elsewhere
+    query_terms = sorted(set(corpus.terms(query or "")))
+    if not query_terms or not texts:
+        return np.zeros(len(texts))
+    column = {term: j for j, term in enumerate(query_terms)}
+    tf = np.zeros((len(texts), len(query_terms)))
+    lengths = np.zeros(len(texts))
+    for i, text in enumerate(texts):
+        doc_terms = corpus.terms(text)
+        lengths[i] = len(doc_terms)
+        for term, count in Counter(t for t in doc_terms if t in column).items():
+            tf[i, column[term]] = count
+
+    stats = corpus.term_stats(namespace, query_terms) if namespace else None
+    if stats:
+        n_docs, avg_len, df = stats
+        df = np.array([df.get(term, 0) for term in query_terms], dtype=float)
+    else:
+        n_docs, avg_len = len(texts), lengths.mean()
+        df = (tf > 0).sum(axis=0).astype(float)
+    idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / (avg_len or 1.0))
+    return (idf * tf * (BM25_K1 + 1) / (tf + norm[:, None])).sum(axis=1)
+
+
+def _similarity(docs, vectors):
+    # Pairwise similarity of the candidates: embeddings when the store returned them,
+    # otherwise cosine over their term counts
+    if vectors is not None:
+        matrix = np.asarray(vectors, dtype=np.float32)
+    else:
+        vocabulary = {}
+        counts = [Counter(corpus.terms(doc.get("content", ""))) for doc in docs]
+        for count in counts:
+            for term in count:
+                vocabulary.setdefault(term, len(vocabulary))
+        matrix = np.zeros((len(docs), max(1, len(vocabulary))), dtype=np.float32)
+        for i, count in enumerate(counts):
+            for term, n in count.items():
+                matrix[i, vocabulary[term]] = n
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix = matrix / norms
+    return matrix @ matrix.T
+
+
+def mmr(relevance, similarity, k, lam=MMR_LAMBDA):
+    # Greedy maximal marginal relevance; returns the picked indices in order
+    n = len(relevance)
+    picked = []
+    max_sim = np.zeros(n)
+    available = np.ones(n, dtype=bool)
+    for _ in range(min(k, n)):
+        gain = np.where(available, lam * relevance - (1 - lam) * max_sim, -np.inf)
+        best = int(np.argmax(gain))
+        picked.append(best)
+        available[best] = False
+        max_sim = np.maximum(max_sim, similarity[best])
+    return picked
+
+
+def rerank(query, docs, top_k, namespace=None):
+    # docs from utils.resolve_matches, best vector score first; "values" is dropped from the output
+    vectors = [doc.pop("values", None) for doc in docs]
+    if len(docs) <= 1 or not RERANK_ENABLED:
+        return docs[:top_k]
+    vectors = vectors if all(v is not None and len(v) for v in vectors) else None
+    cosine = np.array([doc.get("score") or 0.0 for doc in docs], dtype=float)
+    lexical = bm25(query, [doc.get("content", "") for doc in docs], namespace)
+    relevance = RERANK_ALPHA * _minmax(cosine) + (1 - RERANK_ALPHA) * _minmax(lexical)
+    picked = mmr(relevance, _similarity(docs, vectors), top_k)
+    return [docs[i] for i in picked]
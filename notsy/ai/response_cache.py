@@ -0,0 +1,125 @@
+import asyncio
+import hashlib
+import logging
+import json
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# Content-addressed cache for deterministic LLM calls, stored in the Redis CACHES backend
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 7 * 24 * 3600))
+RESPONSE_LOCK_TIMEOUT = int(os.getenv('RESPONSE_LOCK_TIMEOUT', 120))
+RESPONSE_LOCK_POLL = float(os.getenv('RESPONSE_LOCK_POLL', 0.2))
+RESPONSE_CACHE_VERSION = 1
+
+_stats = {"hits": 0, "misses": 0, "waits": 0, "errors": 0}
+
+
+def make_key(request):
+    # request holds the model, input, text format (schema) and temperature of the call
+    payload = json.dumps(request, sort_keys=True, separators=(",", ":"), default=str)
+    digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    return f"llm:v{RESPONSE_CACHE_VERSION}:{digest}"
+
+
+def _cache():
+    from django.conf import settings
+    if not settings.configured:
+        return None
+    from django.core.cache import cache
+    return cache
+
+
+def cached_call(request, compute, ttl=RESPONSE_CACHE_TTL):
+    # Returns compute() for the request, sharing the result across workers.
+    # Only one caller computes a given key at a time; the others wait for its result.
+    key = make_key(request)
+    lock_key = f"{key}:lock"
+    try:
+        cache = _cache()
+        if cache is None:
+            return compute()
+        value = cache.get(key)
+        if value is not None:
+            _stats["hits"] += 1
+            return value
+        deadline = time.monotonic() + RESPONSE_LOCK_TIMEOUT
+        while not (locked := cache.add(lock_key, 1, timeout=RESPONSE_LOCK_TIMEOUT)):
+            _stats["waits"] += 1
+            time.sleep(RESPONSE_LOCK_POLL)
+            value = cache.get(key)
+            if value is not None:
+                _stats["hits"] += 1
+                return value
+            if time.monotonic() > deadline:
+                break
+    except Exception as e:
+        _stats["errors"] += 1
+        logger.warning("Response cache unavailable, calling model directly: %s", e)
+        return compute()
+
+    _stats["misses"] += 1
+    try:
+        value = compute()
+        try:
+            cache.set(key, value, timeout=ttl)
+        except Exception as e:
+            _stats["errors"] += 1
+            logger.warning("Failed to store cached response: %s", e)
+        return value
+    finally:
+        if locked:
+            try:
+                cache.delete(lock_key)
+            except Exception:
+                pass
+
+
+async def acached_call(request, acompute, ttl=RESPONSE_CACHE_TTL):
+    # Async counterpart of cached_call for the ASGI views
+    key = make_key(request)
+    lock_key = f"{key}:lock"
+    try:
+        cache = _cache()
+        if cache is None:
+            return await acompute()
+        value = await cache.aget(key)
+        if value is not None:
+            _stats["hits"] += 1
+            return value
+        deadline = time.monotonic() + RESPONSE_LOCK_TIMEOUT
+        while not (locked := await cache.aadd(lock_key, 1, timeout=RESPONSE_LOCK_TIMEOUT)):
+            _stats["waits"] += 1
+            await asyncio.sleep(RESPONSE_LOCK_POLL)
+            value = await cache.aget(key)
+            if value is not None:
+                _stats["hits"] += 1
+                return value
+            if time.monotonic() > deadline:
+                break
+    except Exception as e:
+        _stats["errors"] += 1
+        logger.warning("Response cache unavailable, calling model directly: %s", e)
+        return await acompute()
+
+    _stats["misses"] += 1
+    try:
+        value = await acompute()
+        try:
+            await cache.aset(key, value, timeout=ttl)
+        except Exception as e:
+            _stats["errors"] += 1
+            logger.warning("Failed to store cached response: %s", e)
+        return value
+    finally:
+        if locked:
+            try:
+                await cache.adelete(lock_key)
+            except Exception:
+                pass
+
+
+def stats():
+    lookups = _stats["hits"] + _stats["misses"]
+    return dict(_stats, hit_rate=round(_stats["hits"] / lookups, 4) if lookups else None)
@@ -0,0 +1,330 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from . import metrics
+import itertools
+import threading
+import asyncio
+import logging
+import random
+import heapq
+import openai
+import json
+import math
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# Admission control in front of every OpenAI call. Each call takes one request and an
+# estimate of its tokens from a per-model token bucket sized to the account's RPM/TPM
+# limits, so bursts queue here instead of coming back as 429s. Queued calls are
+# admitted by priority: interactive chat, then graph builds, then background work
+# (ingestion, summaries). Buckets are per worker process, so with several workers set
+# OPENAI_LIMIT_SHARE to 1/<workers>.
+
+# Set these to the account's rate limits; 0 (the default) leaves that limit off, and
+# calls still get the retries and 429 pauses below
+OPENAI_RPM = int(os.getenv('OPENAI_RPM', 0))
+OPENAI_TPM = int(os.getenv('OPENAI_TPM', 0))
+EMBEDDING_RPM = int(os.getenv('EMBEDDING_RPM', 0))
+EMBEDDING_TPM = int(os.getenv('EMBEDDING_TPM', 0))
+# Overrides as "model=rpm:tpm,model=rpm:tpm"
+OPENAI_MODEL_LIMITS = os.getenv('OPENAI_MODEL_LIMITS', '')
+OPENAI_LIMIT_SHARE = float(os.getenv('OPENAI_LIMIT_SHARE', 1.0))
+# Output tokens assumed for calls without max_output_tokens, until usage corrects it
+SCHEDULER_OUTPUT_ESTIMATE = int(os.getenv('SCHEDULER_OUTPUT_ESTIMATE', 1000))
+SCHEDULER_RETRIES = int(os.getenv('SCHEDULER_RETRIES', 4))
+SCHEDULER_BACKOFF_MAX = float(os.getenv('SCHEDULER_BACKOFF_MAX', 30))
+SCHEDULER_MAX_WAIT = float(os.getenv('SCHEDULER_MAX_WAIT', 300))
+SYNC_POLL = 0.25
+ASYNC_POLL = 0.05
+
+PRIORITIES = {"interactive": 0, "graph": 1, "background": 2}
+priority = ContextVar("openai_priority", default="interactive")
+
+_lock = threading.Lock()
+_buckets = {}
+_pid = None
+_sequence = itertools.count()
+_stats = {"admitted": 0, "retries": 0, "throttled": 0, "timeouts": 0}
+
+
+class SchedulerTimeout(Exception):
+    pass
+
+
+def _parse_limits(spec):
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        model, _, values = item.partition("=")
+        rpm, _, tpm = values.partition(":")
+        limits[model.strip()] = (int(rpm), int(tpm))
+    return limits
+
+
+_model_limits = _parse_limits(OPENAI_MODEL_LIMITS)
+
+
+def limits(model):
+    # (requests, tokens) per minute for this process
+    if model in _model_limits:
+        rpm, tpm = _model_limits[model]
+    elif str(model).startswith("text-embedding"):
+        rpm, tpm = EMBEDDING_RPM, EMBEDDING_TPM
+    else:
+        rpm, tpm = OPENAI_RPM, OPENAI_TPM
+    return _share(rpm), _share(tpm)
+
+
+def _share(limit):
+    # An unlimited bucket never runs dry, so calls are only ordered and paused on 429s
+    return max(1.0, limit * OPENAI_LIMIT_SHARE) if limit > 0 else math.inf
+
+
+class _Bucket:
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.requests = rpm
+        self.tokens = tpm
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        # Heap of (priority rank, sequence) tickets; only the head may be admitted
+        self.waiting = []
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+
+    def _refill(self, now):
+        elapsed = now - self.updated
+        self.updated = now
+        self.requests = min(self.rpm, self.requests + elapsed * self.rpm / 60)
+        self.tokens = min(self.tpm, self.tokens + elapsed * self.tpm / 60)
+
+    def _try(self, ticket, tokens, poll):
+        # With the lock held: 0 once admitted, otherwise seconds to wait before trying again
+        now = time.monotonic()
+        self._refill(now)
+        if self.waiting[0] != ticket:
+            return poll
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        # A request larger than the whole bucket goes through once the bucket is full
+        tokens = min(tokens, self.tpm)
+        missing_requests = max(0.0, 1 - self.requests)
+        missing_tokens = max(0.0, tokens - self.tokens)
+        if missing_requests or missing_tokens:
+            return max(missing_requests * 60 / self.rpm, missing_tokens * 60 / self.tpm, 0.001)
+        self.requests -= 1
+        self.tokens -= tokens
+        heapq.heappop(self.waiting)
+        self.changed.notify_all()
+        return 0
+
+    def _discard(self, ticket):
+        if ticket in self.waiting:
+            self.waiting.remove(ticket)
+            heapq.heapify(self.waiting)
+            self.changed.notify_all()
+
+    def acquire(self, tokens, rank):
+        ticket = (rank, next(_sequence))
+        deadline = time.monotonic() + SCHEDULER_MAX_WAIT
+        with self.lock:
+            heapq.heappush(self.waiting, ticket)
+            try:
+                while (delay := self._try(ticket, tokens, SYNC_POLL)) > 0:
+                    if time.monotonic() > deadline:
+                        raise SchedulerTimeout(f"No OpenAI capacity within {SCHEDULER_MAX_WAIT}s")
+                    self.changed.wait(min(delay, SYNC_POLL))
+            except BaseException:
+                self._discard(ticket)
+                raise
+
+    async def aacquire(self, tokens, rank):
+        ticket = (rank, next(_sequence))
+        deadline = time.monotonic() + SCHEDULER_MAX_WAIT
+        with self.lock:
+            heapq.heappush(self.waiting, ticket)
+        try:
+            while True:
+                with self.lock:
+                    delay = self._try(ticket, tokens, ASYNC_POLL)
+                if delay <= 0:
+                    return
+                if time.monotonic() > deadline:
+                    raise SchedulerTimeout(f"No OpenAI capacity within {SCHEDULER_MAX_WAIT}s")
+                await asyncio.sleep(min(delay, ASYNC_POLL))
+        except BaseException:
+            with self.lock:
+                self._discard(ticket)
+            raise
+
+    def settle(self, estimated, used):
+        # Gives back (or takes more of) the token estimate once the real usage is known
+        with self.lock:
+            self.tokens = min(self.tpm, self.tokens + estimated - used)
+
+    def throttle(self, seconds):
+        with self.lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def queued(self):
+        with self.lock:
+            return [rank for rank, _ in self.waiting]
+
+
+def _bucket(model):
+    global _pid
+    if _pid != os.getpid():
+        _buckets.clear()
+        _pid = os.getpid()
+    bucket = _buckets.get(model)
+    if bucket is None:
+        with _lock:
+            bucket = _buckets.get(model)
+            if bucket is None:
+                bucket = _buckets[model] = _Bucket(*limits(model))
+    return bucket
+
+
+@contextmanager
+def prioritized(name):
+    # OpenAI calls made inside the block (on this thread or task) queue with this priority
+    token = priority.set(name)
+    try:
+        yield
+    finally:
+        priority.reset(token)
+
+
+def estimate(input, output=None, input_tokens=None):
+    # Prompt tokens plus the output allowance (the request's max_output_tokens when it
+    # has one). Callers that already counted the prompt, like budget.assemble, pass
+    # input_tokens; otherwise it is guessed at 4 characters a token.
+    if input_tokens is None:
+        if not isinstance(input, str):
+            input = json.dumps(input, default=str)
+        input_tokens = len(input) // 4
+    if output is None or output < 0:
+        output = SCHEDULER_OUTPUT_ESTIMATE
+    return input_tokens + output
+
+
+def _used(result):
+    usage = getattr(result, "usage", None)
+    return getattr(usage, "total_tokens", None)
+
+
+def settle(model, estimated, used):
+    # For calls whose usage arrives after call() returned, such as streams
+    if used is not None:
+        _bucket(model).settle(estimated, used)
+
+
+def _retry_after(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        # HTTP-date form, fall back to exponential backoff
+        pass
+    return None
+
+
+def _backoff(bucket, model, error, attempt):
+    # Seconds to wait before retrying the call, or None to give up
+    retryable = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+    if not isinstance(error, retryable) or attempt >= SCHEDULER_RETRIES:
+        return None
+    delay = _retry_after(error)
+    if delay is None:
+        delay = min(SCHEDULER_BACKOFF_MAX, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.5)
+    _stats["retries"] += 1
+    metrics.inc("notsy_scheduler_retries_total", model=model, error=type(error).__name__)
+    logger.warning("OpenAI %s call failed (%s), retry %d in %.1fs", model, type(error).__name__, attempt + 1, delay)
+    if isinstance(error, openai.RateLimitError):
+        # Everyone behind this call would hit the same limit, so the whole bucket pauses
+        # and the retry waits for it in the queue
+        _stats["throttled"] += 1
+        bucket.throttle(delay)
+        return 0.0
+    return delay
+
+
+def _admitted(model, name, start):
+    _stats["admitted"] += 1
+    waited = time.monotonic() - start
+    metrics.observe("notsy_scheduler_wait_seconds", waited, model=model, priority=name)
+    return waited
+
+
+def call(model, tokens, fn, *args, **kwargs):
+    # fn(*args, **kwargs) once the model's bucket has room, retried on 429s and transient errors
+    bucket = _bucket(model)
+    name = priority.get()
+    for attempt in itertools.count():
+        start = time.monotonic()
+        try:
+            bucket.acquire(tokens, PRIORITIES.get(name, 0))
+        except SchedulerTimeout:
+            _stats["timeouts"] += 1
+            raise
+        _admitted(model, name, start)
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            delay = _backoff(bucket, model, e, attempt)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            continue
+        used = _used(result)
+        if used is not None:
+            bucket.settle(tokens, used)
+        return result
+
+
+async def acall(model, tokens, fn, *args, **kwargs):
+    # Async counterpart of call() for the ASGI views; fn returns an awaitable
+    bucket = _bucket(model)
+    name = priority.get()
+    for attempt in itertools.count():
+        start = time.monotonic()
+        try:
+            await bucket.aacquire(tokens, PRIORITIES.get(name, 0))
+        except SchedulerTimeout:
+            _stats["timeouts"] += 1
+            raise
+        _admitted(model, name, start)
+        try:
+            result = await fn(*args, **kwargs)
+        except Exception as e:
+            delay = _backoff(bucket, model, e, attempt)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            continue
+        used = _used(result)
+        if used is not None:
+            bucket.settle(tokens, used)
+        return result
+
+
+def stats():
+    queued = {name: 0 for name in PRIORITIES}
+    ranks = {rank: name for name, rank in PRIORITIES.items()}
+    for bucket in list(_buckets.values()):
+        for rank in bucket.queued():
+            queued[ranks.get(rank, "interactive")] += 1
+    return dict(
+        _stats,
+        queued=sum(queued.values()),
+        **{f"queued_{name}": count for name, count in queued.items()},
+    )
+
+
+metrics.describe("notsy_scheduler_wait_seconds", "Time OpenAI calls waited for rate-limit capacity")
+metrics.describe("notsy_scheduler_retries_total", "OpenAI calls retried after a 429 or transient error")
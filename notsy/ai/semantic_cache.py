@@ -0,0 +1,122 @@
+import numpy as np
+import threading
+import hashlib
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# Answers for modes that only read the shared corpora, keyed by the query embedding.
+# A new question whose embedding is close enough to a cached one, under the same mode,
+# instruction and generation settings, gets the cached answer without a model call.
+# Entries live in one matrix per worker process; lookups are a single matrix product.
+
+SEMANTIC_CACHE_MODES = {m for m in os.getenv('SEMANTIC_CACHE_MODES', '2,4').split(',') if m}
+SEMANTIC_CACHE_SIZE = int(os.getenv('SEMANTIC_CACHE_SIZE', 1024))
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.95))
+SEMANTIC_CACHE_TTL = int(os.getenv('SEMANTIC_CACHE_TTL', 24 * 3600))
+SEMANTIC_CACHE_VERSION = 1
+
+_lock = threading.Lock()
+_scopes = {}
+# Row i of _vectors belongs to _entries[i]; _scope_ids, _used and _expires are the
+# per-row scope, last use (for LRU eviction) and expiry
+_vectors = None
+_entries = []
+_scope_ids = np.full(SEMANTIC_CACHE_SIZE, -1, dtype=np.int64)
+_used = np.zeros(SEMANTIC_CACHE_SIZE)
+_expires = np.zeros(SEMANTIC_CACHE_SIZE)
+_stats = {"hits": 0, "misses": 0, "stores": 0, "evicted": 0, "saved_input_tokens": 0, "saved_output_tokens": 0}
+
+
+def eligible(mode_id, messages, summary):
+    # Earlier turns change what a good answer is, so only opening questions are shared
+    return SEMANTIC_CACHE_SIZE > 0 and mode_id in SEMANTIC_CACHE_MODES and not messages and not summary
+
+
+def scope(mode_id, instruction, *settings):
+    payload = "\x1f".join(str(part) for part in (SEMANTIC_CACHE_VERSION, mode_id, instruction) + settings)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / (np.linalg.norm(vector) or 1.0)
+
+
+def lookup(scope_key, vector, threshold=SEMANTIC_CACHE_THRESHOLD):
+    # The cached answer text for the nearest earlier query in scope, or None
+    with _lock:
+        scope_id = _scopes.get(scope_key)
+        if scope_id is None or _vectors is None:
+            _stats["misses"] += 1
+            return None
+        now = time.monotonic()
+        rows = np.flatnonzero((_scope_ids == scope_id) & (_expires > now))
+        if not len(rows):
+            _stats["misses"] += 1
+            return None
+        scores = _vectors[rows] @ _unit(vector)
+        best = int(np.argmax(scores))
+        if scores[best] < threshold:
+            _stats["misses"] += 1
+            return None
+        row = rows[best]
+        _used[row] = now
+        entry = _entries[row]
+        _stats["hits"] += 1
+        _stats["saved_input_tokens"] += entry["input_tokens"]
+        _stats["saved_output_tokens"] += entry["output_tokens"]
+    logger.debug("Semantic cache hit at cosine %.4f", scores[best])
+    return entry["text"]
+
+
+def store(scope_key, vector, text, usage=None):
+    global _vectors
+    if not text or SEMANTIC_CACHE_SIZE <= 0:
+        return
+    vector = _unit(vector)
+    entry = {
+        "text": text,
+        "input_tokens": getattr(usage, "input_tokens", 0) or 0,
+        "output_tokens": getattr(usage, "output_tokens", 0) or 0,
+    }
+    with _lock:
+        if _vectors is None or _vectors.shape[1] != len(vector):
+            _vectors = np.zeros((SEMANTIC_CACHE_SIZE, len(vector)), dtype=np.float32)
+            _entries.clear()
+            _scope_ids.fill(-1)
+        now = time.monotonic()
+        if len(_entries) < SEMANTIC_CACHE_SIZE:
+            row = len(_entries)
+            _entries.append(entry)
+        else:
+            # Expired rows have the oldest possible use time
+            row = int(np.argmin(np.where(_expires > now, _used, -1.0)))
+            _entries[row] = entry
+            _stats["evicted"] += 1
+        _vectors[row] = vector
+        _scope_ids[row] = _scopes.setdefault(scope_key, len(_scopes))
+        _used[row] = now
+        _expires[row] = now + SEMANTIC_CACHE_TTL
+        _stats["stores"] += 1
+
+
+def clear():
+    global _vectors
+    with _lock:
+        _vectors = None
+        _entries.clear()
+        _scopes.clear()
+        _scope_ids.fill(-1)
+
+
+def stats():
+    lookups = _stats["hits"] + _stats["misses"]
+    return dict(
+        _stats,
+        entries=len(_entries),
+        hit_rate=round(_stats["hits"] / lookups, 4) if lookups else None,
+        saved_tokens=_stats["saved_input_tokens"] + _stats["saved_output_tokens"],
+    )
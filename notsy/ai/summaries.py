@@ -0,0 +1,132 @@
+from concurrent.futures import ThreadPoolExecutor
+from . import utils, scheduler
+import hashlib
+import logging
+import json
+import os
+
+logger = logging.getLogger(__name__)
+
+# Rolling conversation summaries. Checkpoints are keyed by a hash chain over the
+# messages they cover, so a chat (and every branch forked from it) finds the longest
+# summarised prefix of its history with one cache lookup. New messages are folded in
+# by a background pool after the response is sent.
+
+# Newest messages always sent verbatim, never folded
+SUMMARY_KEEP_RECENT = int(os.getenv('SUMMARY_KEEP_RECENT', 6))
+# Fold once this many older messages are not covered by the checkpoint
+SUMMARY_FOLD_MESSAGES = int(os.getenv('SUMMARY_FOLD_MESSAGES', 8))
+SUMMARY_TTL = int(os.getenv('SUMMARY_TTL', 30 * 24 * 3600))
+SUMMARY_LOCK_TIMEOUT = int(os.getenv('SUMMARY_LOCK_TIMEOUT', 300))
+SUMMARY_VERSION = 1
+SUMMARY_POOL = ThreadPoolExecutor(max_workers=int(os.getenv('SUMMARY_WORKERS', 2)), thread_name_prefix="summary")
+
+_stats = {"hits": 0, "misses": 0, "folds": 0, "folded_messages": 0, "errors": 0}
+
+
+def _cache():
+    from django.conf import settings
+    if not settings.configured:
+        return None
+    from django.core.cache import cache
+    return cache
+
+
+def prefix_digests(messages):
+    # digests[i] identifies messages[:i + 1]
+    digests = []
+    digest = f"summary:v{SUMMARY_VERSION}"
+    for message in messages:
+        payload = json.dumps([digest, message.get("role"), message.get("content")], separators=(",", ":"), default=str)
+        digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+        digests.append(digest)
+    return digests
+
+
+def checkpoint_key(digest):
+    return f"summary:v{SUMMARY_VERSION}:{digest}"
+
+
+def latest(messages, digests=None):
+    # (count, summary) of the longest summarised prefix of messages, (0, None) when there is none
+    digests = digests or prefix_digests(messages)
+    keys = {checkpoint_key(digests[i - 1]): i for i in range(2, len(messages) + 1, 2)}
+    if not keys:
+        return 0, None
+    try:
+        found = _cache().get_many(list(keys))
+    except Exception as e:
+        _stats["errors"] += 1
+        logger.warning("Summary cache unavailable: %s", e)
+        return 0, None
+    if not found:
+        _stats["misses"] += 1
+        return 0, None
+    _stats["hits"] += 1
+    key = max(found, key=keys.get)
+    return keys[key], found[key]
+
+
+def render(summary, messages):
+    lines = []
+    if summary:
+        lines.append(f"[SUMMARY SO FAR]\n{summary}\n\n[NEW MESSAGES]")
+    for message in messages:
+        lines.append(f"{message.get('role')}: {message.get('content')}")
+    return "\n".join(lines)
+
+
+def fold(messages, summary, key):
+    # Summary of everything up to the end of messages, given the summary before them
+    lock_key = f"{key}:lock"
+    try:
+        with scheduler.prioritized("background"):
+            response = utils.summarize(utils.initialize_openai_client(), render(summary, messages))
+        _cache().set(key, response.output_text, timeout=SUMMARY_TTL)
+        _stats["folds"] += 1
+        _stats["folded_messages"] += len(messages)
+    except Exception:
+        _stats["errors"] += 1
+        logger.exception("Failed to fold %d messages into the conversation summary", len(messages))
+    finally:
+        try:
+            _cache().delete(lock_key)
+        except Exception:
+            pass
+
+
+def schedule(messages, count, summary, digests):
+    # Queues a fold of messages[count:target] once enough of them have built up
+    target = len(messages) - SUMMARY_KEEP_RECENT
+    target -= target % 2
+    if target - count < SUMMARY_FOLD_MESSAGES:
+        return None
+    key = checkpoint_key(digests[target - 1])
+    try:
+        if not _cache().add(f"{key}:lock", 1, timeout=SUMMARY_LOCK_TIMEOUT):
+            return None
+    except Exception as e:
+        _stats["errors"] += 1
+        logger.warning("Summary cache unavailable, not folding: %s", e)
+        return None
+    return SUMMARY_POOL.submit(fold, messages[count:target], summary, key)
+
+
+def seed(summary):
+    # Text of the summaries the client sent, which the first fold starts from
+    texts = [s if isinstance(s, str) else str(s.get("content") or "") for s in summary or ()]
+    return "\n".join(text for text in texts if text) or None
+
+
+def rolling(messages, summary=()):
+    # Returns (summary or None, messages it does not cover) and folds older messages in the
+    # background. summary is what the client sent; it seeds the fold until a checkpoint exists.
+    digests = prefix_digests(messages)
+    count, rolled = latest(messages, digests)
+    schedule(messages, count, rolled if count else seed(summary), digests)
+    return rolled, messages[count:]
+
+
+def stats():
+    lookups = _stats["hits"] + _stats["misses"]
+    return dict(_stats, hit_rate=round(_stats["hits"] / lookups, 4) if lookups else None)
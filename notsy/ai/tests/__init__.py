@@ -0,0 +1,16 @@
+from unittest import mock
+import re
+
+
+class WordEncoding:
+    # Stands in for the tiktoken encoder in tests: one token per word, with the whitespace
+    # after it, so decoding is lossless like the real encoder
+    def encode(self, text, disallowed_special=()):
+        return re.findall(r"\s*\S+\s*", text)
+
+    def decode(self, tokens):
+        return "".join(tokens)
+
+
+def word_tokens():
+    return mock.patch("ai.chunking.get_encoding", return_value=WordEncoding())
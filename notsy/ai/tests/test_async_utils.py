@@ -0,0 +1,53 @@
+from django.test import SimpleTestCase
+from unittest import mock
+from ai import async_utils, rerank
+import numpy as np
+import threading
+import asyncio
+import time
+
+
+class FakeStore:
+    async def aquery(self, vector, top_k, namespace, filter=None, include_values=False):
+        await asyncio.sleep(0)
+        return {"matches": [
+            {"id": f"{namespace}-{i}", "score": 0.9 - i / 10, "metadata": {"text": f"chunk {i} of {namespace}"}}
+            for i in range(3)
+        ]}
+
+
+class OffLoopTests(SimpleTestCase):
+    # resolve_matches reads the manifest through the ORM
+    databases = {"default"}
+
+    def test_orm_helpers_run_concurrently_off_the_loop(self):
+        threads = []
+
+        def blocking():
+            threads.append(threading.get_ident())
+            time.sleep(0.2)
+
+        async def run():
+            start = time.perf_counter()
+            await asyncio.gather(*(async_utils._orm(blocking)() for _ in range(3)))
+            return time.perf_counter() - start
+
+        elapsed = asyncio.run(run())
+        self.assertLess(elapsed, 0.5)
+        self.assertNotIn(threading.get_ident(), threads)
+
+    def test_rerank_runs_off_the_loop(self):
+        loop_thread = threading.get_ident()
+        rerank_threads = []
+
+        def bm25(query, texts, namespace=None):
+            rerank_threads.append(threading.get_ident())
+            return np.zeros(len(texts))
+
+        with mock.patch("ai.vectorstore.get_store", return_value=FakeStore()), \
+                mock.patch.object(rerank, "bm25", side_effect=bm25):
+            docs = asyncio.run(async_utils.aquery_vector([1.0, 0.0], "user-ns", 2, text="chunk"))
+        self.assertEqual(len(docs), 2)
+        self.assertEqual(docs[0]["content"], "chunk 0 of user-ns")
+        self.assertTrue(rerank_threads)
+        self.assertNotIn(loop_thread, rerank_threads)
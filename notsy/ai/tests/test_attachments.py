@@ -0,0 +1,54 @@
+from django.test import SimpleTestCase
+from unittest import mock
+from ai import attachments
+import numpy as np
+import tempfile
+import os
+
+
+def entry(n):
+    return {"version": attachments.ATTACHMENT_CACHE_VERSION, "tokens": n, "passages": ["p"] * n,
+            "dimension": 4, "vectors": np.ones((n, 4), dtype=np.float32)}
+
+
+class EvictionTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.dir = directory.name
+        patcher = mock.patch.multiple(
+            attachments, ATTACHMENT_CACHE_DIR=self.dir, ATTACHMENT_CACHE_BYTES=10 ** 6,
+            ATTACHMENT_RESCAN_WRITES=3, _cache_bytes=None, _writes=0,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def walks(self):
+        return mock.patch.object(attachments, "_evict", wraps=attachments._evict)
+
+    def test_walks_once_then_tracks_writes(self):
+        with self.walks() as evict:
+            attachments._write("aa" + "0" * 62, entry(2))
+            attachments._write("ab" + "0" * 62, entry(2))
+        self.assertEqual(evict.call_count, 1)
+        on_disk = sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(self.dir) for name in files)
+        self.assertEqual(attachments._cache_bytes, on_disk)
+
+    def test_rescans_every_n_writes(self):
+        with self.walks() as evict:
+            for i in range(6):
+                attachments._write(f"{i:02d}" + "0" * 62, entry(1))
+        # First write (size unknown), then writes 3 and 6
+        self.assertEqual(evict.call_count, 3)
+
+    def test_evicts_oldest_once_the_limit_is_passed(self):
+        first, second = "aa" + "0" * 62, "bb" + "0" * 62
+        attachments._write(first, entry(100))
+        os.utime(attachments._paths(first)[0], (1, 1))
+        size = attachments._cache_bytes
+        with mock.patch.object(attachments, "ATTACHMENT_CACHE_BYTES", size + 10), self.walks() as evict:
+            attachments._write(second, entry(100))
+        self.assertEqual(evict.call_count, 1)
+        self.assertFalse(os.path.exists(attachments._paths(first)[0]))
+        self.assertTrue(os.path.exists(attachments._paths(second)[0]))
+        self.assertEqual(attachments._cache_bytes, size)
@@ -0,0 +1,69 @@
+from django.test import SimpleTestCase
+from ai import budget
+from ai.tests import word_tokens
+
+
+def doc(words, score, name):
+    return {"content": " ".join([name] * words), "score": score}
+
+
+class AllocateTests(SimpleTestCase):
+    def test_small_sections_keep_their_need_and_pass_on_the_rest(self):
+        alloc = budget.allocate({"a": 10, "b": 1000, "c": 0}, 100, {"a": 0.5, "b": 0.5, "c": 1.0})
+        self.assertEqual(alloc, {"a": 10, "b": 90, "c": 0})
+
+    def test_everything_fits(self):
+        self.assertEqual(budget.allocate({"a": 5, "b": 5}, 100, {"a": 1, "b": 1}), {"a": 5, "b": 5})
+
+
+class AssembleTests(SimpleTestCase):
+    def setUp(self):
+        patcher = word_tokens()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_rag_keeps_retrieval_order_not_raw_score(self):
+        # Reranked order from the plan: the later namespace has the higher raw score
+        rag = [doc(10, 0.2, "first"), doc(10, 0.9, "second"), doc(10, 0.5, "third")]
+        context, _ = budget.assemble(rag=rag, budget=1000)
+        self.assertEqual(
+            [m["content"].split()[2] for m in context],
+            ["first", "second", "third"],
+        )
+        self.assertTrue(context[0]["content"].startswith("[RAG #1] first"))
+
+    def test_rag_is_trimmed_from_the_tail(self):
+        size = 10 + budget.MESSAGE_OVERHEAD + budget.RAG_LABEL_TOKENS
+        rag = [doc(10, 0.1, "first"), doc(10, 0.9, "second"), doc(10, 0.8, "third")]
+        context, accounting = budget.assemble(rag=rag, budget=2 * size)
+        self.assertEqual([m["content"].split()[2] for m in context], ["first", "second"])
+        self.assertEqual(accounting["sections"]["rag"]["dropped"], 1)
+
+    def test_oversized_document_is_cut_and_later_ones_dropped(self):
+        big = doc(budget.RAG_MIN_TOKENS * 3, 0.1, "big")
+        context, accounting = budget.assemble(rag=[big, doc(5, 0.9, "small")], budget=budget.RAG_MIN_TOKENS * 2)
+        self.assertEqual(len(context), 1)
+        self.assertTrue(context[0]["content"].startswith("[RAG #1] big"))
+        self.assertLessEqual(accounting["used"], budget.RAG_MIN_TOKENS * 2)
+
+    def test_instruction_and_query_are_always_kept(self):
+        instruction = {"role": "developer", "content": "be brief"}
+        query = {"role": "user", "content": "what is a heap"}
+        history = [{"role": "user", "content": "q " * 50}, {"role": "assistant", "content": "a " * 50}]
+        context, accounting = budget.assemble(instruction=instruction, history=history, query=query, budget=20)
+        self.assertEqual(context, [instruction, query])
+        self.assertEqual(accounting["sections"]["history"]["dropped"], 2)
+
+    def test_history_keeps_newest_whole_pairs(self):
+        history = []
+        for i in range(4):
+            history += [{"role": "user", "content": f"q{i} x x"}, {"role": "assistant", "content": f"a{i} x x"}]
+        pair = 2 * (3 + budget.MESSAGE_OVERHEAD)
+        context, _ = budget.assemble(history=history, budget=2 * pair)
+        self.assertEqual([m["content"].split()[0] for m in context], ["q2", "a2", "q3", "a3"])
+
+    def test_long_history_is_kept_when_it_fits(self):
+        history = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"m{i}"} for i in range(40)]
+        context, accounting = budget.assemble(history=history, budget=10000)
+        self.assertEqual(context, history)
+        self.assertEqual(accounting["sections"]["history"]["dropped"], 0)
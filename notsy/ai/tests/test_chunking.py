@@ -0,0 +1,75 @@
+from django.test import SimpleTestCase
+from ai import chunking
+from ai.tests import word_tokens
+
+
+def words(n, name="w"):
+    return " ".join(f"{name}{i}" for i in range(n))
+
+
+class ChunkingTests(SimpleTestCase):
+    def setUp(self):
+        patcher = word_tokens()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_split_tokens_overlaps_windows(self):
+        chunks = chunking.split_tokens(words(10), size=4, overlap=1)
+        self.assertEqual([len(c.split()) for c in chunks], [4, 4, 4])
+        self.assertEqual(chunks[0].split()[-1], chunks[1].split()[0])
+        self.assertEqual(chunks[-1].split()[-1], "w9")
+
+    def test_short_text_is_one_chunk(self):
+        self.assertEqual(chunking.split_tokens("a b", size=4, overlap=1), ["a b"])
+        self.assertEqual(chunking.split_tokens("", size=4, overlap=1), [])
+
+    def test_chunk_pages_packs_whole_pages(self):
+        pages = [words(3, "a") + " ", words(3, "b") + " ", words(3, "c")]
+        chunks = list(chunking.chunk_pages(pages, size=6, overlap=0))
+        self.assertEqual(chunks, [pages[0] + pages[1], pages[2]])
+
+    def test_long_page_splits_at_sections_first(self):
+        page = words(4, "a") + "\n\n" + words(4, "b")
+        chunks = list(chunking.chunk_pages([page], size=5, overlap=0))
+        self.assertEqual([c.split()[0] for c in chunks], ["a0", "b0"])
+        self.assertEqual("".join(chunks), page)
+
+    def test_every_chunk_fits(self):
+        pages = [words(50, "p"), "", words(7, "q")]
+        for chunk in chunking.chunk_pages(pages, size=8, overlap=2):
+            self.assertLessEqual(chunking.count_tokens(chunk), 8)
+
+    def test_truncate(self):
+        self.assertEqual(chunking.truncate("a b c d", max_tokens=2), "a b ")
+        self.assertEqual(chunking.truncate("a b", max_tokens=2), "a b")
+
+
+class OverlapTests(SimpleTestCase):
+    def setUp(self):
+        patcher = word_tokens()
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_packed_pages_share_the_overlap(self):
+        pages = [words(4, name) + " " for name in "abcd"]
+        chunks = list(chunking.chunk_pages(pages, size=10, overlap=2))
+        self.assertGreater(len(chunks), 1)
+        for before, after in zip(chunks, chunks[1:]):
+            self.assertEqual(after.split()[:2], before.split()[-2:])
+
+    def test_long_pages_share_the_overlap(self):
+        chunks = list(chunking.chunk_pages([words(30)], size=8, overlap=3))
+        for before, after in zip(chunks, chunks[1:]):
+            self.assertEqual(after.split()[:3], before.split()[-3:])
+        # Nothing is lost and nothing but the overlap is repeated
+        self.assertEqual(sum(len(c.split()) for c in chunks) - 3 * (len(chunks) - 1), 30)
+        self.assertEqual(chunks[-1].split()[-1], "w29")
+
+    def test_overlap_never_pushes_a_chunk_over_size(self):
+        pages = [words(3, "a"), words(8, "b"), words(5, "c"), words(20, "d")]
+        for chunk in chunking.chunk_pages(pages, size=8, overlap=3):
+            self.assertLessEqual(len(chunk.split()), 8)
+
+    def test_no_overlap_keeps_chunks_disjoint(self):
+        chunks = list(chunking.chunk_pages([words(4, name) + " " for name in "abc"], size=8, overlap=0))
+        self.assertEqual(sum(len(c.split()) for c in chunks), 12)
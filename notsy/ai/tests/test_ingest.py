@@ -0,0 +1,75 @@
+from datetime import timedelta
+from django.test import TestCase
+from django.utils import timezone
+from ai import ingest, utils
+from ai.models import IngestJob, IngestFile
+
+
+class TopicIdTests(TestCase):
+    def test_job_keeps_topic_id_type(self):
+        numeric = IngestJob.objects.create(data_type="pdf", user_id="u", topic_id=42)
+        named = IngestJob.objects.create(data_type="pdf", user_id="u", topic_id="42")
+        self.assertEqual(IngestJob.objects.get(pk=numeric.pk).topic_id, 42)
+        self.assertEqual(IngestJob.objects.get(pk=named.pk).topic_id, "42")
+
+    def test_topic_filter_matches_both_forms_of_numeric_ids(self):
+        self.assertEqual(
+            utils.topic_filter("u", 42),
+            {"topic_id": {"$in": [42, "42"]}, "user_id": {"$eq": "u"}},
+        )
+        self.assertEqual(utils.topic_filter(topic_id="t"), {"topic_id": {"$eq": "t"}})
+        self.assertIsNone(utils.topic_filter())
+
+
+class RequeueStaleTests(TestCase):
+    def setUp(self):
+        self.job = IngestJob.objects.create(data_type="video", user_id="u", topic_id="t")
+
+    def make(self, status, started=None, heartbeat=None):
+        return IngestFile.objects.create(
+            job=self.job, kind="video", name="v", url="v", status=status, started_at=started, heartbeat_at=heartbeat,
+        )
+
+    def test_only_files_without_a_recent_heartbeat_are_requeued(self):
+        now = timezone.now()
+        old = now - timedelta(seconds=ingest.INGEST_STALE_SECONDS * 2)
+        live = self.make(IngestFile.RUNNING, started=old, heartbeat=now)
+        dead = self.make(IngestFile.RUNNING, started=old, heartbeat=old)
+        never_beat = self.make(IngestFile.RUNNING, started=old)
+        just_claimed = self.make(IngestFile.RUNNING, started=now)
+        done = self.make(IngestFile.DONE, started=old, heartbeat=old)
+
+        self.assertEqual(ingest.requeue_stale(), 2)
+        status = dict(IngestFile.objects.values_list("pk", "status"))
+        self.assertEqual(status[live.pk], IngestFile.RUNNING)
+        self.assertEqual(status[dead.pk], IngestFile.QUEUED)
+        self.assertEqual(status[never_beat.pk], IngestFile.QUEUED)
+        self.assertEqual(status[just_claimed.pk], IngestFile.RUNNING)
+        self.assertEqual(status[done.pk], IngestFile.DONE)
+
+    def test_claim_sets_the_heartbeat(self):
+        queued = self.make(IngestFile.QUEUED)
+        claimed = ingest.claim_next()
+        self.assertEqual(claimed.pk, queued.pk)
+        self.assertIsNotNone(claimed.heartbeat_at)
+
+
+class JobStatusTests(TestCase):
+    def test_status_follows_the_files(self):
+        job = IngestJob.objects.create(data_type="video", user_id="u", topic_id="t")
+        self.assertEqual(job.status, "done")
+        queued = IngestFile.objects.create(job=job, kind="video", name="a", url="a")
+        self.assertEqual(job.status, "queued")
+        IngestFile.objects.create(job=job, kind="video", name="b", url="b", status=IngestFile.FAILED)
+        self.assertEqual(job.status, "running")
+        queued.status = IngestFile.DONE
+        queued.save()
+        self.assertEqual(job.status, "partial")
+
+    def test_upload_without_files_is_rejected(self):
+        response = self.client.post(
+            "/upload/", {"type": "video", "source": [], "content": [], "topicId": "t", "userId": "u"},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(IngestJob.objects.exists())
@@ -0,0 +1,42 @@
+from django.test import TestCase
+from ai import manifest
+from ai.models import ChunkManifest
+
+
+class ManifestTests(TestCase):
+    def test_hashed_is_lazy(self):
+        def chunks():
+            yield "first"
+            raise AssertionError("read past the first chunk")
+
+        item = next(manifest.hashed(chunks(), "t1"))
+        self.assertEqual(item["text"], "first")
+        self.assertEqual(item["hash"], manifest.chunk_hash("first"))
+        self.assertEqual(item["id"], manifest.vector_id("t1", item["hash"]))
+
+    def test_unseen_skips_recorded_and_repeated_chunks(self):
+        items = list(manifest.hashed(["a", "b", "a", "c"], "t1"))
+        manifest.record("ns", [{"id": items[1]["id"]}], {"topic_id": "t1"})
+        stats, seen = {}, set()
+
+        fresh = manifest.unseen(items, "ns", seen, stats)
+        self.assertEqual([item["text"] for item in fresh], ["a", "c"])
+        self.assertEqual(stats["skipped"], 2)
+
+        # A later batch does not take the same chunk again
+        again = manifest.unseen(list(manifest.hashed(["c", "d"], "t1")), "ns", seen, stats)
+        self.assertEqual([item["text"] for item in again], ["d"])
+        self.assertEqual(stats["skipped"], 3)
+
+    def test_unseen_is_per_namespace(self):
+        items = list(manifest.hashed(["a"], "t1"))
+        manifest.record("other", [{"id": items[0]["id"]}], {"topic_id": "t1"})
+        self.assertEqual(len(manifest.unseen(items, "ns")), 1)
+
+    def test_record_keeps_full_hash_and_text(self):
+        item = next(manifest.hashed(["chunk text"], "t1"))
+        manifest.record("ns", [{"id": item["id"]}], {"topic_id": "t1", "url": "u"}, {item["id"]: item})
+        row = ChunkManifest.objects.get(vector_id=item["id"])
+        self.assertEqual(row.chunk_hash, item["hash"])
+        self.assertEqual(len(row.chunk_hash), 64)
+        self.assertEqual(manifest.texts("ns", [item["id"], "missing"]), {item["id"]: "chunk text"})
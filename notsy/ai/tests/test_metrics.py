@@ -0,0 +1,88 @@
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase
+from unittest import mock
+from ai import metrics
+import asyncio
+
+
+class RequestMetricsMiddlewareTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.object(metrics, "observe")
+        self.observe = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_plain_response_is_timed_when_built(self):
+        middleware = metrics.RequestMetricsMiddleware(lambda request: HttpResponse("ok"))
+        response = middleware(RequestFactory().get("/"))
+        self.assertEqual(self.observe.call_count, 1)
+        self.assertIn(metrics.REQUEST_ID_HEADER, response)
+
+    def test_stream_is_timed_when_consumed(self):
+        middleware = metrics.RequestMetricsMiddleware(lambda request: StreamingHttpResponse(iter([b"a", b"b"])))
+        response = middleware(RequestFactory().get("/"))
+        self.observe.assert_not_called()
+        self.assertEqual(b"".join(response.streaming_content), b"ab")
+        self.assertEqual(self.observe.call_count, 1)
+
+    def test_stream_is_timed_when_closed_early(self):
+        middleware = metrics.RequestMetricsMiddleware(lambda request: StreamingHttpResponse(iter([b"a", b"b"])))
+        response = middleware(RequestFactory().get("/"))
+        next(iter(response.streaming_content))
+        response.close()
+        self.assertEqual(self.observe.call_count, 1)
+
+    def test_async_stream_is_timed_when_consumed(self):
+        async def chunks():
+            yield b"a"
+            yield b"b"
+
+        async def view(request):
+            return StreamingHttpResponse(chunks())
+
+        async def run():
+            response = await metrics.RequestMetricsMiddleware(view)(RequestFactory().get("/"))
+            self.observe.assert_not_called()
+            return b"".join([chunk async for chunk in response])
+
+        self.assertEqual(asyncio.run(run()), b"ab")
+        self.assertEqual(self.observe.call_count, 1)
+
+    def test_stream_body_keeps_the_request_id(self):
+        def chunks():
+            yield metrics.request_id.get().encode()
+
+        middleware = metrics.RequestMetricsMiddleware(lambda request: StreamingHttpResponse(chunks()))
+        response = middleware(RequestFactory().get("/", HTTP_X_REQUEST_ID="abc"))
+        self.assertEqual(metrics.request_id.get(), "-")
+        self.assertEqual(b"".join(response.streaming_content), b"abc")
+        self.assertEqual(metrics.request_id.get(), "-")
+
+    def test_async_stream_body_keeps_the_request_id(self):
+        async def chunks():
+            yield metrics.request_id.get().encode()
+
+        async def view(request):
+            return StreamingHttpResponse(chunks())
+
+        async def run():
+            response = await metrics.RequestMetricsMiddleware(view)(RequestFactory().get("/", HTTP_X_REQUEST_ID="abc"))
+            return b"".join([chunk async for chunk in response])
+
+        self.assertEqual(asyncio.run(run()), b"abc")
+
+
+class SpanTests(SimpleTestCase):
+    def test_spans_share_one_label_set(self):
+        with mock.patch.object(metrics, "observe") as observe:
+            with metrics.span("get_response", "gpt-4.1"):
+                pass
+            with metrics.span("rerank"):
+                pass
+        label_sets = {frozenset(call.kwargs) for call in observe.call_args_list}
+        self.assertEqual(label_sets, {frozenset({"span", "detail"})})
+
+    def test_failures_are_counted_with_the_same_labels(self):
+        with mock.patch.object(metrics, "inc") as inc, mock.patch.object(metrics, "observe"):
+            with self.assertRaises(ValueError), metrics.span("index.query", "LocalStore"):
+                raise ValueError
+        inc.assert_called_once_with("notsy_span_errors_total", span="index.query", detail="LocalStore")
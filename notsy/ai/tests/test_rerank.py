@@ -0,0 +1,44 @@
+from django.test import SimpleTestCase
+from unittest import mock
+from ai import rerank
+import numpy as np
+
+
+class MmrTests(SimpleTestCase):
+    def test_pure_relevance_is_score_order(self):
+        relevance = np.array([0.2, 0.9, 0.5])
+        self.assertEqual(rerank.mmr(relevance, np.eye(3), 3, lam=1.0), [1, 2, 0])
+
+    def test_near_duplicates_give_way_to_diverse_docs(self):
+        relevance = np.array([1.0, 0.95, 0.6])
+        # 0 and 1 are the same passage, 2 is unrelated
+        similarity = np.array([[1.0, 0.99, 0.0], [0.99, 1.0, 0.0], [0.0, 0.0, 1.0]])
+        self.assertEqual(rerank.mmr(relevance, similarity, 2, lam=0.5), [0, 2])
+
+    def test_k_larger_than_the_candidates(self):
+        self.assertEqual(sorted(rerank.mmr(np.array([0.1, 0.3]), np.eye(2), 5)), [0, 1])
+
+
+class RerankTests(SimpleTestCase):
+    def test_drops_values_and_keeps_top_k(self):
+        docs = [
+            {"content": "binary search tree", "score": 0.9, "values": [1.0, 0.0, 0.0]},
+            {"content": "binary search tree", "score": 0.89, "values": [1.0, 0.0, 0.0]},
+            {"content": "search algorithms", "score": 0.85, "values": [0.0, 1.0, 0.0]},
+            {"content": "graph colouring", "score": 0.1, "values": [0.0, 0.0, 1.0]},
+        ]
+        picked = rerank.rerank("binary search", docs, 2)
+        self.assertEqual(len(picked), 2)
+        self.assertEqual(picked[1]["content"], "search algorithms")
+        self.assertTrue(all("values" not in doc for doc in picked))
+
+    def test_candidates_overfetch_is_capped(self):
+        self.assertEqual(rerank.candidates(1000), 1000)
+        self.assertLessEqual(rerank.candidates(5), max(5, rerank.RERANK_MAX_CANDIDATES))
+
+    def test_disabled_keeps_store_order_without_overfetch(self):
+        docs = [{"content": "a", "score": 0.9, "values": [1.0]}, {"content": "a", "score": 0.8, "values": [1.0]}]
+        with mock.patch.object(rerank, "RERANK_ENABLED", False):
+            self.assertEqual(rerank.candidates(5), 5)
+            picked = rerank.rerank("a", docs, 1)
+        self.assertEqual(picked, [{"content": "a", "score": 0.9}])
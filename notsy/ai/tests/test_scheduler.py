@@ -0,0 +1,151 @@
+from django.test import SimpleTestCase
+from types import SimpleNamespace
+from unittest import mock
+from ai import scheduler
+import threading
+import asyncio
+import openai
+import httpx
+import time
+
+
+def rate_limited(headers=None):
+    request = httpx.Request("POST", "https://api.openai.com/v1/responses")
+    response = httpx.Response(429, headers=headers or {}, request=request)
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+class BucketTests(SimpleTestCase):
+    def test_admits_waiting_calls_by_priority(self):
+        bucket = scheduler._Bucket(rpm=120, tpm=10 ** 9)
+        bucket.requests = 0
+        order = []
+
+        def take(name, delay):
+            time.sleep(delay)
+            bucket.acquire(1, scheduler.PRIORITIES[name])
+            order.append(name)
+
+        threads = [
+            threading.Thread(target=take, args=(name, delay))
+            for name, delay in (("background", 0), ("background", 0.01), ("interactive", 0.05), ("graph", 0.06))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        self.assertEqual(order, ["interactive", "graph", "background", "background"])
+        self.assertEqual(bucket.waiting, [])
+
+    def test_waits_for_tokens(self):
+        bucket = scheduler._Bucket(rpm=10 ** 6, tpm=6000)
+        bucket.tokens = 0
+        start = time.monotonic()
+        bucket.acquire(50, 0)
+        # 6000 tokens a minute refill 100 a second
+        self.assertGreaterEqual(time.monotonic() - start, 0.4)
+
+    def test_oversized_request_goes_through_on_a_full_bucket(self):
+        bucket = scheduler._Bucket(rpm=60, tpm=100)
+        bucket.acquire(10 ** 6, 0)
+        self.assertLessEqual(bucket.tokens, 0)
+
+    def test_throttle_blocks_admission(self):
+        bucket = scheduler._Bucket(rpm=10 ** 6, tpm=10 ** 9)
+        bucket.throttle(0.3)
+        start = time.monotonic()
+        bucket.acquire(1, 0)
+        self.assertGreaterEqual(time.monotonic() - start, 0.25)
+
+    def test_settle_refunds_unused_tokens(self):
+        bucket = scheduler._Bucket(rpm=60, tpm=1000)
+        bucket.acquire(600, 0)
+        bucket.settle(600, 100)
+        self.assertAlmostEqual(bucket.tokens, 900, delta=5)
+
+    def test_cancelled_async_waiter_leaves_the_queue(self):
+        bucket = scheduler._Bucket(rpm=60, tpm=10 ** 9)
+        bucket.requests = 0
+
+        async def run():
+            task = asyncio.create_task(bucket.aacquire(1, 0))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(run())
+        self.assertEqual(bucket.waiting, [])
+
+
+class LimitTests(SimpleTestCase):
+    def test_unset_limits_do_not_throttle(self):
+        with mock.patch.multiple(scheduler, OPENAI_RPM=0, OPENAI_TPM=0):
+            bucket = scheduler._Bucket(*scheduler.limits("gpt-4.1"))
+        start = time.monotonic()
+        for _ in range(50):
+            bucket.acquire(40000, 0)
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    def test_configured_limits_are_shared(self):
+        with mock.patch.multiple(scheduler, OPENAI_RPM=500, OPENAI_TPM=30000, OPENAI_LIMIT_SHARE=0.5):
+            self.assertEqual(scheduler.limits("gpt-4.1"), (250, 15000))
+
+    def test_estimate_prefers_counted_prompt_tokens(self):
+        self.assertEqual(scheduler.estimate("x" * 4000, 500, input_tokens=120), 620)
+        self.assertEqual(scheduler.estimate("x" * 4000, 500), 1500)
+        self.assertEqual(scheduler.estimate("x" * 4000, None, input_tokens=0), scheduler.SCHEDULER_OUTPUT_ESTIMATE)
+
+
+class CallTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(scheduler._model_limits, {"test-model": (10 ** 6, 10 ** 9)})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        scheduler._buckets.pop("test-model", None)
+        self.addCleanup(scheduler._buckets.pop, "test-model", None)
+
+    def test_rate_limit_honours_retry_after(self):
+        calls = []
+
+        def create():
+            calls.append(time.monotonic())
+            if len(calls) == 1:
+                raise rate_limited({"retry-after-ms": "200"})
+            return SimpleNamespace(usage=SimpleNamespace(total_tokens=5))
+
+        scheduler.call("test-model", 10, create)
+        self.assertEqual(len(calls), 2)
+        self.assertGreaterEqual(calls[1] - calls[0], 0.19)
+
+    def test_gives_up_after_the_configured_retries(self):
+        create = mock.Mock(side_effect=rate_limited({"retry-after-ms": "1"}))
+        with mock.patch.object(scheduler, "SCHEDULER_RETRIES", 2):
+            with self.assertRaises(openai.RateLimitError):
+                scheduler.call("test-model", 10, create)
+        self.assertEqual(create.call_count, 3)
+
+    def test_other_errors_are_not_retried(self):
+        create = mock.Mock(side_effect=ValueError("bad request"))
+        with self.assertRaises(ValueError):
+            scheduler.call("test-model", 10, create)
+        self.assertEqual(create.call_count, 1)
+
+    def test_usage_settles_the_estimate(self):
+        bucket = scheduler._bucket("test-model")
+        before = bucket.tokens
+        scheduler.call("test-model", 5000, lambda: SimpleNamespace(usage=SimpleNamespace(total_tokens=100)))
+        self.assertAlmostEqual(bucket.tokens, before - 100, delta=1)
+
+    def test_streams_settle_afterwards(self):
+        bucket = scheduler._bucket("test-model")
+        before = bucket.tokens
+        scheduler.call("test-model", 5000, lambda: iter(()))
+        self.assertAlmostEqual(bucket.tokens, before - 5000, delta=1)
+        scheduler.settle("test-model", 5000, 300)
+        self.assertAlmostEqual(bucket.tokens, before - 300, delta=1)
+
+    def test_priority_comes_from_the_context(self):
+        with scheduler.prioritized("background"):
+            self.assertEqual(scheduler.priority.get(), "background")
+        self.assertEqual(scheduler.priority.get(), "interactive")
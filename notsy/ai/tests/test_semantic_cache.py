@@ -0,0 +1,57 @@
+from django.test import SimpleTestCase
+from unittest import mock
+from ai import semantic_cache
+import numpy as np
+
+
+class SemanticCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.now = 1000.0
+        patchers = [
+            mock.patch.multiple(
+                semantic_cache,
+                SEMANTIC_CACHE_SIZE=2, SEMANTIC_CACHE_TTL=60,
+                _scope_ids=np.full(2, -1, dtype=np.int64), _used=np.zeros(2), _expires=np.zeros(2),
+            ),
+            mock.patch("ai.semantic_cache.time.monotonic", side_effect=lambda: self.now),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        semantic_cache.clear()
+        self.addCleanup(semantic_cache.clear)
+
+    def test_close_query_hits_and_far_query_misses(self):
+        semantic_cache.store("s", [1.0, 0.0], "answer")
+        self.assertEqual(semantic_cache.lookup("s", [0.99, 0.01], threshold=0.95), "answer")
+        self.assertIsNone(semantic_cache.lookup("s", [0.0, 1.0], threshold=0.95))
+
+    def test_scopes_are_separate(self):
+        semantic_cache.store("s", [1.0, 0.0], "answer")
+        self.assertIsNone(semantic_cache.lookup("other", [1.0, 0.0]))
+
+    def test_entries_expire(self):
+        semantic_cache.store("s", [1.0, 0.0], "answer")
+        self.now += 61
+        self.assertIsNone(semantic_cache.lookup("s", [1.0, 0.0]))
+
+    def test_least_recently_used_is_evicted(self):
+        semantic_cache.store("s", [1.0, 0.0], "first")
+        self.now += 1
+        semantic_cache.store("s", [0.0, 1.0], "second")
+        self.now += 1
+        semantic_cache.lookup("s", [1.0, 0.0])
+        self.now += 1
+        semantic_cache.store("s", [0.6, 0.8], "third")
+        self.assertEqual(semantic_cache.lookup("s", [1.0, 0.0]), "first")
+        self.assertIsNone(semantic_cache.lookup("s", [0.0, 1.0]))
+        self.assertEqual(semantic_cache.lookup("s", [0.6, 0.8]), "third")
+
+    def test_expired_rows_are_reused_first(self):
+        semantic_cache.store("s", [1.0, 0.0], "first")
+        self.now += 30
+        semantic_cache.store("s", [0.0, 1.0], "second")
+        self.now += 40
+        # first has expired, so it is replaced even though second is also older than now
+        semantic_cache.store("s", [0.6, 0.8], "third")
+        self.assertEqual(semantic_cache.lookup("s", [0.0, 1.0]), "second")
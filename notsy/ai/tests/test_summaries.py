@@ -0,0 +1,75 @@
+from django.core.cache.backends.locmem import LocMemCache
+from django.test import SimpleTestCase
+from unittest import mock
+from ai import summaries
+
+
+def chat(n):
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i}"} for i in range(n)]
+
+
+class PrefixDigestTests(SimpleTestCase):
+    def test_chain_is_shared_by_common_prefixes(self):
+        messages = chat(6)
+        branch = messages[:4] + [{"role": "user", "content": "something else"}]
+        digests, branched = summaries.prefix_digests(messages), summaries.prefix_digests(branch)
+        self.assertEqual(digests[:4], branched[:4])
+        self.assertNotEqual(digests[4], branched[4])
+        self.assertEqual(len(set(digests)), 6)
+
+    def test_digest_covers_the_whole_prefix(self):
+        # Same last message after different histories
+        a = [{"role": "user", "content": "x"}, {"role": "assistant", "content": "same"}]
+        b = [{"role": "user", "content": "y"}, {"role": "assistant", "content": "same"}]
+        self.assertNotEqual(summaries.prefix_digests(a)[1], summaries.prefix_digests(b)[1])
+
+    def test_role_is_part_of_the_digest(self):
+        a = [{"role": "user", "content": "x"}]
+        b = [{"role": "assistant", "content": "x"}]
+        self.assertNotEqual(summaries.prefix_digests(a), summaries.prefix_digests(b))
+
+
+class SummaryCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        self.cache = LocMemCache("summaries-tests", {})
+        self.cache.clear()
+        patcher = mock.patch.object(summaries, "_cache", lambda: self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class LatestTests(SummaryCacheTestCase):
+    def test_no_checkpoint(self):
+        self.assertEqual(summaries.latest(chat(4)), (0, None))
+
+    def test_longest_summarised_prefix_wins(self):
+        messages = chat(8)
+        digests = summaries.prefix_digests(messages)
+        self.cache.set(summaries.checkpoint_key(digests[1]), "two")
+        self.cache.set(summaries.checkpoint_key(digests[5]), "six")
+        self.assertEqual(summaries.latest(messages), (6, "six"))
+
+    def test_branch_reuses_the_shared_checkpoint(self):
+        messages = chat(6)
+        self.cache.set(summaries.checkpoint_key(summaries.prefix_digests(messages)[3]), "four")
+        branch = messages[:4] + [{"role": "user", "content": "fork"}, {"role": "assistant", "content": "ok"}]
+        self.assertEqual(summaries.latest(branch), (4, "four"))
+
+
+class RollingTests(SummaryCacheTestCase):
+    def fold_base(self, messages, summary):
+        with mock.patch.object(summaries.SUMMARY_POOL, "submit") as submit:
+            rolled, rest = summaries.rolling(messages, summary)
+        return rolled, rest, submit.call_args[0][2]
+
+    def test_client_summary_seeds_the_first_fold(self):
+        summary = ["first topic", {"role": "user", "content": "[SUMMARY #2] second topic"}]
+        rolled, rest, base = self.fold_base(chat(20), summary)
+        self.assertEqual((rolled, len(rest)), (None, 20))
+        self.assertEqual(base, "first topic\n[SUMMARY #2] second topic")
+
+    def test_checkpoint_replaces_the_client_summary(self):
+        messages = chat(20)
+        self.cache.set(summaries.checkpoint_key(summaries.prefix_digests(messages)[1]), "two")
+        rolled, rest, base = self.fold_base(messages, ["stale"])
+        self.assertEqual((rolled, rest, base), ("two", messages[2:], "two"))
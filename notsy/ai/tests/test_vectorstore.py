@@ -0,0 +1,52 @@
+from django.test import SimpleTestCase
+from ai import vectorstore
+import tempfile
+import os
+
+
+def record(vector_id, values, **metadata):
+    return {"id": vector_id, "values": values, "metadata": metadata}
+
+
+class LocalStoreTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        self.store = vectorstore.LocalStore(root=self.root)
+
+    def ids(self, namespace, vector, **kwargs):
+        return [m["id"] for m in self.store.query(vector, namespace, 10, **kwargs)["matches"]]
+
+    def test_upsert_replaces_ids_and_query_ranks_by_cosine(self):
+        self.store.upsert([record("a", [1.0, 0.0]), record("b", [0.0, 1.0])], "ns")
+        self.store.upsert([record("a", [0.0, 2.0])], "ns")
+        self.assertEqual(self.ids("ns", [0.0, 1.0]), ["a", "b"])
+        self.assertEqual(self.store.query([0.0, 1.0], "ns", 10)["matches"][0]["score"], 1.0)
+
+    def test_filters(self):
+        self.store.upsert([record("a", [1.0, 0.0], topic_id=1), record("b", [1.0, 0.1], topic_id=2)], "ns")
+        self.assertEqual(self.ids("ns", [1.0, 0.0], filter={"topic_id": {"$in": [2, "2"]}}), ["b"])
+
+    def test_default_namespace_has_its_own_directory(self):
+        self.store.upsert([record("a", [1.0, 0.0])], "other")
+        self.store.upsert([record("b", [1.0, 0.0])], "")
+        self.assertTrue(os.path.isdir(os.path.join(self.root, vectorstore.DEFAULT_NAMESPACE)))
+        self.assertEqual(self.ids(None, [1.0, 0.0]), ["b"])
+
+        self.store.delete(namespace=None, delete_all=True)
+        self.assertEqual(self.ids("", [1.0, 0.0]), [])
+        self.assertEqual(self.ids("other", [1.0, 0.0]), ["a"])
+
+    def test_path_like_namespaces_are_rejected(self):
+        for namespace in ("..", ".", "a/b"):
+            with self.assertRaises(ValueError):
+                self.store.upsert([record("a", [1.0, 0.0])], namespace)
+            with self.assertRaises(ValueError):
+                self.store.delete(namespace=namespace, delete_all=True)
+        self.assertTrue(os.path.isdir(self.root))
+
+    def test_delete_ids(self):
+        self.store.upsert([record("a", [1.0, 0.0]), record("b", [0.0, 1.0])], "ns")
+        self.store.delete(ids=["a"], namespace="ns")
+        self.assertEqual(self.ids("ns", [1.0, 0.0]), ["b"])
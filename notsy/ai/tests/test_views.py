@@ -0,0 +1,59 @@
+from rest_framework.test import APIRequestFactory
+from concurrent.futures import Future
+from django.test import SimpleTestCase
+from ai.views import flag, parse_top_k, studyPack
+from ai.tests import word_tokens
+from unittest import mock
+from ai import views
+
+
+class FlagTests(SimpleTestCase):
+    def test_json_booleans(self):
+        self.assertTrue(flag({"cache": True}, "cache"))
+        self.assertFalse(flag({"cache": False}, "cache"))
+
+    def test_strings(self):
+        for value in ("true", "True", "1", "yes", "on"):
+            self.assertTrue(flag({"cache": value}, "cache"), value)
+        for value in ("false", "False", "0", "no", ""):
+            self.assertFalse(flag({"cache": value}, "cache"), value)
+
+    def test_default(self):
+        self.assertFalse(flag({}, "cache"))
+        self.assertTrue(flag({}, "stream", True))
+        self.assertFalse(flag({"stream": "false"}, "stream", True))
+
+
+class ParseTopKTests(SimpleTestCase):
+    def test_ints_and_numeric_strings(self):
+        self.assertEqual(parse_top_k({}), 3)
+        self.assertEqual(parse_top_k({"top_k": 5}), 5)
+        self.assertEqual(parse_top_k({"top_k": " 7 "}), 7)
+        self.assertEqual(parse_top_k({"top_k": 4.0}), 4)
+
+    def test_rejects_bad_values(self):
+        for value in ("three", "", None, True, 2.5, [3], 0, -1, 10 ** 6):
+            with self.assertRaises(ValueError, msg=value):
+                parse_top_k({"top_k": value})
+
+
+class StudyPackStreamTests(SimpleTestCase):
+    def setUp(self):
+        for patcher in (word_tokens(), mock.patch.object(views.utils, "query", return_value=[])):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_disconnect_cancels_queued_artifacts(self):
+        futures = [Future(), Future()]
+        futures[0].set_result("notes")
+        pool = mock.Mock(submit=mock.Mock(side_effect=futures))
+        request = APIRequestFactory().post("/study_pack/", {
+            "messages": [{"role": "user", "content": "q"}, {"role": "assistant", "content": "a"}],
+            "summary": [], "artifacts": ["notes", "cards"],
+        }, format="json")
+        with mock.patch.object(views, "STUDY_POOL", pool):
+            response = studyPack.as_view()(request)
+        stream = iter(response.streaming_content)
+        self.assertIn(b"event: notes", next(stream))
+        response.close()
+        self.assertTrue(futures[1].cancelled())
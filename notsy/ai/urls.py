@@ -1,15 +1,29 @@
 from django.urls import path
 from .views import *
+from .async_views import *
 
 urlpatterns = [
     path('', helloWorldView.as_view(), name='hello'),
     path('respond/', augmentedRespond.as_view(), name='respond'),
+    path('respond/stream/', augmentedRespondStream.as_view(), name='respond stream'),
     path('upload/', miniRag.as_view(), name='miniRag'),
+    path('upload/<uuid:job_id>/', ingestStatus.as_view(), name='upload status'),
     path('querry/', query.as_view(), name='querry'),
     path('moded_query/', modedQuery.as_view(), name='moded_query'),
     path('notes/', makeNotes.as_view(), name='Revision notes'),
     path('cards/', makeFlashCards.as_view(), name='Flash Cards'),
     path('quiz/', makeQuizCards.as_view(), name='Quiz Cards'),
+    path('study_pack/', studyPack.as_view(), name='Study Pack'),
     path('graph/', grapher.as_view(), name='Make Full Graph'),
     path('add_node/', addNode.as_view(), name='Add Node'),
+    path('health/', health.as_view(), name='health'),
+    path('metrics/', prometheusMetrics.as_view(), name='metrics'),
+    # Async endpoints, served by the ASGI app (config/asgi.py)
+    path('async/respond/', asyncAugmentedRespond.as_view(), name='async respond'),
+    path('async/querry/', asyncQuery.as_view(), name='async querry'),
+    path('async/notes/', asyncMakeNotes.as_view(), name='async Revision notes'),
+    path('async/cards/', asyncMakeFlashCards.as_view(), name='async Flash Cards'),
+    path('async/quiz/', asyncMakeQuizCards.as_view(), name='async Quiz Cards'),
+    path('async/study_pack/', asyncStudyPack.as_view(), name='async Study Pack'),
+    path('async/graph/', asyncGrapher.as_view(), name='async Make Full Graph'),
 ]
\ No newline at end of file
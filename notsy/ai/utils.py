@@ -1,191 +1,281 @@
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from pinecone import Pinecone, ServerlessSpec
 from dotenv import load_dotenv
-from openai import OpenAI
-from PyPDF2 import PdfReader
-import pandas as pd
+from tenacity import retry, stop_after_attempt, wait_exponential
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from . import corpus, clients, embedding_cache, response_cache, pdf, manifest, chunking, vectorstore, rerank, metrics, scheduler
 import requests
-import tiktoken
+import contextvars
 import tempfile
-import uuid
+import logging
+import time
 import json
 import os
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-OPENAI_DF = pd.read_csv(os.path.join(BASE_DIR, 'openai_docs_chunked.csv'))
-GFG_DF = pd.read_csv(os.path.join(BASE_DIR, 'gfg_cleaned.csv'))
+EMBEDDING_MODEL = chunking.EMBEDDING_MODEL
+# Embedding requests are capped both by input count and by total tokens
+EMBED_BATCH_TOKENS = int(os.getenv('EMBED_BATCH_TOKENS', 200000))
+EMBED_BATCH_SIZE = int(os.getenv('EMBED_BATCH_SIZE', 512))
+UPSERT_BATCH_SIZE = int(os.getenv('UPSERT_BATCH_SIZE', 50))
+BATCH_RETRIES = int(os.getenv('BATCH_RETRIES', 3))
+# Matches scoring below this are dropped before reranking
+RAG_MIN_SCORE = float(os.getenv('RAG_MIN_SCORE', 0.0))
+# Ask Pinecone for the candidate embeddings too (larger responses, embedding-based MMR)
+RERANK_FETCH_VALUES = os.getenv('RERANK_FETCH_VALUES', '0') == '1'
 
 def initialize_openai_client():
-    key = os.getenv('OPENAI_API_KEY')
-    org_key = os.getenv('OPENAI_ORG_KEY')
-    project_id = os.getenv('OPENAI_PROJECT_ID')
-
-    client = OpenAI(
-        api_key=key,
-        organization=org_key,
-        project=project_id,
-    )
-    
-    return client
+    # Shared per worker process, keeps its HTTP connection pool warm
+    return clients.get_openai_client()
 
 def initialize_pincone():
-    pine_key = os.getenv('PINE_API_KEY')
-    host = os.getenv('PINE_HOST')
-    pc = Pinecone(api_key=pine_key)
-    index = pc.Index(host=host)
-    return index 
+    return clients.get_pinecone_index()
 
-def get_embedding(client,text, model="text-embedding-3-large"):
+get_encoding = chunking.get_encoding
+
+@metrics.timed("get_embedding")
+def get_embedding(client,text, model=EMBEDDING_MODEL):
     text = text.replace("\n", " ")
-    return client.embeddings.create(input = [text], model=model).data[0].embedding
+    cached = embedding_cache.lookup(model, text)
+    if cached is not None:
+        return cached
+    response = scheduler.call(model, scheduler.estimate(text, output=0), client.embeddings.create, input=[text], model=model)
+    metrics.record_usage("embedding", model, response.usage)
+    embedding = response.data[0].embedding
+    embedding_cache.store(model, text, embedding)
+    return embedding
+
+def pack_batches(texts, max_tokens=EMBED_BATCH_TOKENS, max_items=EMBED_BATCH_SIZE, key=None):
+    # Group consecutive texts (or items whose text is key(item)) into batches that fit one embeddings request
+    encoding = get_encoding()
+    batch, batch_tokens = [], 0
+    for text in texts:
+        n_tokens = len(encoding.encode(key(text) if key else text, disallowed_special=()))
+        if batch and (batch_tokens + n_tokens > max_tokens or len(batch) >= max_items):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(text)
+        batch_tokens += n_tokens
+    if batch:
+        yield batch
 
+@metrics.timed("embed_batch")
+def embed_batch(client, texts, model=EMBEDDING_MODEL):
+    texts = [text.replace("\n", " ") for text in texts]
+    response = scheduler.call(model, scheduler.estimate(texts, output=0), client.embeddings.create, input=texts, model=model)
+    metrics.record_usage("embedding", model, response.usage)
+    return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+@retry(stop=stop_after_attempt(BATCH_RETRIES), wait=wait_exponential(multiplier=1, max=20), reraise=True)
+@metrics.timed("index.upsert")
+def upsert_batch(store, vectors, namespace):
+    store.upsert(vectors=vectors, namespace=namespace)
+
+@metrics.timed("create_chunks")
 def create_chunks(text):
-    encoding = tiktoken.encoding_for_model("text-embedding-3-large")
-    tokens = encoding.encode(text)
-    data=[]
-    if(len(tokens)> 8180):
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=8180,
-            chunk_overlap=200,
-        )
-        chunks = text_splitter.split_text(text)
-        for i, chunk in enumerate(chunks):
-            data.append(chunk)  
-    else:
-        data.append(text)
-    return data
+    # Token-window chunks that fit one embedding input, see chunking.py
+    return chunking.chunk_text(text)
 
-def upsert_text(text, metadata, namespace):
+def upsert_text(text, metadata, namespace, progress=None):
     # This function is used to upsert a Single string of text to Pinecone
-    chunks = create_chunks(text)
-    client = initialize_openai_client()
-    index = initialize_pincone()
+    return upsert_chunks(create_chunks(text), metadata, namespace, progress=progress)
 
+def upsert_pages(pages, metadata, namespace, progress=None):
+    # Same as upsert_text for a stream of page texts, embedding starts before the last page arrives
+    return upsert_chunks(chunking.chunk_pages(pages), metadata, namespace, progress=progress)
+
+@metrics.timed("upsert_chunks")
+def upsert_chunks(chunks, metadata, namespace, progress=None):
+    # progress(stats) is called after every embedding batch
     if 'topic_id' not in metadata: 
         raise ValueError("topic_id not found in metadata")
     if 'user_id' not in metadata: 
         raise ValueError("user_id not found in metadata")
 
-    for i, text in enumerate(chunks):
-        try:
-            # Generate a unique ID using UUID
-            unique_id = str(uuid.uuid4())
-            vector = {
-                'id': f"vec-{metadata['topic_id']}-{metadata['url']}-{unique_id}",
-                'values': get_embedding(client=client, text=text),
-                'metadata': metadata
-            }
-            index.upsert(vectors=[vector], namespace=namespace)
-        except Exception as e:
-            raise Exception(f"Error in upserting data to Pinecone: {str(e)}")
+    start = time.perf_counter()
+    client = initialize_openai_client()
+    store = vectorstore.get_store(namespace)
+    stats = {"chunks": 0, "skipped": 0, "embed_requests": 0, "upsert_requests": 0}
 
-def query(text, namespace, top_k):
-    threshold = 0.0
-    index = initialize_pincone()
+    # Chunk texts and hashes go to the manifest, not into the vector metadata
+    pending_chunks = {}
+    seen = set()
 
-    # Step 1: Chunk text based on size
-    data_chunks = create_chunks(text)
-    if not data_chunks:
-        raise ValueError("No chunks returned from the input text. Check 'create_chunks()' logic.")
-    data = data_chunks[0]
+    def flush(vectors):
+        upsert_batch(store, vectors, namespace)
+        manifest.record(namespace, vectors, metadata, {vector["id"]: pending_chunks.pop(vector["id"], {}) for vector in vectors})
+        stats["upsert_requests"] += 1
+
+    try:
+        pending = []
+        # The manifest is checked per embedding batch, so embedding starts as soon as
+        # the first batch of chunks is ready
+        for group in pack_batches(manifest.hashed(chunks, metadata['topic_id']), key=lambda chunk: chunk["text"]):
+            batch = manifest.unseen(group, namespace, seen, stats)
+            if not batch:
+                continue
+            embeddings = embed_batch(client=client, texts=[chunk["text"] for chunk in batch])
+            stats["chunks"] += len(batch)
+            stats["embed_requests"] += 1
+            for chunk, embedding in zip(batch, embeddings):
+                pending_chunks[chunk["id"]] = chunk
+                # Content-addressed id, so re-uploads map onto the same vectors
+                pending.append({
+                    'id': chunk["id"],
+                    'values': embedding,
+                    'metadata': metadata
+                })
+            while len(pending) >= UPSERT_BATCH_SIZE:
+                flush(pending[:UPSERT_BATCH_SIZE])
+                pending = pending[UPSERT_BATCH_SIZE:]
+            if progress:
+                progress(stats)
+        if pending:
+            flush(pending)
+    except Exception as e:
+        raise Exception(f"Error in upserting data to Pinecone: {str(e)}")
+
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+    stats["chunks_per_second"] = round(stats["chunks"] / stats["seconds"], 2) if stats["seconds"] else None
+    logger.info("Upserted %s to %s: %s", metadata.get('url'), namespace, stats)
+    return stats
+
+def embed_query(text):
+    # Step 1: Only the first chunk's worth of tokens is embedded
+    data = chunking.truncate(text)
+    if not data:
+        raise ValueError("Empty query text.")
 
     # Step 2: Get vector
-    vector = get_embedding(client=initialize_openai_client(), text=data)
-
-    # Step 3: Query Pinecone
-    answer = index.query(
-        vector=vector,
-        top_k=top_k,
-        include_metadata=True,
-        namespace=namespace
-    )
+    return get_embedding(client=initialize_openai_client(), text=data)
 
+def topic_filter(user_id=None, topic_id=None):
+    # Pinecone metadata filter so top_k is applied within the user's topic
+    conditions = {}
+    if isinstance(topic_id, int) and not isinstance(topic_id, bool):
+        # Uploads queued before job topic ids kept their type were stored as strings
+        conditions["topic_id"] = {"$in": [topic_id, str(topic_id)]}
+    elif topic_id is not None:
+        conditions["topic_id"] = {"$eq": topic_id}
+    if user_id is not None:
+        conditions["user_id"] = {"$eq": user_id}
+    return conditions or None
+
+def query(text, namespace, top_k, filter=None):
+    return query_vector(embed_query(text), namespace, top_k, filter=filter, text=text)
+
+def candidate_request(namespace, top_k):
+    # Over-fetch for the reranker; embeddings come along when they are cheap to get
+    store = vectorstore.get_store(namespace)
+    fetch_k = rerank.candidates(top_k)
+    include_values = fetch_k > top_k and (RERANK_FETCH_VALUES or isinstance(store, vectorstore.LocalStore))
+    return store, fetch_k, include_values
+
+def query_vector(vector, namespace, top_k, filter=None, text=None):
+    # Step 3: Query Pinecone, or the local store for namespaces built with build_vector_store
+    store, fetch_k, include_values = candidate_request(namespace, top_k)
+    with metrics.span("index.query", type(store).__name__):
+        answer = store.query(
+            vector=vector,
+            top_k=fetch_k,
+            namespace=namespace,
+            filter=filter,
+            include_values=include_values
+        )
+
+    # Step 4: Rerank the candidates down to top_k
+    docs = resolve_matches(answer.get("matches", []), namespace)
+    with metrics.span("rerank"):
+        return rerank.rerank(text, docs, top_k, namespace)
+
+def resolve_matches(matches, namespace):
     result = []
-    matches = answer.get("matches", [])
     if not matches:
         return result
 
-    for match in matches:
-        score = match.get("score", 0)
-        if score < threshold:
-            continue
+    matches = [match for match in matches if (match.get("score") or 0) >= RAG_MIN_SCORE]
 
-        metadata = match.get("metadata", {})
-        if namespace == 'openai-ref':
-            id = match.get("id")
-            content_row = OPENAI_DF[OPENAI_DF['id'] == id]
-            if content_row.empty:
-                continue
-            content = content_row['text'].values[0]
-            result.append({"content": content, "metadata": metadata})
+    # Reference corpora keep their text locally, keyed by id (openai-ref) or url (gfg)
+    if namespace == 'openai-ref':
+        keys = [match.get("id") for match in matches]
+    elif namespace == 'gfg':
+        keys = [match.get("metadata", {}).get("url") for match in matches]
+    else:
+        keys = None
+    if keys is not None:
+        texts = corpus.get_texts(namespace, keys)
+    else:
+        # Uploaded chunks keep their text in the manifest, one lookup for all matches
+        texts = manifest.texts(namespace, [match.get("id") for match in matches])
 
-        elif namespace == 'gfg':
-            url = metadata.get("url")
-            content_row = GFG_DF[GFG_DF['url'] == url]
-            if content_row.empty:
+    for i, match in enumerate(matches):
+        metadata = match.get("metadata", {})
+        if keys is not None:
+            content = texts.get(str(keys[i]))
+            if content is None:
                 continue
-            content = content_row['text'].values[0]
-            result.append({"content": content, "metadata": metadata})
-
         else:
-            content = metadata.get("text", "")
-            result.append({"content": content, "metadata": metadata})
+            # Vectors upserted before the manifest kept text still carry it in metadata
+            content = texts.get(match.get("id")) or metadata.get("text", "")
+        doc = {"content": content, "metadata": metadata, "score": match.get("score")}
+        if match.get("values"):
+            doc["values"] = match.get("values")
+        result.append(doc)
 
     return result
 
 def clean_messages_for_gpt(messages):
     return [{"role": msg["role"], "content": msg["content"]} for msg in messages if "role" in msg and "content" in msg]
 
+# Namespaces retrieved for each chat mode, in [RAG #i] order: (namespace, top_k)
+# None stands for the user's own namespace, queried with a topic filter
+RAG_PLANS = {
+    "0": [(None, 2), ("gfg", 2)],
+    "1": [("dev", 3), ("openai-ref", 3)],
+    "2": [("gfg", 3)],
+    "4": [("gfg", 3)],
+}
+RAG_NAMESPACE_TIMEOUT = float(os.getenv('RAG_NAMESPACE_TIMEOUT', 4))
+RAG_POOL = ThreadPoolExecutor(max_workers=int(os.getenv('RAG_POOL_SIZE', 16)), thread_name_prefix="rag")
+
 def moded_query(text, mode, user_id, topic_id):
+    return rag_context(moded_docs(text, mode, user_id, topic_id))
+
+def moded_docs(text, mode, user_id, topic_id):
     # Get both gfg and user specific 
-    context = []
-    i = 1
+    plan = RAG_PLANS.get(mode)
+    if not plan:
+        return []
     try:
-        if mode == "0":
-            # Default Mode
-            mini_rag_results = query(text, user_id, 2)
-            filtered_rag = [doc for doc in mini_rag_results if doc.get("metadata", {}).get("topic_id") == topic_id]
-            for doc in filtered_rag:
-                content = doc.get("content", "")
-                context.append({"role": "system", "content": f"[RAG #{i}] {content}"})
-                i+=1
-            academic_rag_results = query(text, "gfg", 2)
-            for doc in academic_rag_results:
-                content = doc.get("content", "")
-                context.append({"role": "system", "content": f"[RAG #{i}] {content}"})
-                i+=1
-        elif mode == "1":
-            # Dev mode
-            dev_rag_results = query(text, 'dev', 3)
-            for doc in dev_rag_results:
-                content = doc.get("content", "")
-                context.append({"role": "system", "content": f"[RAG #{i}] {content}"})
-                i+=1
-            openai_rag_results = query(text, "openai-ref", 3)
-            for doc in openai_rag_results:
-                content = doc.get("content", "")
-                context.append({"role": "system", "content": f"[RAG #{i}] {content}"})
-                i+=1
-        elif mode == "2":
-            # Master This
-            mega_rag_results = query(text, "gfg", 3)
-            for doc in mega_rag_results:
-                content = doc.get("content", "")
-                context.append({"role": "system", "content": f"[RAG #{i}] {content}"})
-                i+=1
-        elif mode == "4":
-            #Last Minute
-            last_minute_rag_results = query(text, "gfg", 3)
-            for doc in last_minute_rag_results:
-                content = doc.get("content", "")
-                context.append({"role": "system", "content": f"[RAG #{i}] {content}"})
-                i+=1
+        # Embed once, then query every namespace of the mode concurrently
+        vector = embed_query(text)
+        start = time.perf_counter()
+        futures = [
+            (namespace or user_id, RAG_POOL.submit(
+                contextvars.copy_context().run, query_vector, vector, namespace or user_id, top_k,
+                filter=topic_filter(user_id, topic_id) if namespace is None else None, text=text
+            ))
+            for namespace, top_k in plan
+        ]
+        results = []
+        for name, future in futures:
+            remaining = max(0.0, RAG_NAMESPACE_TIMEOUT - (time.perf_counter() - start))
+            try:
+                docs = future.result(timeout=remaining)
+            except FutureTimeoutError:
+                future.cancel()
+                logger.warning("RAG query on namespace %s exceeded %.1fs, skipping", name, RAG_NAMESPACE_TIMEOUT)
+                continue
+            results.extend(docs)
     except Exception as e:
         raise Exception(f"Error in querying data from pinecone: {str(e)}")
-    return context
+    return results
+
+def rag_context(docs):
+    return [{"role": "system", "content": f"[RAG #{i+1}] {doc.get('content', '')}"} for i, doc in enumerate(docs)]
 
 # 0: Default (Balanced)
 # 1: Dev mode
@@ -194,8 +284,7 @@ def moded_query(text, mode, user_id, topic_id):
 # 4: Last minute
 # 5: chat with pdf/video
 
-def get_response(input,max_tokens=-1, temp=-1 ,model="gpt-4.1"):
-    client = initialize_openai_client()
+def build_request(input, max_tokens=-1, temp=-1, model="gpt-4.1"):
     req_data = {
         "model": model,
         "input": input
@@ -204,149 +293,334 @@ def get_response(input,max_tokens=-1, temp=-1 ,model="gpt-4.1"):
         req_data["temperature"] = temp
     if max_tokens != -1:
         req_data["max_output_tokens"] = max_tokens
+    return req_data
+
+def get_response(input,max_tokens=-1, temp=-1 ,model="gpt-4.1", input_tokens=None):
+    # input_tokens: the prompt size when the caller already counted it (budget.assemble)
+    client = initialize_openai_client()
+    req_data = build_request(input, max_tokens=max_tokens, temp=temp, model=model)
     try:
-        response = client.responses.create(**req_data)
+        with metrics.span("get_response", model):
+            response = scheduler.call(model, scheduler.estimate(input, max_tokens, input_tokens), client.responses.create, **req_data)
     except Exception as e:
         raise Exception(f"Error in getting response from OpenAI: {str(e)}")
+    metrics.record_usage("respond", model, response.usage)
     return response
 
-def noteGenerator(context, model="gpt-4.1"):
+def stream_response(input, max_tokens=-1, temp=-1, model="gpt-4.1", input_tokens=None):
+    # Yields Responses API stream events (output_text deltas, then response.completed)
     client = initialize_openai_client()
-    summary = client.responses.create(
-        model=model,
-        input=context,
-        text={
+    req_data = build_request(input, max_tokens=max_tokens, temp=temp, model=model)
+    with metrics.span("stream_response", model):
+        try:
+            estimate = scheduler.estimate(input, max_tokens, input_tokens)
+            stream = scheduler.call(model, estimate, client.responses.create, stream=True, **req_data)
+        except Exception as e:
+            raise Exception(f"Error in getting response from OpenAI: {str(e)}")
+        with stream:
+            for event in stream:
+                if event.type == "response.completed":
+                    metrics.record_usage("respond", model, event.response.usage)
+                    # The stream had no usage when it was admitted
+                    scheduler.settle(model, estimate, getattr(event.response.usage, "total_tokens", None))
+                yield event
+
+def parse_json_output(response):
+    try:
+        return json.loads(response.output_text)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Invalid JSON in model response: {response.output_text[:200]}...") from e
+
+NOTES_FORMAT = {
+    "format": {
+        "type": "json_schema",
+        "name": "generate_revision_notes",
+        "schema": {
+            "type": "object",
+            "properties": {
+                "title": { "type": "string"},
+                "introduction": { "type": "string" },
+                "core_concepts": {
+                    "type": "array",
+                    "items": { "type": "string", "description": "Detailed explanation of core concept of the topic"}
+                },
+                "example_or_use_case": { "type": "string", "description": "Example or use case of the topic, Fill it only if you some good examples otherwise leave it empty" },
+                "common_confusions": {
+                    "type": "array",
+                    "items": { "type": "string", "description": "Common confusions/pitfalls students fall into, Fill it only if you something important otherwise leave it empty" }
+                },
+                "memory_tips": { "type": "string" , "description": "Memory tips to remember the topic, Fill it only if you some good tip otherwise leave it empty" }
+            },
+            "required": ["title", "introduction", "core_concepts", "example_or_use_case", "common_confusions", "memory_tips"],
+            "additionalProperties": False
+        },
+        "strict": True
+    }
+}
+
+FLASHCARDS_FORMAT = {
+    "format": {
+        "type": "json_schema",
+        "name": "generate_flashcards",
+        "schema": {
+            "type": "object",
+            "properties": {
+                "topic": { "type": "string" },
+                "flashcards": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "concept": {
+                                "type": "string",
+                                "description": "A concise fact, formula, or concept relevant to the topic"
+                            },
+                            "explanation": {
+                                "type": "string",
+                                "description": "A short explanation, use-case, or memory aid for the concept"
+                            },
+                            "color": {
+                                "type": "string",
+                                "enum": ["red", "yellow", "green"],
+                                "description": "Importance level: red = critical, yellow = important, green = regular"
+                            }
+                        },
+                        "required": ["concept", "explanation", "color"],
+                        "additionalProperties": False
+                    }
+                }
+            },
+            "required": ["topic", "flashcards"],
+            "additionalProperties": False
+        },
+        "strict": True
+    }
+}
+
+QUIZ_FORMAT = {
+    "format": {
+        "type": "json_schema",
+        "name": "generate_progressive_quiz",
+        "schema": {
+            "type": "object",
+            "properties": {
+                "topic": { "type": "string" },
+                "questions": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "question": {
+                                "type": "string",
+                                "description": "A single multiple-choice or short-answer style question that tests knowledge of the topic"
+                            },
+                            "answer": {
+                                "type": "string",
+                                "description": "The correct answer or explanation"
+                            },
+                            "color": {
+                                "type": "string",
+                                "enum": ["green", "yellow", "red"],
+                                "description": "Difficulty level: green = easy, yellow = medium, red = hard/tricky"
+                            }
+                        },
+                        "required": ["question", "answer", "color"],
+                        "additionalProperties": False
+                    }
+                }
+            },
+            "required": ["topic", "questions"],
+            "additionalProperties": False
+        },
+        "strict": True
+    }
+}
+
+def structured_response(context, text_format, model="gpt-4.1", cache=False, input_tokens=None):
+    # cache=True reuses the stored result when the same context was seen before
+    name = text_format["format"]["name"]
+    def compute():
+        client = initialize_openai_client()
+        with metrics.span("generate", name):
+            response = scheduler.call(
+                model, scheduler.estimate(context, input_tokens=input_tokens), client.responses.create,
+                model=model, input=context, text=text_format,
+            )
+        metrics.record_usage(name, model, response.usage)
+        return parse_json_output(response)
+    if not cache:
+        return compute()
+    return response_cache.cached_call({"model": model, "input": context, "text": text_format}, compute)
+
+def noteGenerator(context, model="gpt-4.1", cache=False, input_tokens=None):
+    return structured_response(context, NOTES_FORMAT, model=model, cache=cache, input_tokens=input_tokens)
+
+def flashcardGenerator(context, model="gpt-4.1", cache=False, input_tokens=None):
+    return structured_response(context, FLASHCARDS_FORMAT, model=model, cache=cache, input_tokens=input_tokens)
+
+def quizGenerator(context, model="gpt-4.1", cache=False, input_tokens=None):
+    return structured_response(context, QUIZ_FORMAT, model=model, cache=cache, input_tokens=input_tokens)
+
+GRAPH_EDGES = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "target": {"type": "string"},
+            "reason": {"type": "string"}
+        },
+        "required": ["target", "reason"],
+        "additionalProperties": False
+    }
+}
+
+def graph_request(topics):
+    # Request kwargs for building the full labeled topic graph
+    return {
+        "model": "gpt-4o",
+        "temperature": 0.0,
+        "input": [
+            {
+                "role": "system",
+                "content": (
+                    "You are an educational assistant. Your job is to organize the user's notes into a graph structure. "
+                    "You will receive topic names and their indices. You must return a labeled adjacency list: "
+                    "each topic's index should map to a list of objects representing related topics. "
+                    "Each object must include the related topic index as `target` and a short explanation `reason` (1-5 words) for the connection."
+                )
+            },
+            {"role": "user", "content": f"topics = {str(topics)}"}
+        ],
+        "text": {
             "format": {
                 "type": "json_schema",
-                "name": "generate_revision_notes",
+                "name": "labeled_notes_graph",
                 "schema": {
                     "type": "object",
-                    "properties": {
-                        "title": { "type": "string"},
-                        "introduction": { "type": "string" },
-                        "core_concepts": {
-                            "type": "array",
-                            "items": { "type": "string", "description": "Detailed explanation of core concept of the topic"}
-                        },
-                        "example_or_use_case": { "type": "string", "description": "Example or use case of the topic, Fill it only if you some good examples otherwise leave it empty" },
-                        "common_confusions": {
-                            "type": "array",
-                            "items": { "type": "string", "description": "Common confusions/pitfalls students fall into, Fill it only if you something important otherwise leave it empty" }
-                        },
-                        "memory_tips": { "type": "string" , "description": "Memory tips to remember the topic, Fill it only if you some good tip otherwise leave it empty" }
-                    },
-                    "required": ["title", "introduction", "core_concepts", "example_or_use_case", "common_confusions", "memory_tips"],
+                    "properties": {str(k): GRAPH_EDGES for k in topics.keys()},
+                    "required": list(map(str, topics.keys())),
                     "additionalProperties": False
                 },
                 "strict": True
             }
         }
-    )
-    try:
-        return json.loads(summary.output_text)
-    except json.JSONDecodeError as e:
-        raise ValueError(f"Invalid JSON in model response: {summary.output_text[:200]}...") from e
+    }
 
-def flashcardGenerator(context, model="gpt-4.1"):
-    client = initialize_openai_client()
-    response = client.responses.create(
-        model=model,
-        input=context,
-        text={
+def graph_edges(targets):
+    # Edge list schema whose targets are limited to the given topic ids
+    return {
+        "type": "array",
+        "items": {
+            "type": "object",
+            "properties": {
+                "target": {"type": "string", "enum": [str(t) for t in targets]},
+                "reason": {"type": "string"}
+            },
+            "required": ["target", "reason"],
+            "additionalProperties": False
+        }
+    }
+
+def node_request(node_id, label, topic_labels, old_graph):
+    # Request kwargs for connecting one new node to (a shortlist of) an existing graph
+    prompt = (
+        f"You are expanding a topic graph. A new topic '{label}' (ID: {node_id}) has been added.\n"
+        f"Here are the existing topics:\n"
+        f"{json.dumps(topic_labels, separators=(',', ':'))}\n"
+        f"{json.dumps(old_graph, separators=(',', ':'))}\nold graph for reference\n"
+        f"Based on their meanings, return a list of nodes this new topic is connected to, along with a short explanation `reason` (1-5 words) for the connection."
+    )
+    return {
+        "model": "gpt-4o",
+        "temperature": 0.0,
+        "input": prompt,
+        "text": {
             "format": {
                 "type": "json_schema",
-                "name": "generate_flashcards",
+                "name": "labeled_notes_graph",
                 "schema": {
                     "type": "object",
-                    "properties": {
-                        "topic": { "type": "string" },
-                        "flashcards": {
-                            "type": "array",
-                            "items": {
-                                "type": "object",
-                                "properties": {
-                                    "concept": {
-                                        "type": "string",
-                                        "description": "A concise fact, formula, or concept relevant to the topic"
-                                    },
-                                    "explanation": {
-                                        "type": "string",
-                                        "description": "A short explanation, use-case, or memory aid for the concept"
-                                    },
-                                    "color": {
-                                        "type": "string",
-                                        "enum": ["red", "yellow", "green"],
-                                        "description": "Importance level: red = critical, yellow = important, green = regular"
-                                    }
-                                },
-                                "required": ["concept", "explanation", "color"],
-                                "additionalProperties": False
-                            }
-                        }
-                    },
-                    "required": ["topic", "flashcards"],
+                    "properties": {str(node_id): graph_edges(topic_labels.keys()) if topic_labels else GRAPH_EDGES},
+                    "required": [str(node_id)],
                     "additionalProperties": False
                 },
                 "strict": True
             }
         }
-    )
-    try:
-        return json.loads(response.output_text)
-    except json.JSONDecodeError as e:
-        raise ValueError(f"Invalid JSON in model response: {response.output_text[:200]}...") from e
+    }
 
-def quizGenerator(context, model="gpt-4.1"):
-    client = initialize_openai_client()
-    response = client.responses.create(
-        model=model,
-        input=context,
-        text={
+def shard_request(shard, candidates):
+    # Request kwargs for the edges of one shard of a large graph.
+    # shard: {id: label} whose edges are wanted, candidates: {id: label} they may connect to
+    return {
+        "model": "gpt-4o",
+        "temperature": 0.0,
+        "input": [
+            {
+                "role": "system",
+                "content": (
+                    "You are an educational assistant. Your job is to organize the user's notes into a graph structure. "
+                    "You will receive a set of topics to connect and the candidate topics they may connect to, with their indices. "
+                    "Each topic to connect should map to a list of objects representing related candidate topics. "
+                    "Each object must include the related topic index as `target` and a short explanation `reason` (1-5 words) for the connection."
+                )
+            },
+            {"role": "user", "content": f"topics = {str(shard)}\ncandidates = {str(candidates)}"}
+        ],
+        "text": {
             "format": {
                 "type": "json_schema",
-                "name": "generate_progressive_quiz",
+                "name": "labeled_notes_graph",
                 "schema": {
                     "type": "object",
-                    "properties": {
-                        "topic": { "type": "string" },
-                        "questions": {
-                            "type": "array",
-                            "items": {
-                                "type": "object",
-                                "properties": {
-                                    "question": {
-                                        "type": "string",
-                                        "description": "A single multiple-choice or short-answer style question that tests knowledge of the topic"
-                                    },
-                                    "answer": {
-                                        "type": "string",
-                                        "description": "The correct answer or explanation"
-                                    },
-                                    "color": {
-                                        "type": "string",
-                                        "enum": ["green", "yellow", "red"],
-                                        "description": "Difficulty level: green = easy, yellow = medium, red = hard/tricky"
-                                    }
-                                },
-                                "required": ["question", "answer", "color"],
-                                "additionalProperties": False
-                            }
-                        }
-                    },
-                    "required": ["topic", "questions"],
+                    "properties": {str(k): graph_edges(candidates.keys()) for k in shard.keys()},
+                    "required": list(map(str, shard.keys())),
                     "additionalProperties": False
                 },
                 "strict": True
             }
         }
-    )
-    try:
+    }
+
+def cached_json_response(request):
+    # For the temperature 0 graph calls: identical requests share one model call
+    def compute():
+        client = initialize_openai_client()
+        with metrics.span("graph_response"), scheduler.prioritized("graph"):
+            response = scheduler.call(request["model"], scheduler.estimate(request["input"]), client.responses.create, **request)
+        metrics.record_usage("graph", request.get("model"), response.usage)
         return json.loads(response.output_text)
-    except json.JSONDecodeError as e:
-        raise ValueError(f"Invalid JSON in model response: {response.output_text[:200]}...") from e
+    return response_cache.cached_call(request, compute)
+
+def merge_node_edges(old_graph, node_id, edges):
+    # Adds the new node's edges to the graph in both directions
+    node_id_str = str(node_id)
+    if node_id_str not in old_graph:
+        old_graph[node_id_str] = []
+
+    # Loop over edges specific to this node
+    for edge in edges.get(node_id_str, []):
+        target_id = str(edge["target"])
+        reason = edge["reason"]
 
+        old_graph[node_id_str].append({
+            "target": int(target_id),
+            "reason": reason
+        })
+
+        if target_id not in old_graph:
+            old_graph[target_id] = []
+
+        old_graph[target_id].append({
+            "target": int(node_id),
+            "reason": reason
+        })
+    return old_graph
+
+@metrics.timed("summarize")
 def summarize(client, text):
-    summary = client.responses.create(
+    summary = scheduler.call(
+        "gpt-4o-mini", scheduler.estimate(text, 5000), client.responses.create,
         model="gpt-4o-mini",
         input=[
             {
@@ -361,16 +635,16 @@ def summarize(client, text):
         max_output_tokens=5000,
         temperature=0.5,   
     )
+    metrics.record_usage("summarize", "gpt-4o-mini", summary.usage)
     return summary
 
-def get_pdf_text(file):
+def iter_pdf_pages(file):
+    # Page texts in order; large PDFs are parsed in parallel, see pdf.py
     try:
-        reader = PdfReader(file)
-        text = ""
-        for page in reader.pages:
-            extracted = page.extract_text()
-            if extracted:
-                text += extracted
-        return text
+        yield from pdf.iter_pdf_pages(file)
     except Exception as e:
-        raise Exception(f"PDF extraction failed: {str(e)}")
\ No newline at end of file
+        raise Exception(f"PDF extraction failed: {str(e)}")
+
+@metrics.timed("pdf_extract")
+def get_pdf_text(file):
+    return "".join(iter_pdf_pages(file))
@@ -0,0 +1,353 @@
+from collections import OrderedDict
+from . import clients
+import numpy as np
+import itertools
+import asyncio
+import threading
+import logging
+import shutil
+import json
+import os
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+logger = logging.getLogger(__name__)
+
+# Vector stores behind utils.query_vector / upsert_chunks. Pinecone stays the default;
+# the local store keeps each namespace as a float32 matrix memory-mapped from disk,
+# so the static reference corpora are searched in-process with no round trip.
+#
+# <VECTOR_STORE_DIR>/<namespace>/   (Pinecone's default "" namespace is __default__)
+#   vectors.f32    row-major float32, unit-normalised rows (cosine == dot product)
+#   records.json   {"dimension", "ids", "metadata"}
+#   hnsw.bin       optional HNSW graph over the same rows (needs hnswlib)
+#
+# A namespace is written as a whole: every upsert or delete rewrites it, so n upserts of
+# b vectors cost O(n^2 * b) over an ingest. That suits the reference corpora, built once
+# by build_vector_store; with VECTOR_STORE_BACKEND=local, uploads into large namespaces
+# get slower as the namespace grows.
+
+VECTOR_STORE_DIR = os.getenv('VECTOR_STORE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vector_store'))
+# "pinecone": namespaces listed in VECTOR_STORE_LOCAL are served locally once built.
+# "local": every namespace, user uploads included, lives in the local store (offline).
+VECTOR_STORE_BACKEND = os.getenv('VECTOR_STORE_BACKEND', 'pinecone')
+VECTOR_STORE_LOCAL = [ns for ns in os.getenv('VECTOR_STORE_LOCAL', 'gfg,openai-ref').split(',') if ns]
+# Namespaces with at least this many rows get an HNSW graph when hnswlib is installed
+VECTOR_STORE_HNSW_MIN = int(os.getenv('VECTOR_STORE_HNSW_MIN', 20000))
+VECTOR_STORE_HNSW_EF = int(os.getenv('VECTOR_STORE_HNSW_EF', 128))
+# Filters are evaluated once per namespace and kept as row masks
+FILTER_MASK_CACHE = int(os.getenv('FILTER_MASK_CACHE', 256))
+WRITE_BATCH = 1024
+DEFAULT_NAMESPACE = "__default__"
+
+
+class VectorStore:
+    # Same call shape as a Pinecone Index: query() returns {"matches": [{"id", "score", "metadata"}]}
+    def query(self, vector, namespace, top_k, filter=None, include_values=False):
+        raise NotImplementedError
+
+    async def aquery(self, vector, namespace, top_k, filter=None, include_values=False):
+        # Local searches are numpy work over memory-mapped files, kept off the event loop
+        return await asyncio.to_thread(self.query, vector, namespace, top_k, filter=filter, include_values=include_values)
+
+    def upsert(self, vectors, namespace):
+        raise NotImplementedError
+
+    def delete(self, ids=None, namespace=None, delete_all=False):
+        raise NotImplementedError
+
+
+class PineconeStore(VectorStore):
+    def query(self, vector, namespace, top_k, filter=None, include_values=False):
+        return clients.get_pinecone_index().query(
+            vector=vector,
+            top_k=top_k,
+            include_metadata=True,
+            include_values=include_values,
+            namespace=namespace,
+            filter=filter
+        )
+
+    async def aquery(self, vector, namespace, top_k, filter=None, include_values=False):
+        return await clients.get_async_pinecone_index().query(
+            vector=vector,
+            top_k=top_k,
+            include_metadata=True,
+            include_values=include_values,
+            namespace=namespace,
+            filter=filter
+        )
+
+    def upsert(self, vectors, namespace):
+        return clients.get_pinecone_index().upsert(vectors=vectors, namespace=namespace)
+
+    def delete(self, ids=None, namespace=None, delete_all=False):
+        if delete_all:
+            return clients.get_pinecone_index().delete(delete_all=True, namespace=namespace)
+        return clients.get_pinecone_index().delete(ids=list(ids), namespace=namespace)
+
+
+def _normalise(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _compare(column, op, value):
+    if op == "$eq":
+        return np.fromiter((v == value for v in column), bool, len(column))
+    if op == "$ne":
+        return np.fromiter((v != value for v in column), bool, len(column))
+    if op == "$in":
+        values = set(value)
+        return np.fromiter((v in values for v in column), bool, len(column))
+    if op == "$nin":
+        values = set(value)
+        return np.fromiter((v not in values for v in column), bool, len(column))
+    if op == "$exists":
+        return np.fromiter(((v is not None) == bool(value) for v in column), bool, len(column))
+    if op in ("$gt", "$gte", "$lt", "$lte"):
+        test = {
+            "$gt": lambda v: v > value,
+            "$gte": lambda v: v >= value,
+            "$lt": lambda v: v < value,
+            "$lte": lambda v: v <= value,
+        }[op]
+        return np.fromiter((isinstance(v, (int, float)) and test(v) for v in column), bool, len(column))
+    raise ValueError(f"Unsupported filter operator {op}")
+
+
+class _Namespace:
+    # One built namespace, opened read-only; rows are shared through the page cache
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, "records.json"), encoding="utf-8") as f:
+            records = json.load(f)
+        self.dimension = records["dimension"]
+        self.ids = records["ids"]
+        self.metadata = records["metadata"]
+        self.rows = {vector_id: i for i, vector_id in enumerate(self.ids)}
+        self.vectors = (
+            np.memmap(os.path.join(path, "vectors.f32"), dtype=np.float32, mode="r", shape=(len(self.ids), self.dimension))
+            if self.ids else np.zeros((0, self.dimension), dtype=np.float32)
+        )
+        self.hnsw = None
+        hnsw_path = os.path.join(path, "hnsw.bin")
+        if hnswlib is not None and os.path.exists(hnsw_path):
+            self.hnsw = hnswlib.Index(space="ip", dim=self.dimension)
+            self.hnsw.load_index(hnsw_path, max_elements=len(self.ids))
+            self.hnsw.set_ef(VECTOR_STORE_HNSW_EF)
+        self._columns = {}
+        self._masks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def column(self, field):
+        if field not in self._columns:
+            self._columns[field] = [m.get(field) for m in self.metadata]
+        return self._columns[field]
+
+    def evaluate(self, filter):
+        # Pinecone filter language: {"field": value}, {"field": {"$op": value}}, $and / $or
+        mask = np.ones(len(self.ids), dtype=bool)
+        for field, condition in filter.items():
+            if field == "$and":
+                for clause in condition:
+                    mask &= self.evaluate(clause)
+            elif field == "$or":
+                any_mask = np.zeros(len(self.ids), dtype=bool)
+                for clause in condition:
+                    any_mask |= self.evaluate(clause)
+                mask &= any_mask
+            elif isinstance(condition, dict):
+                for op, value in condition.items():
+                    mask &= _compare(self.column(field), op, value)
+            else:
+                mask &= _compare(self.column(field), "$eq", condition)
+        return mask
+
+    def mask(self, filter):
+        key = json.dumps(filter, sort_keys=True, default=str)
+        with self._lock:
+            if key in self._masks:
+                self._masks.move_to_end(key)
+                return self._masks[key]
+        mask = self.evaluate(filter)
+        with self._lock:
+            self._masks[key] = mask
+            while len(self._masks) > FILTER_MASK_CACHE:
+                self._masks.popitem(last=False)
+        return mask
+
+    def search(self, vector, top_k, filter=None, include_values=False):
+        if not self.ids or top_k <= 0:
+            return []
+        query = np.asarray(vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        if filter:
+            rows = np.flatnonzero(self.mask(filter))
+            scores = self.vectors[rows] @ query if len(rows) else np.zeros(0, dtype=np.float32)
+        elif self.hnsw is not None:
+            labels, distances = self.hnsw.knn_query(query, k=min(top_k, len(self.ids)))
+            rows, scores = labels[0].astype(np.int64), 1.0 - distances[0]
+        else:
+            rows = None
+            scores = self.vectors @ query
+        k = min(top_k, len(scores))
+        if k == 0:
+            return []
+        best = np.argpartition(-scores, k - 1)[:k] if k < len(scores) else np.arange(len(scores))
+        best = best[np.argsort(-scores[best], kind="stable")]
+        matches = []
+        for i in best:
+            row = int(rows[i]) if rows is not None else int(i)
+            match = {"id": self.ids[row], "score": float(scores[i]), "metadata": self.metadata[row]}
+            if include_values:
+                match["values"] = self.vectors[row].tolist()
+            matches.append(match)
+        return matches
+
+
+def namespace_dir(namespace):
+    # Directory name of a namespace under the store root. The root itself is never a
+    # namespace, so an empty or path-like name can not replace or delete every namespace.
+    name = namespace or DEFAULT_NAMESPACE
+    if name in (".", "..") or "/" in name or os.sep in name or (os.altsep and os.altsep in name):
+        raise ValueError(f"Invalid vector store namespace {namespace!r}")
+    return name
+
+
+def write_namespace(namespace, records, root=VECTOR_STORE_DIR, hnsw=None):
+    # Builds a namespace from {"id", "values", "metadata"} records (first id wins) and
+    # swaps it in atomically; readers that still map the old files keep working.
+    final = os.path.join(root, namespace_dir(namespace))
+    tmp = f"{final}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    ids, metadata, seen, dimension = [], [], set(), None
+    with open(os.path.join(tmp, "vectors.f32"), "wb") as out:
+        batch = []
+
+        def flush():
+            if batch:
+                out.write(_normalise(np.asarray(batch, dtype=np.float32)).tobytes())
+                batch.clear()
+
+        for record in records:
+            if record["id"] in seen:
+                continue
+            dimension = dimension or len(record["values"])
+            seen.add(record["id"])
+            ids.append(record["id"])
+            metadata.append(dict(record.get("metadata") or {}))
+            batch.append(record["values"])
+            if len(batch) >= WRITE_BATCH:
+                flush()
+        flush()
+    with open(os.path.join(tmp, "records.json"), "w", encoding="utf-8") as f:
+        json.dump({"dimension": dimension or 0, "ids": ids, "metadata": metadata}, f)
+
+    if hnsw is None:
+        hnsw = len(ids) >= VECTOR_STORE_HNSW_MIN
+    if hnsw and hnswlib is not None and ids:
+        vectors = np.memmap(os.path.join(tmp, "vectors.f32"), dtype=np.float32, mode="r", shape=(len(ids), dimension))
+        graph = hnswlib.Index(space="ip", dim=dimension)
+        graph.init_index(max_elements=len(ids), ef_construction=200, M=16)
+        graph.add_items(vectors, np.arange(len(ids)))
+        graph.save_index(os.path.join(tmp, "hnsw.bin"))
+        del vectors
+    elif hnsw:
+        logger.warning("hnswlib is not installed, %s will use exact search", namespace)
+
+    old = f"{final}.{os.getpid()}.old"
+    if os.path.exists(final):
+        os.replace(final, old)
+    os.replace(tmp, final)
+    shutil.rmtree(old, ignore_errors=True)
+    return len(ids)
+
+
+class LocalStore(VectorStore):
+    def __init__(self, root=VECTOR_STORE_DIR):
+        self.root = root
+        self._namespaces = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+
+    def has_namespace(self, namespace):
+        return os.path.exists(os.path.join(self.root, namespace_dir(namespace), "records.json"))
+
+    def namespace(self, namespace):
+        # Reopened when a rebuild swaps the directory in
+        name = namespace_dir(namespace)
+        path = os.path.join(self.root, name)
+        try:
+            mtime = os.stat(os.path.join(path, "records.json")).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        cached = self._namespaces.get(name)
+        if cached is None or cached[0] != mtime:
+            with self._lock:
+                cached = self._namespaces.get(name)
+                if cached is None or cached[0] != mtime:
+                    cached = (mtime, _Namespace(path))
+                    self._namespaces[name] = cached
+        return cached[1]
+
+    def query(self, vector, namespace, top_k, filter=None, include_values=False):
+        ns = self.namespace(namespace)
+        matches = ns.search(vector, top_k, filter=filter, include_values=include_values) if ns else []
+        return {"matches": matches, "namespace": namespace}
+
+    def records(self, namespace):
+        ns = self.namespace(namespace)
+        if ns is None:
+            return
+        for row, vector_id in enumerate(ns.ids):
+            yield {"id": vector_id, "values": ns.vectors[row], "metadata": ns.metadata[row]}
+
+    def upsert(self, vectors, namespace):
+        # Copies the whole namespace to add one batch (see the note at the top), so
+        # ingesting n batches costs O(n^2); fine for corpus builds, not for bulk traffic
+        vectors = list(vectors)
+        replaced = {vector["id"] for vector in vectors}
+        with self._write_lock:
+            existing = (record for record in self.records(namespace) if record["id"] not in replaced)
+            count = write_namespace(namespace, itertools.chain(vectors, existing), root=self.root)
+        return {"upserted_count": len(vectors), "total": count}
+
+    def delete(self, ids=None, namespace=None, delete_all=False):
+        name = namespace_dir(namespace)
+        with self._write_lock:
+            if delete_all:
+                shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+                self._namespaces.pop(name, None)
+                return {}
+            drop = set(ids or ())
+            write_namespace(namespace, (r for r in self.records(namespace) if r["id"] not in drop), root=self.root)
+        return {}
+
+
+_pinecone = PineconeStore()
+_local = LocalStore()
+
+
+def get_store(namespace):
+    if VECTOR_STORE_BACKEND == "local":
+        return _local
+    if namespace in VECTOR_STORE_LOCAL and _local.has_namespace(namespace):
+        return _local
+    return _pinecone
+
+
+def stats():
+    return {
+        "backend": VECTOR_STORE_BACKEND,
+        "hnsw": hnswlib is not None,
+        "local": {
+            name: len(ns.ids)
+            for name, (_, ns) in _local._namespaces.items()
+        },
+    }
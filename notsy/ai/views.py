@@ -1,11 +1,109 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from . import utils
+from django.http import StreamingHttpResponse, HttpResponse
+from . import utils, clients, embedding_cache, response_cache, budget, summaries, vectorstore, metrics, attachments, semantic_cache, scheduler
+from . import graph as topic_graph
+from . import ingest
+from .models import IngestJob
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import contextvars
+import logging
 import json
+import os
+
+logger = logging.getLogger(__name__)
+
+metrics.register_collector("clients", clients.stats)
+metrics.register_collector("embedding_cache", embedding_cache.stats)
+metrics.register_collector("response_cache", response_cache.stats)
+metrics.register_collector("summaries", summaries.stats)
+metrics.register_collector("attachments", attachments.stats)
+metrics.register_collector("semantic_cache", semantic_cache.stats)
+metrics.register_collector("scheduler", scheduler.stats)
 
 # client = utils.initialize_openai_client()
 
+# Per-mode chat settings, see the mode table in utils.py
+MODE_INSTRUCTIONS = {
+    "0": "",
+    "1": "Be very faithful to any documentation provided in the context if any.",
+    "2": "",
+    "3": "Help the user understand concepts and explore topics",
+    "4": "You are a teacher. Help user learn and prepare the concepts for a last minute exam.",
+    "5": "You are a teacher. Help the user understand the concepts clearly using the given context."
+}
+MODE_TEMPRATURES = {"1": 0.5, "2": 0.5, "3": 1.4}
+MODE_MAX_OUTPUT_TOKENS = {"4": 5000}
+
+NOTES_PROMPT = "make detailed Notes of the topic from the above conversation and retrived content. Be very detailed, length is important."
+FLASHCARDS_PROMPT = "Make Flash cards from the above conversation as well as the retrieved content. make meaningful flash cards that will help the student revise the topic and learn important facts and formulas for exam."
+QUIZ_PROMPT = "Make Quiz from the above conversation as well as the retrieved content. make meaningful quiz that will help the student practice the topic. It should be prograssively harder. Do not back if necessary, make sure the last part of the quiz is master level."
+STUDY_RAG_QUERY = "Key academic concepts"
+
+# study_pack/ artifacts: name -> (prompt, generator)
+STUDY_PACK = {
+    "notes": (NOTES_PROMPT, utils.noteGenerator),
+    "cards": (FLASHCARDS_PROMPT, utils.flashcardGenerator),
+    "quiz": (QUIZ_PROMPT, utils.quizGenerator),
+}
+STUDY_POOL = ThreadPoolExecutor(max_workers=int(os.getenv('STUDY_POOL_SIZE', 12)), thread_name_prefix="study")
+# Largest top_k querry/ accepts
+QUERY_MAX_TOP_K = int(os.getenv('QUERY_MAX_TOP_K', 50))
+
+def flag(data, key, default=False):
+    # JSON booleans as well as form/query strings like "false" or "0"
+    value = data.get(key, default)
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
+
+def parse_top_k(data, default=3):
+    # JSON clients may send top_k as a string; raises ValueError for anything that is not
+    # a whole number in 1..QUERY_MAX_TOP_K
+    value = data.get('top_k', default)
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError("top_k must be an integer.")
+    try:
+        top_k = int(value.strip() if isinstance(value, str) else value)
+    except (TypeError, ValueError):
+        raise ValueError("top_k must be an integer.")
+    if not 1 <= top_k <= QUERY_MAX_TOP_K:
+        raise ValueError(f"top_k must be between 1 and {QUERY_MAX_TOP_K}.")
+    return top_k
+
+def conversation_error(messages, summary):
+    if messages is None or summary is None:
+        return "No messages or summary provided."
+    if len(messages) % 2 != 0:
+        return "Odd number of messages. Every user message must be followed by assistant response."
+    return None
+
+def semantic_key(mode_id, instruction):
+    # Answers are only shared between requests that would be generated the same way
+    return semantic_cache.scope(
+        mode_id, instruction["content"], budget.CONTEXT_MODEL,
+        MODE_TEMPRATURES.get(mode_id), MODE_MAX_OUTPUT_TOKENS.get(mode_id),
+    )
+
+def assemble_context(summary, messages, **sections):
+    # The last two summaries cover the recent messages sent alongside them
+    summary = summary[:-2]
+    rolled, messages = summaries.rolling(messages, summary)
+    if rolled:
+        summary = [rolled]
+    summary = [
+        {"role": "user", "content": f"[SUMMARY #{i+1}] {summ}"} if isinstance(summ, str) else summ
+        for i, summ in enumerate(summary)
+    ]
+    return budget.assemble(summary=summary, history=messages, **sections)
+
+def attachment_sections(videos, pdf_entries, query):
+    # Only the passages of each attachment that are relevant to this turn's query
+    attached = [(f"[Video Transcript #{i}]", attachments.load_text(text)) for i, text in enumerate(videos)] + \
+        [(f"[PDF #{i}]", entry) for i, entry in enumerate(pdf_entries)]
+    return attachments.select(attached, query) if attached else []
+
 # Create your views here.
 
 class helloWorldView(APIView):
@@ -14,6 +112,28 @@ class helloWorldView(APIView):
     def post(self, request):
         return Response({"message": "Hello, Posted"}, status=status.HTTP_200_OK)
     
+class health(APIView):
+    def get(self, request):
+        checks = clients.health()
+        ok = all(check["ok"] for check in checks.values())
+        stats = {
+            "clients": clients.stats(),
+            "embedding_cache": embedding_cache.stats(),
+            "response_cache": response_cache.stats(),
+            "summaries": summaries.stats(),
+            "vectorstore": vectorstore.stats(),
+            "attachments": attachments.stats(),
+            "semantic_cache": semantic_cache.stats(),
+            "scheduler": scheduler.stats(),
+        }
+        return Response({"ok": ok, "checks": checks, "stats": stats},
+                        status=status.HTTP_200_OK if ok else status.HTTP_503_SERVICE_UNAVAILABLE)
+
+class prometheusMetrics(APIView):
+    # Prometheus scrape endpoint for this worker process
+    def get(self, request):
+        return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
 class respond(APIView):
     # Get from students RAG, Normal Response nothing else
     def post(self, request):
@@ -46,93 +166,147 @@ class respond(APIView):
         return Response({"message": response.output_text}, status=status.HTTP_200_OK)
 
 class augmentedRespond(APIView):
-    def post(self, request):
+    def prepare(self, request):
+        # Builds the prompt for the request, or returns an error Response
         messages = request.data.get('messages')
         summary = request.data.get('summary')
         user_query = request.data.get('user_query')
         topic_id = request.data.get('topicId')
         user_id = request.data.get('userId')
         mode_id = request.data.get('modeId',"0")
-        print(mode_id)
-        if messages is None or summary is None:
-            return Response({"error": "No messages or summary provided."}, status=status.HTTP_400_BAD_REQUEST)
-        if len(messages) % 2 != 0:
-            return Response({"error": "Odd number of messages. Every user message must be followed by assistant response."}, status=status.HTTP_400_BAD_REQUEST)
+        logger.info("augmentedRespond mode %s", mode_id)
+        error = conversation_error(messages, summary)
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
         if user_query is None:
             return Response({"error": "No user query provided."}, status=status.HTTP_400_BAD_REQUEST)
 
         messages = utils.clean_messages_for_gpt(messages)
 
         # Initialize context with instruction
-        instructions = {
-            "0": "",
-            "1": "Be very faithful to any documentation provided in the context if any.",
-            "2": "",
-            "3": "Help the user understand concepts and explore topics",
-            "4": "You are a teacher. Help user learn and prepare the concepts for a last minute exam.",
-            "5": "You are a teacher. Help the user understand the concepts clearly using the given context."
-        }
-
-        tempratures = {"1": 0.5, "2": 0.5, "3": 1.4}
-        max_output_tokens = {"4": 5000}
         instruction = {
             "role": "developer",
-            "content": instructions.get(mode_id, instructions["0"])
+            "content": MODE_INSTRUCTIONS.get(mode_id, MODE_INSTRUCTIONS["0"])
         }
 
-        context = [instruction]
-
-        # Append truncated summary
-        for i, summ in enumerate(summary[:-2]):
-            context.append(summ)
-
-        # Append last 20 messages
-        messages_trunc = messages[-20:]
-        for i in range(0, len(messages_trunc), 2):
-            context.append(messages_trunc[i])
-            context.append(messages_trunc[i+1])
-
         metadata = {}
+        semantic = None
+        if semantic_cache.eligible(mode_id, messages, summary):
+            try:
+                semantic = (semantic_key(mode_id, instruction), utils.embed_query(user_query))
+                cached = semantic_cache.lookup(*semantic)
+            except Exception as e:
+                logger.warning("Semantic cache lookup failed: %s", e)
+                semantic, cached = None, None
+            if cached is not None:
+                return {"cached": cached, "mode_id": mode_id, "metadata": metadata, "tokens": None}
+
+        rag_results = []
         try:
             # Query RAG
-            rag_results = utils.moded_query(user_query, mode=mode_id, user_id=user_id, topic_id=topic_id)
-            context += rag_results
+            rag_results = utils.moded_docs(user_query, mode=mode_id, user_id=user_id, topic_id=topic_id)
         except Exception as e:
-            print(f"RAG retrieval failed: {str(e)}")
-        
+            logger.warning("RAG retrieval failed: %s", e)
+
+        video_content = []
+        pdf_content = []
         if mode_id == "5":
             video_content = request.data.get('video',[])
-            pdf_content = []
             if 'pdf' in request.FILES:
                 pdf_files = request.FILES.getlist('pdf')
                 for pdf_file in pdf_files:
                     try:
-                        pdf_text = utils.get_pdf_text(pdf_file)
-                        pdf_content.append(pdf_text)
+                        pdf_content.append(attachments.load_pdf(pdf_file))
                     except Exception as e:
                         return Response({"error": f'Unable to process uploaded PDF: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            for i,vid_txt in enumerate(video_content):
-                context.append({"role": "user", "content": f"[Video Transcript #{i}] {vid_txt}"})
-            for i, pdf_txt in enumerate(pdf_content):
-                context.append({"role": "user", "content": f"[PDF #{i}] {pdf_txt}"})
 
-        # Add user query to the end
-        context.append({"role": "user", "content": user_query})
+        # Fit everything into the token budget, user query at the end
+        context, tokens = assemble_context(
+            summary, messages,
+            instruction=instruction,
+            rag=rag_results,
+            attachments=attachment_sections(video_content, pdf_content, user_query),
+            query={"role": "user", "content": user_query},
+        )
+
+        return {
+            "context": context,
+            "tokens": tokens,
+            "mode_id": mode_id,
+            "metadata": metadata,
+            "temprature": MODE_TEMPRATURES.get(mode_id, None),
+            "max_tokens": MODE_MAX_OUTPUT_TOKENS.get(mode_id, None),
+            "semantic": semantic,
+        }
 
-        temprature = tempratures.get(mode_id, None)
-        max_tokens = max_output_tokens.get(mode_id, None)
+    def post(self, request):
+        prepared = self.prepare(request)
+        if isinstance(prepared, Response):
+            return prepared
+        mode_id = prepared["mode_id"]
+        metadata = prepared["metadata"]
+        if "cached" in prepared:
+            return Response({"message": prepared["cached"], "metadata": metadata, "modeId": mode_id, "tokens": None, "cached": True}, status=status.HTTP_200_OK)
+        context = prepared["context"]
 
         try:
-            response = utils.get_response(context, max_tokens=max_tokens, temp=temprature)
+            response = utils.get_response(
+                context, max_tokens=prepared["max_tokens"], temp=prepared["temprature"], input_tokens=prepared["tokens"]["used"]
+            )
         except Exception as e:
             return Response({"error": f"Failed to get LLM response. Error: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        if prepared["semantic"]:
+            semantic_cache.store(*prepared["semantic"], response.output_text, response.usage)
 
         return Response({
             "message": response.output_text,
             "metadata": metadata,  # First matched metadata; optional to return more
-            "modeId": mode_id
+            "modeId": mode_id,
+            "tokens": prepared["tokens"],
         }, status=status.HTTP_200_OK)
 
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+class augmentedRespondStream(augmentedRespond):
+    # Same prompt as augmentedRespond, relayed to the client as server-sent events
+    def post(self, request):
+        prepared = self.prepare(request)
+        if isinstance(prepared, Response):
+            return prepared
+
+        def events():
+            if "cached" in prepared:
+                yield sse_event("delta", {"text": prepared["cached"]})
+                yield sse_event("done", {"modeId": prepared["mode_id"], "metadata": prepared["metadata"], "tokens": None, "usage": None, "cached": True})
+                return
+            try:
+                for event in utils.stream_response(
+                    prepared["context"], max_tokens=prepared["max_tokens"], temp=prepared["temprature"],
+                    input_tokens=prepared["tokens"]["used"],
+                ):
+                    if event.type == "response.output_text.delta":
+                        yield sse_event("delta", {"text": event.delta})
+                    elif event.type == "response.completed":
+                        usage = event.response.usage
+                        if prepared["semantic"]:
+                            semantic_cache.store(*prepared["semantic"], event.response.output_text, usage)
+                        yield sse_event("done", {
+                            "modeId": prepared["mode_id"],
+                            "metadata": prepared["metadata"],
+                            "tokens": prepared["tokens"],
+                            "usage": usage.model_dump() if usage else None,
+                        })
+                    elif event.type in ("response.failed", "error"):
+                        yield sse_event("error", {"error": "Failed to get LLM response."})
+            except Exception as e:
+                yield sse_event("error", {"error": f"Failed to get LLM response. Error: {str(e)}"})
+
+        response = StreamingHttpResponse(events(), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
 class makeNotes(APIView):
     def post(self, request):
         messages = request.data.get('messages')
@@ -140,35 +314,22 @@ class makeNotes(APIView):
         topic_id = request.data.get('topicId')
         user_id = request.data.get('userId')
 
-        if messages is None or summary is None:
-            return Response({"error": "No messages or summary provided."}, status=status.HTTP_400_BAD_REQUEST)
-        if len(messages) % 2 != 0:
-            return Response({"error": "Odd number of messages. Every user message must be followed by assistant response."}, status=status.HTTP_400_BAD_REQUEST)
+        error = conversation_error(messages, summary)
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
         
         messages = utils.clean_messages_for_gpt(messages)
-        context = []
-
-        for i, summ in enumerate(summary[:-2]):
-            context.append(summ)
-        # Append last 20 messages
-        messages_trunc = messages[-20:]
-        for i in range(0, len(messages_trunc) - 1, 2):
-            context.append(messages_trunc[i])
-            context.append(messages_trunc[i + 1])
-        mini_rag_results = utils.query("Key academic concepts", user_id, 5)
-        filtered_rag = [doc for doc in mini_rag_results if doc.get("metadata", {}).get("topic_id") == topic_id]
-        for j, doc in enumerate(filtered_rag):
-            content = doc.get("content", "")
-            context.append({"role": "system", "content": f"[RAG #{j+1}] {content}"})
-
-        context.append({"role": "user", "content": "make detailed Notes of the topic from the above conversation and retrived content. Be very detailed, length is important."})
+        mini_rag_results = utils.query(STUDY_RAG_QUERY, user_id, 5, filter=utils.topic_filter(user_id, topic_id))
+        context, tokens = assemble_context(
+            summary, messages, rag=mini_rag_results, query={"role": "user", "content": NOTES_PROMPT}
+        )
 
         try:
-            notes = utils.noteGenerator(context=context)
+            notes = utils.noteGenerator(context=context, cache=flag(request.data, 'cache'), input_tokens=tokens["used"])
         except Exception as e:
             return Response({"error": f'Unable to generate Notes, Error {str(e)}' }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        return Response({"message": notes}, status=status.HTTP_200_OK)
-    
+        return Response({"message": notes, "tokens": tokens}, status=status.HTTP_200_OK)
+
 class makeFlashCards(APIView):
     def post(self, request):
         messages = request.data.get('messages')
@@ -176,35 +337,22 @@ class makeFlashCards(APIView):
         topic_id = request.data.get('topicId')
         user_id = request.data.get('userId')
 
-        if messages is None or summary is None:
-            return Response({"error": "No messages or summary provided."}, status=status.HTTP_400_BAD_REQUEST)
-        if len(messages) % 2 != 0:
-            return Response({"error": "Odd number of messages. Every user message must be followed by assistant response."}, status=status.HTTP_400_BAD_REQUEST)
+        error = conversation_error(messages, summary)
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
         
         messages = utils.clean_messages_for_gpt(messages)
-        context = []
-
-        for i, summ in enumerate(summary[:-2]):
-            context.append(summ)
-        # Append last 20 messages
-        messages_trunc = messages[-20:]
-        for i in range(0, len(messages_trunc) - 1, 2):
-            context.append(messages_trunc[i])
-            context.append(messages_trunc[i + 1])
-        mini_rag_results = utils.query("Key academic concepts", user_id, 5)
-        filtered_rag = [doc for doc in mini_rag_results if doc.get("metadata", {}).get("topic_id") == topic_id]
-        for j, doc in enumerate(filtered_rag):
-            content = doc.get("content", "")
-            context.append({"role": "system", "content": f"[RAG #{j+1}] {content}"})
-
-        context.append({"role": "user", "content": "Make Flash cards from the above conversation as well as the retrieved content. make meaningful flash cards that will help the student revise the topic and learn important facts and formulas for exam."})
+        mini_rag_results = utils.query(STUDY_RAG_QUERY, user_id, 5, filter=utils.topic_filter(user_id, topic_id))
+        context, tokens = assemble_context(
+            summary, messages, rag=mini_rag_results, query={"role": "user", "content": FLASHCARDS_PROMPT}
+        )
 
         try:
-            notes = utils.flashcardGenerator(context=context)
+            notes = utils.flashcardGenerator(context=context, cache=flag(request.data, 'cache'), input_tokens=tokens["used"])
         except Exception as e:
             return Response({"error": f'Unable to generate Notes, Error {str(e)}' }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        return Response({"message": notes}, status=status.HTTP_200_OK)
-    
+        return Response({"message": notes, "tokens": tokens}, status=status.HTTP_200_OK)
+
 class makeQuizCards(APIView):
     def post(self, request):
         messages = request.data.get('messages')
@@ -212,36 +360,96 @@ class makeQuizCards(APIView):
         topic_id = request.data.get('topicId')
         user_id = request.data.get('userId')
 
-        if messages is None or summary is None:
-            return Response({"error": "No messages or summary provided."}, status=status.HTTP_400_BAD_REQUEST)
-        if len(messages) % 2 != 0:
-            return Response({"error": "Odd number of messages. Every user message must be followed by assistant response."}, status=status.HTTP_400_BAD_REQUEST)
+        error = conversation_error(messages, summary)
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
         
         messages = utils.clean_messages_for_gpt(messages)
-        context = []
+        mini_rag_results = utils.query(STUDY_RAG_QUERY, user_id, 5, filter=utils.topic_filter(user_id, topic_id))
+        context, tokens = assemble_context(
+            summary, messages, rag=mini_rag_results, query={"role": "user", "content": QUIZ_PROMPT}
+        )
 
-        for i, summ in enumerate(summary[:-2]):
-            context.append(summ)
-        # Append last 20 messages
-        messages_trunc = messages[-20:]
-        for i in range(0, len(messages_trunc) - 1, 2):
-            context.append(messages_trunc[i])
-            context.append(messages_trunc[i + 1])
-        mini_rag_results = utils.query("Key academic concepts", user_id, 5)
-        filtered_rag = [doc for doc in mini_rag_results if doc.get("metadata", {}).get("topic_id") == topic_id]
-        for j, doc in enumerate(filtered_rag):
-            content = doc.get("content", "")
-            context.append({"role": "system", "content": f"[RAG #{j+1}] {content}"})
+        try:
+            quiz = utils.quizGenerator(context=context, cache=flag(request.data, 'cache'), input_tokens=tokens["used"])
+        except Exception as e:
+            return Response({"error": f'Unable to generate Notes, Error {str(e)}' }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response({"message": quiz, "tokens": tokens}, status=status.HTTP_200_OK)
 
-        context.append({"role": "user", "content": "Make Quiz from the above conversation as well as the retrieved content. make meaningful quiz that will help the student practice the topic. It should be prograssively harder. Do not back if necessary, make sure the last part of the quiz is master level."})
+class studyPack(APIView):
+    # Notes, flash cards and quiz from one shared context, generated in parallel.
+    # Streams each artifact as a server-sent event as soon as it is ready ("stream": false
+    # waits for all of them); a failed artifact is reported without failing the others.
+    def post(self, request):
+        messages = request.data.get('messages')
+        summary = request.data.get('summary')
+        topic_id = request.data.get('topicId')
+        user_id = request.data.get('userId')
+        artifacts = request.data.get('artifacts') or list(STUDY_PACK)
+
+        error = conversation_error(messages, summary)
+        if error:
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+        unknown = [name for name in artifacts if name not in STUDY_PACK]
+        if unknown:
+            return Response({"error": f"Unknown artifacts: {', '.join(unknown)}"}, status=status.HTTP_400_BAD_REQUEST)
 
+        messages = utils.clean_messages_for_gpt(messages)
         try:
-            quiz = utils.quizGenerator(context=context)
+            mini_rag_results = utils.query(STUDY_RAG_QUERY, user_id, 5, filter=utils.topic_filter(user_id, topic_id))
         except Exception as e:
-            return Response({"error": f'Unable to generate Notes, Error {str(e)}' }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        return Response({"message": quiz}, status=status.HTTP_200_OK)
+            logger.warning("RAG retrieval failed: %s", e)
+            mini_rag_results = []
+        context, tokens = assemble_context(summary, messages, rag=mini_rag_results)
+        cache = flag(request.data, 'cache')
+
+        futures = {}
+        for name in artifacts:
+            prompt, generator = STUDY_PACK[name]
+            prompt = {"role": "user", "content": prompt}
+            # copy_context keeps the request id on the worker thread's log lines
+            futures[STUDY_POOL.submit(
+                contextvars.copy_context().run, generator,
+                context=context + [prompt], cache=cache, input_tokens=tokens["used"] + budget.message_tokens(prompt),
+            )] = name
+
+        def results():
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    yield name, {"message": future.result()}
+                except Exception as e:
+                    logger.warning("Study pack %s failed: %s", name, e)
+                    yield name, {"error": f'Unable to generate {name}, Error {str(e)}'}
+
+        if not flag(request.data, 'stream', True):
+            pack = dict(results())
+            failed = [name for name, result in pack.items() if "error" in result]
+            code = status.HTTP_500_INTERNAL_SERVER_ERROR if len(failed) == len(pack) else status.HTTP_200_OK
+            return Response({"artifacts": pack, "failed": failed, "tokens": tokens}, status=code)
+
+        def events():
+            failed = []
+            try:
+                for name, result in results():
+                    if "error" in result:
+                        failed.append(name)
+                        yield sse_event("error", {"artifact": name, **result})
+                    else:
+                        yield sse_event(name, result)
+                yield sse_event("done", {"failed": failed, "tokens": tokens})
+            finally:
+                # The client went away: artifacts still queued on the pool are not generated
+                for future in futures:
+                    future.cancel()
+
+        response = StreamingHttpResponse(events(), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
 
 class miniRag(APIView):
+    # Queues the upload for the ingest workers and returns its job id right away
     def post(self, request):
         data_type = request.data.get('type')
         source = request.data.get('source')
@@ -255,61 +463,44 @@ class miniRag(APIView):
 
         try:
             if data_type == 'pdf':
-                if 'pdf' not in request.FILES:
+                if not request.FILES.getlist('pdf'):
                     return Response({"error": "No PDF files found in request"}, status=status.HTTP_400_BAD_REQUEST)
-
-                pdf_files = request.FILES.getlist('pdf')
-                for pdf_file in pdf_files:
-                    try:
-                        pdf_text = utils.get_pdf_text(pdf_file)
-                        utils.upsert_text(
-                            text=pdf_text,
-                            namespace=userId,
-                            metadata={
-                                "text": pdf_text[:500],
-                                "filename": pdf_file.name,
-                                "url": pdf_file.name,
-                                "topic_id": topicId,
-                                "user_id": userId                            }
-                        )
-                    except Exception as e:
-                        return Response({"error": f'Unable to Upsert uploaded PDF: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                job = ingest.enqueue_pdfs(userId, topicId, request.FILES.getlist('pdf'))
 
             elif data_type == 'video':
-                if source is None or content is None:
+                if not source or not content:
                     return Response({"error": "Missing source/content for video"}, status=status.HTTP_400_BAD_REQUEST)
                 if len(source) != len(content):
                     return Response({"error": f"Length of source and content must be same for {data_type}"}, status=status.HTTP_400_BAD_REQUEST)
-                for i in range(len(source)):
-                    video_text = content[i]
-                    try:
-                        utils.upsert_text(
-                            text=video_text,
-                            namespace=userId,
-                            metadata={
-                                "text": video_text,
-                                "url": source[i],
-                                "topic_id": topicId,
-                                "user_id": userId
-                            }
-                        )
-                    except Exception as e:
-                        return Response({"error": f'Unable to Upsert video, Error: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                job = ingest.enqueue_videos(userId, topicId, source, content)
             else:
                 return Response({"error": "Invalid type provided"}, status=status.HTTP_400_BAD_REQUEST)
 
         except Exception as e:
             return Response({"error": f'Python unable to process {data_type},\nError {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        return Response({"message": f"Successfully saved {data_type} to vector-db"}, status=status.HTTP_200_OK)
+        return Response({
+            "message": f"Queued {data_type} for saving to vector-db",
+            "jobId": str(job.id),
+        }, status=status.HTTP_202_ACCEPTED)
+
+class ingestStatus(APIView):
+    def get(self, request, job_id):
+        job = IngestJob.objects.filter(pk=job_id).first()
+        if job is None:
+            return Response({"error": "Job not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(ingest.job_status(job), status=status.HTTP_200_OK)
     
 class query(APIView):
     def post(self, request):
         text = request.data.get('text')
         namespace = request.data.get('namespace')
-        top_k = request.data.get('top_k', 3)
         if text is None or namespace is None:
             return Response({"error": "No text or namespace provided"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            top_k = parse_top_k(request.data)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         try:
             result = utils.query(text, namespace, top_k)
             return Response(result, status=status.HTTP_200_OK)
@@ -337,54 +528,11 @@ class grapher(APIView):
         #     16: "Divide and Conquer",17: "Trie",18: "Segment Trees",19: "AVL Trees",20: "Red-Black Trees",21: "B-Trees",
         #     22: "NP-Completeness",23: "Sliding Window Technique",24: "Two Pointers Technique"
         #     }
-        client = utils.initialize_openai_client()
-        message = f"topics = {str(topics)}"
         try:
-            response = client.responses.create(
-                model="gpt-4o",
-                temperature=0.0,
-                input=[
-                    {
-                        "role": "system",
-                        "content": (
-                            "You are an educational assistant. Your job is to organize the user's notes into a graph structure. "
-                            "You will receive topic names and their indices. You must return a labeled adjacency list: "
-                            "each topic's index should map to a list of objects representing related topics. "
-                            "Each object must include the related topic index as `target` and a short explanation `reason` (1-5 words) for the connection."
-                        )
-                    },
-                    {"role": "user", "content": message}
-                ],
-                text={
-                    "format": {
-                        "type": "json_schema",
-                        "name": "labeled_notes_graph",
-                        "schema": {
-                            "type": "object",
-                            "properties": {
-                                str(k): {
-                                    "type": "array",
-                                    "items": {
-                                        "type": "object",
-                                        "properties": {
-                                            "target": {"type": "string"},
-                                            "reason": {"type": "string"}
-                                        },
-                                        "required": ["target", "reason"],
-                                        "additionalProperties": False
-                                    }
-                                } for k in topics.keys()
-                            },
-                            "required": list(map(str, topics.keys())),
-                            "additionalProperties": False
-                        },
-                        "strict": True
-                    }
-                }
-            )
+            graph = topic_graph.build_graph(topics)
         except Exception as e:
             return Response({"error": f'Failed to get response,\nError {str(e)}' }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        return Response(json.loads(response.output_text), status=status.HTTP_200_OK)
+        return Response(graph, status=status.HTTP_200_OK)
 
 class addNode(APIView):
     def post(self, request):
@@ -401,77 +549,16 @@ class addNode(APIView):
         if node_id is None or label is None:
             return Response({"error": "Invalid newNode format"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Format prompt for GPT
-        client = utils.initialize_openai_client()
-        prompt = (
-            f"You are expanding a topic graph. A new topic '{label}' (ID: {node_id}) has been added.\n"
-            f"Here are the existing topics:\n"
-            f"{json.dumps(topic_labels, indent=4)}\n"
-            f"{json.dumps(old_graph, indent=4)}\nold graph for reference\n"
-            f"Based on their meanings, return a list of nodes this new topic is connected to, along with a short explanation `reason` (1-5 words) for the connection."
-        )
-
+        # Only the most similar existing topics are sent to GPT
         try:
-            response = client.responses.create(
-                model="gpt-4o",
-                temperature=0.0,
-                input=prompt,
-                text={
-                    "format": {
-                        "type": "json_schema",
-                        "name": "labeled_notes_graph",
-                        "schema": {
-                            "type": "object",
-                            "properties": {
-                                str(node_id): {
-                                    "type": "array",
-                                    "items": {
-                                        "type": "object",
-                                        "properties": {
-                                            "target": {"type": "string"},
-                                            "reason": {"type": "string"}
-                                        },
-                                        "required": ["target", "reason"],
-                                        "additionalProperties": False
-                                    }
-                                }
-                            },
-                            "required": [str(node_id)],
-                            "additionalProperties": False
-                        },
-                        "strict": True
-                    }
-                }
-            )
+            edges = topic_graph.connect_node(node_id, label, topic_labels, old_graph)
+        except json.JSONDecodeError as e:
+            return Response({"error": f"Error parsing GPT response: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         except Exception as e:
             return Response({"error": f"Failed to get response,\nError: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-        try:
-            edges = json.loads(response.output_text)
-        except Exception as e:
-            return Response({"error": f"Error parsing GPT response: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
         node_id_str = str(node_id)
-        if node_id_str not in old_graph:
-            old_graph[node_id_str] = []
-
-        # Loop over edges specific to this node
-        for edge in edges.get(node_id_str, []):
-            target_id = str(edge["target"])
-            reason = edge["reason"]
-
-            old_graph[node_id_str].append({
-                "target": int(target_id),
-                "reason": reason
-            })
-
-            if target_id not in old_graph:
-                old_graph[target_id] = []
-
-            old_graph[target_id].append({
-                "target": int(node_id),
-                "reason": reason
-            })
+        utils.merge_node_edges(old_graph, node_id, edges)
 
         return Response({
             "message": f"Node '{label}' added and connected with labeled bidirectional edges.",
@@ -0,0 +1,17 @@
+import django
+import pytest
+import os
+
+# Lets plain pytest run the Django tests under ai/tests, as manage.py test does
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+django.setup()
+
+
+@pytest.fixture(scope="session", autouse=True)
+def django_test_databases():
+    from django.test.utils import setup_test_environment, teardown_test_environment, setup_databases, teardown_databases
+    setup_test_environment()
+    config = setup_databases(verbosity=0, interactive=False)
+    yield
+    teardown_databases(config, verbosity=0)
+    teardown_test_environment()